@@ -1,66 +1,677 @@
+"""Throughput and peak memory of opus_read, opus_cat, opus_langid, the
+parsers and the database queries of opus_get on a generated corpus, and
+the startup time of the commands.
+
+The corpus has the OPUS download names (Synth_latest_xml_en-fi.xml.gz,
+Synth_latest_{xml,raw,parsed}_{en,fi}.zip), so the commands read it like
+a downloaded corpus and no network access is needed. Every nth link of
+the alignment file is a many-to-many (2-1, 1-2, 2-2), or an empty (1-0,
+0-1) link. The alignment file is also written as plain text, bz2, xz and,
+if zstandard is installed, zstd, and the raw zip files with zstd
+compressed members. Each case runs in its own process, so that the peak
+resident set size (ru_maxrss) of the case, and of the processes it
+starts, is measured.
+
+The startup cases run the imports of each command in a fresh interpreter
+with python -X importtime and report the time spent importing opustools
+and the modules it pulls in, and the wall time of running the command
+with --help. Short opus_read runs from job arrays pay this on every
+invocation.
+
+The results are written as json. Compare two result files with
+
+    python benchmarks.py --compare old.json new.json
+
+which lists the changes of each case and exits with status 1 if the
+throughput of a case has dropped, or its peak memory has grown, by more
+than the tolerance.
+"""
+
+import argparse
+import contextlib
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
 import time
+import traceback
+import zipfile
+import zlib
+
 import opustools
-import cProfile
-
-print(opustools.__path__)
-
-from opustools import OpusRead
-
-def printResults(**arguments):
-    avg_time = 0
-    for i in range(3):
-        start = time.time()
-        eprinter = OpusRead(**arguments)
-        eprinter.printPairs()
-        #cProfile.runctx('eprinter.printPairs()', globals=globals(), locals=locals())
-        end = time.time()
-        total_time = end-start
-        avg_time += total_time
-        print("%.4f" % float(total_time), "s")
-    print("%.4f" % (avg_time/3), 's')
-
-print("Corpus: Books, 3654 alignment pairs, source: en, target: fi, all alignments ")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fi', write=['books_en_fi'], write_mode='moses')
-
-print("Corpus: Books, 129305 alignment pairs, source: en, target: fr, all alignments")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fr', write=['books_en_fr'], write_mode='moses')
-
-print("Corpus: Books, 3654 alignment pairs, source: en, target: fi, 10 alignments")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fi', write=['books_en_fi_10'], maximum=10)
-
-print("Corpus: Books, 129305 alignment pairs, source: en, target: fr, 10 alignments")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fr', write=['books_en_fr_10'], maximum=10)
-
-print("Corpus: Books, 3654 alignment pairs, source: en, target: fi, all alignments, preprocessing raw")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fi', write=['books_en_fi_raw'], write_mode='moses', preprocess='raw')
-
-print("Corpus: Books, 129305 alignment pairs, source: en, target: fr, all alignments, preprocessing raw")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fr', write='books_en_fr_raw', write_mode='moses', preprocess='raw')
-
-print("Corpus: Books, 3654 alignment pairs, source: en, target: fi, 10 alignments, preprocessing raw")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fi', write=['books_en_fi_raw_10'], write_mode='moses', preprocess='raw', maximum=10)
-
-print("Corpus: Books, 129305 alignment pairs, source: en, target: fr, 10 alignments, preprocessing raw")
-print("Exhaustive parser:")
-printResults(directory='Books', source='en', target='fr', write=['books_en_fr_raw_10'], write_mode='moses', preprocess='raw', maximum=10)
-
-print("Corpus: Europarl, 1974717 alignment pairs, source: en, target: fi, all alignments, preprocessing raw")
-print("Exhaustive parser:")
-printResults(directory='Europarl', source='en', target='fi', write=['europarl_en_fi_raw'], write_mode='moses', release='v7', preprocess='raw')
-
-print("Corpus: Europarl, 1974717 alignment pairs, source: en, target: fi, all alignments ")
-print("Exhaustive parser:")
-printResults(directory='Europarl', source='en', target='fi', write=['europarl_en_fi'], write_mode='moses', release='v7')
-
-print("Corpus: Tatoeba, 383 alignment pairs, source: br, target: en, all alignments, preprocessing raw")
-printResults(directory='Tatoeba', source='br', target='en', write=['tatoeba_br_en_raw'], write_mode='moses', preprocess='raw')
-
-print("Corpus: Tatoeba, 383 alignment pairs, source: br, target: en, all alignments, preprocessing xml")
-printResults(directory='Tatoeba', source='br', target='en', write=['tatoeba_br_en'], write_mode='moses')
+from opustools import OpusRead, OpusCat, DbOperations
+from opustools.parse.alignment_parser import AlignmentParser
+from opustools.parse.block_parser import BlockParser
+from opustools.parse.sentence_parser import SentenceParser
+from opustools.readopusdata import create_table
+from opustools.util import file_open, ZIP_ZSTANDARD
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'opustools_pkg', 'bin')
+COMMANDS = {
+    'opus_read': 'from opustools import OpusRead',
+    'opus_cat': 'from opustools import OpusCat',
+    'opus_get': 'from opustools import OpusGet',
+    'opus_langid': 'from opustools.opus_langid import OpusLangid',
+    }
+
+CORPUS = 'Synth'
+PREPROCESSINGS = ['xml', 'raw', 'parsed']
+# Source and target sentences of the many-to-many and empty links, in turn
+PATTERNS = [(2, 1), (1, 2), (2, 2), (1, 0), (0, 1)]
+
+WORDS = {
+    'en': ('the of and to in is was that for it with as his on be at by '
+        'had not are but from have they you all were there one which an '
+        'she would her when what their said house morning letter window '
+        'street friend evening question answer').split(),
+    'fi': ('ja on ei se että hän oli mutta kun niin kuin jo nyt vain '
+        'sitten myös minä sinä me te he talo aamu kirje ikkuna katu '
+        'ystävä ilta kysymys vastaus koira kissa metsä järvi kaupunki '
+        'päivä yö').split(),
+    }
+
+
+def make_links(sentences, many_to_many):
+    """Return the links of a document with the given number of source
+    sentences as (source ids, target ids), and the number of target
+    sentences"""
+    links, source, target = [], 0, 0
+    while source < sentences:
+        i = len(links) + 1
+        src_n, trg_n = 1, 1
+        if many_to_many and i % many_to_many == 0:
+            src_n, trg_n = PATTERNS[(i//many_to_many-1) % len(PATTERNS)]
+        src_n = min(src_n, sentences-source)
+        links.append((list(range(source+1, source+src_n+1)),
+            list(range(target+1, target+trg_n+1))))
+        source += src_n
+        target += trg_n
+    return links, target
+
+
+def write_alignment(path, documents, links):
+    with file_open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<!DOCTYPE cesAlign PUBLIC "-//CES//DTD XML cesAlign//EN" "">\n'
+            '<cesAlign version="1.0">\n')
+        for d in range(documents):
+            f.write(f'<linkGrp targType="s" fromDoc="en/doc{d}.xml.gz" '
+                f'toDoc="fi/doc{d}.xml.gz" >\n')
+            for i, (src_ids, trg_ids) in enumerate(links):
+                src = ' '.join(f's{s}' for s in src_ids)
+                trg = ' '.join(f's{t}' for t in trg_ids)
+                f.write(f'<link xtargets="{src};{trg}" id="SL{i+1}" '
+                    'certainty="0.5" />\n')
+            f.write('</linkGrp>\n')
+        f.write('</cesAlign>\n')
+
+
+def format_sentence(i, words, preprocessing):
+    if preprocessing == 'raw':
+        return f'  <s id="s{i}">{" ".join(words)}</s>\n'
+    lines = [f'  <s id="s{i}">\n']
+    for j, word in enumerate(words, 1):
+        if preprocessing == 'parsed':
+            deprel = 'root' if j == 1 else 'dep'
+            lines.append(f'    <w upos="X" lemma="{word.lower()}" '
+                f'feats="_" head="{1 if j > 1 else 0}" deprel="{deprel}" '
+                f'id="w{i}.{j}">{word}</w>\n')
+        else:
+            lines.append(f'    <w id="w{i}.{j}">{word}</w>\n')
+    lines.append('  </s>\n')
+    return ''.join(lines)
+
+
+def write_documents(directory, language, documents, sentences):
+    """Write the sentence zip files of a language in all preprocessings"""
+    zips = {preprocessing: zipfile.ZipFile(os.path.join(directory,
+            f'{CORPUS}_latest_{preprocessing}_{language}.zip'), 'w',
+            compression=zipfile.ZIP_DEFLATED)
+        for preprocessing in PREPROCESSINGS}
+    for d in range(documents):
+        texts = [random.choices(WORDS[language], k=random.randint(4, 20))
+            for i in range(sentences)]
+        for preprocessing, zf in zips.items():
+            lines = ['<?xml version="1.0" encoding="utf-8"?>\n<text>\n']
+            for i, words in enumerate(texts, 1):
+                words = [words[0].capitalize()] + words[1:] + ['.']
+                lines.append(format_sentence(i, words, preprocessing))
+            lines.append('</text>\n')
+            zf.writestr(f'{CORPUS}/{preprocessing}/{language}/doc{d}.xml',
+                ''.join(lines))
+    for zf in zips.values():
+        zf.close()
+
+
+def make_corpus(directory, documents, sentences, many_to_many):
+    """Write the corpus and return the number of links and of source and
+    target sentences"""
+    random.seed(1)
+    links, target_sentences = make_links(sentences, many_to_many)
+    write_alignment(os.path.join(directory,
+        f'{CORPUS}_latest_xml_en-fi.xml.gz'), documents, links)
+    write_documents(directory, 'en', documents, sentences)
+    write_documents(directory, 'fi', documents, target_sentences)
+    return (documents*len(links), documents*sentences,
+        documents*target_sentences)
+
+
+def write_alignment_copies(directory):
+    """Write the alignment file as plain text, bz2, xz and zstd and return
+    the extensions"""
+    extensions = ['', '.bz2', '.xz']
+    if zstandard is not None:
+        extensions.append('.zst')
+    name = os.path.join(directory, f'{CORPUS}_latest_xml_en-fi.xml')
+    with file_open(name+'.gz', 'rb') as f:
+        data = f.read()
+    for extension in extensions:
+        with file_open(name+extension, 'wb') as f:
+            f.write(data)
+    return extensions + ['.gz']
+
+
+def write_zstd_zip(source, path):
+    """Write the members of a zip file compressed with zstd"""
+    compressor = zstandard.ZstdCompressor()
+    with zipfile.ZipFile(source) as zf:
+        members = [(name, zf.read(name)) for name in zf.namelist()]
+    # Store the compressed members and change the compression method to
+    # zstd in the local headers and the central directory
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in members:
+            zf.writestr(name, compressor.compress(data))
+        offsets = [info.header_offset for info in zf.infolist()]
+    with open(path, 'r+b') as f:
+        raw = bytearray(f.read())
+        central = 0
+        for (name, data), offset in zip(members, offsets):
+            crc = zlib.crc32(data)
+            struct.pack_into('<H', raw, offset+8, ZIP_ZSTANDARD)
+            struct.pack_into('<I', raw, offset+14, crc)
+            struct.pack_into('<I', raw, offset+22, len(data))
+            central = raw.index(b'PK\x01\x02', central+1)
+            struct.pack_into('<H', raw, central+10, ZIP_ZSTANDARD)
+            struct.pack_into('<I', raw, central+16, crc)
+            struct.pack_into('<I', raw, central+24, len(data))
+        f.seek(0)
+        f.write(raw)
+
+
+def make_database(path, corpora, languages):
+    """Write a database with the opusfile schema of readopusdata"""
+    random.seed(1)
+    names = ['l{:03d}'.format(i) for i in range(languages)]
+    rows = []
+    for c in range(corpora):
+        corpus = f'Corpus{c}'
+        corpus_languages = sorted(random.sample(names,
+            random.randint(2, min(15, languages))))
+        for version, latest in [('v1', 'False'), ('v2', 'True')]:
+            for language in corpus_languages:
+                for preprocessing in ['xml', 'raw', 'parsed', 'mono']:
+                    rows.append((language, '', corpus, preprocessing,
+                        version, f'{corpus}/{version}/{preprocessing}/'
+                        f'{language}.zip', random.randint(1, 10**6),
+                        latest))
+            for i, source in enumerate(corpus_languages):
+                for target in corpus_languages[i+1:]:
+                    for preprocessing in ['xml', 'moses', 'tmx']:
+                        rows.append((source, target, corpus, preprocessing,
+                            version, f'{corpus}/{version}/{preprocessing}/'
+                            f'{source}-{target}.zip',
+                            random.randint(1, 10**6), latest))
+    conn = sqlite3.connect(path)
+    create_table(conn.cursor())
+    conn.executemany('INSERT INTO opusfile (source, target, corpus, '
+        'preprocessing, version, url, size, latest) VALUES '
+        '(?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return names, len(rows)
+
+
+def opus_read(data_dir, output, **arguments):
+    # Writing to a file shows the progress on stderr
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stderr(devnull):
+            OpusRead(directory=CORPUS, source='en', target='fi',
+                download_dir=data_dir, write=[output],
+                suppress_prompts=True, **arguments).printPairs()
+
+
+def opus_cat(data_dir, **arguments):
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            OpusCat(directory=CORPUS, language='en', download_dir=data_dir,
+                **arguments).printSentences()
+
+
+def opus_langid(data_dir, output, **arguments):
+    from opustools.opus_langid import OpusLangid
+    OpusLangid(file_path=os.path.join(data_dir,
+        f'{CORPUS}_latest_raw_en.zip'), target_file_path=output,
+        **arguments).processFiles()
+
+
+def load_langid_model():
+    # Loaded before the timings, like in a long opus_langid run
+    from opustools.opus_langid import get_batch_identifier
+    get_batch_identifier()
+
+
+def read_sentences(data_dir):
+    """Load the langid.py model and return the raw source sentences as
+    (sentence, id) pairs"""
+    load_langid_model()
+    pairs = []
+    with zipfile.ZipFile(os.path.join(data_dir,
+            f'{CORPUS}_latest_raw_en.zip')) as zf:
+        for name in zf.namelist():
+            text = zf.read(name).decode('utf-8')
+            pairs += [(sentence, sid) for sid, sentence in
+                re.findall(r'<s id="([^"]*)">([^<]*)</s>', text)]
+    return {'pairs': pairs}
+
+
+def langid_per_sentence(pairs):
+    from opustools.opus_langid import detect_language
+    for sentence, sid in pairs:
+        detect_language(sentence, sid, True)
+
+
+def langid_batched(pairs):
+    from opustools.opus_langid import detect_languages
+    detect_languages(pairs, True)
+
+
+def parse_alignment(path, memory_map):
+    with file_open(path, memory_map=memory_map) as f:
+        parser = AlignmentParser(f)
+        cur_pos = 0
+        while True:
+            link_list, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                parser.collect_links(cur_pos)
+            if not src_doc:
+                break
+        parser.close_document()
+
+
+def parse_blocks(path):
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            bp = BlockParser(zf.open(name), data_tag='w')
+            blocks, cur_pos = bp.get_complete_blocks(0)
+            while blocks:
+                blocks, cur_pos = bp.get_complete_blocks(cur_pos)
+            bp.close_document()
+
+
+def store_sentences(path, sentences):
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            sp = SentenceParser(zf.open(name), preprocessing='parsed',
+                    anno_attrs=['upos', 'lemma'])
+            sp.store_sentences({f's{i}' for i in range(1, sentences+1)}, -1)
+
+
+def import_times(statement):
+    """Return the top level modules imported by a statement with their
+    cumulative import time in microseconds, from python -X importtime"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+        statement], stderr=subprocess.PIPE, text=True, check=True).stderr
+    top = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '):
+            top[name.strip()] = int(cumulative)
+    return top
+
+
+def import_time(statement):
+    """Return the seconds spent importing the modules of a statement that
+    the interpreter does not import at startup anyway"""
+    startup = import_times('pass')
+    top = import_times(statement)
+    return sum(cumulative for name, cumulative in top.items()
+        if name not in startup) / 1000000
+
+
+def command_help(command):
+    subprocess.run([sys.executable, os.path.join(BIN, command), '-h'],
+        stdout=subprocess.DEVNULL, check=True)
+
+
+def db_queries(database, method, parameters, lookups):
+    dbo = DbOperations(db_file=database)
+    for i in range(lookups):
+        getattr(dbo, method)(dict(parameters))
+    dbo.close()
+
+
+def opus_get_list(database, download_dir, lookups, **arguments):
+    from opustools import OpusGet
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            for i in range(lookups):
+                OpusGet(local_db=True, database=database,
+                    download_dir=download_dir, list_resources=True,
+                    **arguments).get_files()
+
+
+def get_cases(args, sizes, data_dir, output_dir, database, languages,
+        extensions):
+    """Return the cases as (name, function, arguments, setup, unit,
+    count). Functions that measure their own time return it."""
+    links, sentences, target_sentences = sizes
+    cases = []
+
+    def read(name, count=links, **arguments):
+        output = os.path.join(output_dir, name.replace(' ', '_'))
+        cases.append((f'opus_read {name}', opus_read,
+            dict(data_dir=data_dir, output=output, **arguments), None,
+            'links', count))
+
+    for mode in ['normal', 'moses', 'tmx', 'links']:
+        read(f'xml {mode}', write_mode=mode)
+    read('xml moses pipeline', write_mode='moses', pipeline=True)
+    read('xml moses workers', write_mode='moses', workers=2)
+    read('xml moses maximum', count=min(links, 100), write_mode='moses',
+        maximum=100)
+    read('xml moses gz', write_mode='moses', output_suffix='.gz')
+    for mode in ['normal', 'moses', 'tmx']:
+        read(f'raw {mode}', write_mode=mode, preprocess='raw')
+    read('parsed moses', write_mode='moses', preprocess='parsed')
+    read('parsed moses annotations', write_mode='moses',
+        preprocess='parsed', print_annotations=True,
+        source_annotations=['upos', 'lemma'],
+        target_annotations=['upos', 'lemma'])
+    alignment = os.path.join(data_dir, f'{CORPUS}_latest_xml_en-fi.xml')
+    # OpusRead memory-maps plain alignment files
+    for extension in extensions:
+        if extension != '.gz':
+            read(f'raw moses alignment {extension[1:] or "plain"}',
+                write_mode='moses', preprocess='raw',
+                alignment_file=alignment+extension)
+    if zstandard is not None:
+        read('raw moses zstd zip', write_mode='moses', preprocess='raw',
+            source_zip=os.path.join(data_dir, 'zstd_en.zip'),
+            target_zip=os.path.join(data_dir, 'zstd_fi.zip'))
+
+    for extension in extensions:
+        cases.append((f'alignment parser {extension[1:] or "plain"}',
+            parse_alignment, dict(path=alignment+extension,
+                memory_map=False), None, 'links', links))
+    cases.append(('alignment parser plain memory map', parse_alignment,
+        dict(path=alignment, memory_map=True), None, 'links', links))
+    parsed = os.path.join(data_dir, f'{CORPUS}_latest_parsed_en.zip')
+    cases.append(('block parser parsed', parse_blocks, dict(path=parsed),
+        None, 'sentences', sentences))
+    cases.append(('sentence parser parsed', store_sentences,
+        dict(path=parsed, sentences=args.sentences), None, 'sentences',
+        sentences))
+
+    for preprocessing in ['xml', 'raw', 'parsed']:
+        cases.append((f'opus_cat {preprocessing}', opus_cat,
+            dict(data_dir=data_dir, preprocess=preprocessing), None,
+            'sentences', sentences))
+    cases.append(('opus_cat xml plain', opus_cat,
+        dict(data_dir=data_dir, preprocess='xml', plain=True), None,
+        'sentences', sentences))
+
+    try:
+        import langid, pycld2
+    except ImportError:
+        print('langid or pycld2 is not installed, skipping opus_langid',
+            file=sys.stderr)
+    else:
+        cases.append(('opus_langid raw', opus_langid,
+            dict(data_dir=data_dir, output=os.path.join(output_dir,
+                'langid.zip'), preprocess='raw'),
+            load_langid_model, 'sentences', sentences))
+        setup = functools.partial(read_sentences, data_dir)
+        cases.append(('langid per sentence', langid_per_sentence, {},
+            setup, 'sentences', sentences))
+        cases.append(('langid batched', langid_batched, {}, setup,
+            'sentences', sentences))
+
+    source, target = languages[len(languages)//3], languages[len(languages)//2]
+    for name, method, parameters in [
+            ('source target', 'get_corpora',
+                {'source': source, 'target': target, 'version': 'latest'}),
+            ('source raw', 'get_corpora',
+                {'source': source, 'preprocessing': 'raw',
+                    'version': 'latest'}),
+            ('languages', 'run_languages_query', {'source': source}),
+            ('corpora', 'run_corpora_query',
+                {'source': source, 'target': target})]:
+        cases.append((f'db {name}', db_queries,
+            dict(database=database, method=method, parameters=parameters,
+                lookups=args.lookups), None, 'lookups', args.lookups))
+    cases.append(('opus_get -l local db', opus_get_list,
+        dict(database=database, download_dir=output_dir,
+            lookups=args.lookups, source=source, target=target), None,
+        'lookups', args.lookups))
+
+    for command, statement in COMMANDS.items():
+        cases.append((f'startup {command} import', import_time,
+            dict(statement=statement), None, 'runs', 1))
+        cases.append((f'startup {command} -h', command_help,
+            dict(command=command), None, 'runs', 1))
+
+    if args.cases:
+        cases = [case for case in cases if re.search(args.cases, case[0])]
+    return cases
+
+
+def run_case(function, arguments, setup, repeats, queue):
+    try:
+        queue.put(time_case(function, arguments, setup, repeats))
+    except BaseException:
+        # The traceback as text, as exceptions may not be picklable
+        queue.put(traceback.format_exc())
+        raise
+
+
+def time_case(function, arguments, setup, repeats):
+    if setup:
+        arguments = dict(arguments, **(setup() or {}))
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        elapsed = function(**arguments)
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+        times.append(elapsed)
+    return (times, base_rss,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def measure(context, case, repeats):
+    name, function, arguments, setup, unit, count = case
+    arguments = dict(arguments)
+    suffix = arguments.pop('output_suffix', None)
+    if suffix:
+        arguments['output'] += suffix
+    queue = context.Queue()
+    process = context.Process(target=run_case,
+            args=(function, arguments, setup, repeats, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if isinstance(result, str):
+        raise RuntimeError(f'Case "{name}" failed:\n{result}')
+    times, base_rss, max_rss, children_rss = result
+    seconds = min(times)
+    # The peak of the processes that the case starts, such as workers
+    # and the interpreters of the startup cases, is reported separately
+    return {'seconds': seconds, 'times': times, 'unit': unit,
+        'count': count, 'throughput': count/seconds,
+        'base_rss_mb': base_rss/1024, 'peak_rss_mb': max_rss/1024,
+        'children_peak_rss_mb': children_rss/1024}
+
+
+def environment():
+    return {'opustools': opustools.__path__[0],
+        'python': platform.python_version(),
+        'platform': platform.platform(), 'processor': platform.machine(),
+        'cpus': os.cpu_count(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def run(args):
+    tempdir = tempfile.mkdtemp()
+    data_dir = os.path.join(tempdir, 'data')
+    output_dir = os.path.join(tempdir, 'output')
+    os.mkdir(data_dir)
+    os.mkdir(output_dir)
+    try:
+        sizes = make_corpus(data_dir, args.documents, args.sentences,
+            args.many_to_many)
+        database = os.path.join(data_dir, 'opusdata.db')
+        languages, rows = make_database(database, args.corpora,
+            args.languages)
+        extensions = write_alignment_copies(data_dir)
+        if zstandard is not None:
+            for language in ['en', 'fi']:
+                write_zstd_zip(os.path.join(data_dir,
+                    f'{CORPUS}_latest_raw_{language}.zip'),
+                    os.path.join(data_dir, f'zstd_{language}.zip'))
+        else:
+            print('zstandard is not installed, skipping zstd',
+                file=sys.stderr)
+        print(f'{args.documents} documents, {sizes[0]} links, {sizes[1]} '
+            f'source and {sizes[2]} target sentences, {rows} database '
+            f'rows, best of {args.repeats} runs', file=sys.stderr)
+        # Fresh interpreters, so that the peak memory of a case does not
+        # include the memory of generating the corpus
+        context = multiprocessing.get_context('spawn')
+        results = {}
+        for case in get_cases(args, sizes, data_dir, output_dir, database,
+                languages, extensions):
+            result = measure(context, case, args.repeats)
+            results[case[0]] = result
+            children = ''
+            if result['children_peak_rss_mb']:
+                children = (f", {result['children_peak_rss_mb']:.1f} MB "
+                    "in child processes")
+            print(f"{case[0]}: {result['seconds']:.4f} s, "
+                f"{result['throughput']:.0f} {result['unit']}/s, "
+                f"{result['peak_rss_mb']:.1f} MB peak RSS{children}",
+                file=sys.stderr)
+    finally:
+        shutil.rmtree(tempdir)
+    parameters = {key: getattr(args, key) for key in ['documents',
+        'sentences', 'many_to_many', 'corpora', 'languages', 'lookups',
+        'repeats']}
+    report = {'environment': environment(), 'parameters': parameters,
+        'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+def compare(old_file, new_file, tolerance):
+    """Print the changes of each case between two result files and return
+    the number of regressions"""
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    if old['parameters'] != new['parameters']:
+        print('Warning: the runs have different parameters: '
+            f"{old['parameters']} and {new['parameters']}")
+    regressions = 0
+    for name, result in new['results'].items():
+        base = old['results'].get(name)
+        if base is None:
+            print(f'{name}: new case')
+            continue
+        speed = result['throughput'] / base['throughput'] - 1
+        memory = result['peak_rss_mb'] / base['peak_rss_mb'] - 1
+        children = 0
+        if base.get('children_peak_rss_mb'):
+            children = result.get('children_peak_rss_mb', 0) / \
+                base['children_peak_rss_mb'] - 1
+        flags = []
+        if speed < -tolerance:
+            flags.append('SLOWER')
+        if memory > tolerance or children > tolerance:
+            flags.append('MORE MEMORY')
+        regressions += bool(flags)
+        print(f"{name}: {base['throughput']:.0f} -> "
+            f"{result['throughput']:.0f} {result['unit']}/s ({speed:+.1%}), "
+            f"{base['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB "
+            f"({memory:+.1%})"
+            f"{f', child processes {children:+.1%}' if children else ''}"
+            f"{'  ' + ', '.join(flags) if flags else ''}")
+    for name in old['results']:
+        if name not in new['results']:
+            print(f'{name}: missing')
+    print(f'{regressions} regressions with tolerance {tolerance:.0%}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmarks.py',
+        description='Benchmark opustools on a generated corpus, or compare '
+        'two result files')
+    parser.add_argument('-d', '--documents', type=int, default=10,
+        help='Number of documents (default 10)')
+    parser.add_argument('-s', '--sentences', type=int, default=2000,
+        help='Number of source sentences per document (default 2000)')
+    parser.add_argument('-m', '--many_to_many', type=int, default=5,
+        help='Make every nth link a many-to-many or empty link, 0 for '
+        'only one-to-one links (default 5)')
+    parser.add_argument('--corpora', type=int, default=300,
+        help='Number of corpora in the database (default 300)')
+    parser.add_argument('--languages', type=int, default=120,
+        help='Number of languages in the database (default 120)')
+    parser.add_argument('--lookups', type=int, default=20,
+        help='Number of lookups per database case (default 20)')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+        help='Number of runs of each case, the fastest is reported '
+        '(default 3)')
+    parser.add_argument('-k', '--cases', metavar='REGEX',
+        help='Run only the cases whose name matches the regex')
+    parser.add_argument('-o', '--output', default='benchmarks.json',
+        help='Json file for the results (default benchmarks.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='Compare two result files instead of running the benchmarks')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+        help='Relative drop of throughput or growth of peak memory that '
+        'is reported as a regression (default 0.1)')
+    args = parser.parse_args()
+
+    if args.compare:
+        if compare(*args.compare, args.tolerance):
+            sys.exit(1)
+        return
+    print(opustools.__path__, file=sys.stderr)
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
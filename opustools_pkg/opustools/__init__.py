@@ -1,6 +1,25 @@
-from .opus_cat import OpusCat
-from .opus_read import OpusRead
-from .opus_get import OpusGet
-from .db_operations import DbOperations
-from .readopusdata import update_db
+import importlib
 
+# The classes are imported when they are first used, so that a command
+# only loads the modules it needs
+_exports = {
+    'OpusCat': '.opus_cat',
+    'OpusRead': '.opus_read',
+    'OpusGet': '.opus_get',
+    'DbOperations': '.db_operations',
+    'update_db': '.readopusdata',
+    }
+
+__all__ = list(_exports)
+
+def __getattr__(name):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(
+            f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
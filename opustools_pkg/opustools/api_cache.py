@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+
+def fetch_json(url, timeout=None):
+    """Return the json data of a url"""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+class ApiCache:
+
+    # Seconds to wait for a refresh in the background
+    refresh_timeout = 30
+
+    def __init__(self, cache_dir, ttl=3600, max_stale=604800):
+        """Cache of OPUS API responses on disk, one file per url, i.e.
+        per query. A response younger than ttl seconds is used as is. An
+        older one is still used for up to max_stale seconds more, while it
+        is refreshed in a background thread for the next run. Responses
+        older than that are fetched again, and if the API cannot be
+        reached, any cached response is used instead.
+
+        Arguments:
+        cache_dir -- Directory of the cached responses
+        ttl -- Seconds a response is used without refreshing it
+        max_stale -- Seconds after ttl a response is used while it is
+            refreshed
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.refreshing = {}
+        self.lock = threading.Lock()
+
+    def path(self, url):
+        return os.path.join(self.cache_dir,
+                hashlib.sha1(url.encode('utf-8')).hexdigest()+'.json')
+
+    def load(self, url):
+        """Return the cached (time, data) of a url, or None"""
+        try:
+            with open(self.path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('url') != url:
+            return None
+        return entry['time'], entry['data']
+
+    def store(self, url, data):
+        """Write a response to the cache, if the directory is writable"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'url': url, 'time': time.time(), 'data': data}, f)
+            os.replace(temp_name, self.path(url))
+        except OSError:
+            pass
+
+    def refresh(self, url, fetch):
+        try:
+            self.store(url, fetch(url, self.refresh_timeout))
+        except (OSError, ValueError):
+            pass
+
+    def start_refresh(self, url, fetch):
+        """Refresh a response in a background thread, once per url. The
+        thread is not a daemon, so the refreshed response is written before
+        the program exits."""
+        with self.lock:
+            thread = self.refreshing.get(url)
+            if thread is None:
+                thread = threading.Thread(target=self.refresh,
+                        args=(url, fetch))
+                self.refreshing[url] = thread
+                thread.start()
+        return thread
+
+    def get(self, url, fetch=None):
+        """Return the data of a url from the cache or from fetch(url,
+        timeout), fetch_json by default"""
+        fetch = fetch or fetch_json
+        entry = self.load(url)
+        if entry is not None:
+            cached, data = entry
+            age = time.time() - cached
+            if 0 <= age < self.ttl:
+                return data
+            if 0 <= age < self.ttl + self.max_stale:
+                self.start_refresh(url, fetch)
+                return data
+        try:
+            data = fetch(url, None)
+        except OSError:
+            # Offline, use a response of any age
+            if entry is None:
+                raise
+            return entry[1]
+        self.store(url, data)
+        return data
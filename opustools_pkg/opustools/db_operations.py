@@ -1,13 +1,30 @@
 import os
 import sqlite3
+import threading
+import urllib.request
 
 class DbOperations:
 
-    def __init__(self, db_file=None):
+    columns = ['alignment_pairs', 'corpus', 'documents', 'id', 'latest', 'preprocessing', 'size', 'source', 'source_tokens', 'target', 'target_tokens', 'url', 'version']
+
+    def __init__(self, db_file=None, immutable=False):
+        """Queries to the OPUS resource database. Each thread keeps one
+        read-only connection open for all of its queries, so prepared
+        statements are reused.
+
+        Arguments:
+        db_file -- Sqlite db file (default: OPUSAPI_DB environment variable)
+        immutable -- Open the db file as immutable, which skips locking.
+            Only for files that are not changed while they are open.
+        """
         if db_file:
             self.db_file = db_file
         else:
             self.db_file = os.environ.get('OPUSAPI_DB')
+        self.immutable = immutable
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
 
     def clean_up_parameters(self, parameters):
         remove = []
@@ -23,33 +40,68 @@ class DbOperations:
             del parameters[key]
         return parameters
 
-    def run_query(self, sql_command):
-        conn = sqlite3.connect(self.db_file)
-        query = conn.execute(sql_command)
+    def connect(self):
+        """Return the connection of this thread, opening it on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            uri = 'file:{}?mode=ro'.format(urllib.request.pathname2url(
+                os.path.abspath(os.path.expanduser(self.db_file))))
+            if self.immutable:
+                uri += '&immutable=1'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close the connections of all threads"""
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+    def run_query(self, sql_command, values=()):
+        query = self.connect().execute(sql_command, values)
         value_list = query.fetchall()
         keys = [i[0] for i in query.description]
-        conn.close()
         return keys, value_list
 
+    def where(self, parameters):
+        """Return a condition with bound parameters for column = value
+        pairs and its values"""
+        condition = ' AND '.join(f'{k} = ?' for k in parameters) or '1'
+        return condition, list(parameters.values())
+
+    def select_files(self, parameters, suffix='', sources=None):
+        """Return the rows that match parameters as dicts, restricted to the
+        given source languages if sources is not None"""
+        condition, values = self.where(parameters)
+        if sources is not None:
+            condition += ' AND source IN ({})'.format(
+                ', '.join('?'*len(sources)))
+            values += sources
+        sql_command = (f'SELECT {", ".join(self.columns)} FROM opusfile '
+                f'WHERE {condition}{suffix}')
+        keys, value_list = self.run_query(sql_command, values)
+        return [{k: v for k, v in zip(keys,values)} for values in value_list]
+
     def run_default_query(self, parameters, suffix=''):
-        columns = ['alignment_pairs', 'corpus', 'documents', 'id', 'latest', 'preprocessing', 'size', 'source', 'source_tokens', 'target', 'target_tokens', 'url', 'version']
         parameters = self.sort_source_target(parameters)
-        sql_command = f'SELECT {", ".join(columns)} FROM opusfile WHERE '+' AND '.join([f"{k} = '{v}'" for k, v in parameters.items()]) + suffix
-        keys, value_list = self.run_query(sql_command)
-        ret = [{k: v for k, v in zip(keys,values)} for values in value_list]
+        ret = self.select_files(parameters, suffix)
         if 'preprocessing' not in parameters.keys() and parameters.get('target'):
-            param_mono_src = parameters.copy()
-            param_mono_src['target'] = ''
-            sql_command = f'SELECT {", ".join(columns)} FROM opusfile WHERE '+' AND '.join([f"{k} = '{v}'" for k, v in param_mono_src.items()]) + suffix
-            keys, value_list = self.run_query(sql_command)
-            ret = ret + [{k: v for k, v in zip(keys,values)} for values in value_list]
-
-            param_mono_trg = parameters.copy()
-            param_mono_trg['source'] = parameters['target']
-            param_mono_trg['target'] = ''
-            sql_command = f'SELECT {", ".join(columns)} FROM opusfile WHERE '+' AND '.join([f"{k} = '{v}'" for k, v in param_mono_trg.items()]) + suffix
-            keys, value_list = self.run_query(sql_command)
-            ret = ret + [{k: v for k, v in zip(keys,values)} for values in value_list]
+            param_mono = parameters.copy()
+            param_mono['target'] = ''
+            if 'source' in param_mono:
+                # Monolingual files of both languages, source language first
+                languages = [param_mono.pop('source'), parameters['target']]
+                mono = self.select_files(param_mono, suffix, sources=languages)
+                ret = ret + sorted(mono, key=lambda item: languages.index(item['source']))
+            else:
+                ret = ret + self.select_files(param_mono, suffix)
+                param_mono['source'] = parameters['target']
+                ret = ret + self.select_files(param_mono, suffix)
 
         return ret
 
@@ -60,9 +112,10 @@ class DbOperations:
             del parameters['corpora']
 
         sql_command = 'SELECT DISTINCT corpus FROM opusfile'
+        condition, values = self.where(parameters)
         if len(parameters) > 0:
-            sql_command = sql_command+' WHERE '+' AND '.join([f"{k} = '{v}'" for k, v in parameters.items()])
-        _, value_list = self.run_query(sql_command)
+            sql_command = sql_command+' WHERE '+condition
+        _, value_list = self.run_query(sql_command, values)
         values = [v[0] for v in value_list]
         return values
 
@@ -73,15 +126,20 @@ class DbOperations:
             del parameters['languages']
 
         sql_command = 'SELECT DISTINCT source FROM opusfile '
+        values = []
         if len(parameters) > 0:
             source = parameters.get('source')
             if source:
-                sql_command = 'SELECT DISTINCT target FROM opusfile where '+' AND '.join([f"{k} = '{v}'" for k, v in parameters.items()]) + f" AND target != '{source}' AND target != '' UNION SELECT DISTINCT source FROM opusfile "
+                condition, values = self.where(parameters)
+                sql_command = 'SELECT DISTINCT target FROM opusfile where '+condition+" AND target != ? AND target != '' UNION SELECT DISTINCT source FROM opusfile "
+                values.append(source)
                 parameters['target'] = parameters['source']
                 del parameters['source']
             sql_command = sql_command + 'WHERE '
-        sql_command = sql_command + ' AND '.join([f"{k} = '{v}'" for k, v in parameters.items()])
-        _, value_list = self.run_query(sql_command)
+            condition, target_values = self.where(parameters)
+            sql_command = sql_command + condition
+            values += target_values
+        _, value_list = self.run_query(sql_command, values)
         values = [v[0] for v in value_list]
         return values
 
@@ -111,7 +169,7 @@ class DbOperations:
             # Get xml alignment files
             a_parameters['preprocessing'] = 'xml'
             # Don't get the sentence file
-            suffix=' AND target != ""'
+            suffix=" AND target != ''"
         ret = self.run_default_query(a_parameters, suffix=suffix)
         source = parameters.get('source')
         target = parameters.get('target')
@@ -128,9 +186,12 @@ class DbOperations:
                 languages.add(item['source'])
                 languages.add(item['target'])
 
+            # One query for the sentence files of all languages
             parameters['target'] = ''
-            for language in sorted(list(languages)):
-                parameters['source'] = language
-                ret = ret + self.run_default_query(parameters)
+            parameters.pop('source', None)
+            languages = sorted(languages)
+            if languages:
+                files = self.select_files(parameters, sources=languages)
+                ret = ret + sorted(files, key=lambda item: item['source'])
 
         return ret
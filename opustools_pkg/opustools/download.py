@@ -0,0 +1,247 @@
+import concurrent.futures
+import http.client
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+class DownloadError(Exception):
+
+    def __init__(self, message):
+        """Raise error when a file cannot be downloaded or a downloaded
+        file is incomplete.
+
+        Arguments:
+        message -- Error message to be printed
+        """
+        self.message = message
+
+def format_bytes(size):
+    """Format a number of bytes in MB"""
+    return '{:.1f} MB'.format(size/1000000)
+
+class Download:
+
+    def __init__(self, url, file_name, size=None):
+        """File to be downloaded.
+
+        Arguments:
+        url -- Url of the file
+        file_name -- Path of the downloaded file
+        size -- Size in kilobytes given by the OPUS API, or None if it is
+            not known. A different size is only reported as a warning.
+        """
+        self.url = url
+        self.file_name = file_name
+        self.part_name = file_name + '.part'
+        self.size = size
+        self.offset = 0
+        self.received = 0
+        self.total = None
+        self.started = None
+
+class Downloader:
+
+    # Bytes read from a response at a time and the number of redirects
+    # followed
+    block_size = 65536
+    max_redirects = 5
+
+    def __init__(self, connections=4, progress=True):
+        """Download files over http(s) in parallel threads. Each thread
+        keeps its connections to each server open between files. The data
+        is written to file_name.part, which is moved to file_name when it
+        is complete, and an existing .part file is continued with a range
+        request.
+
+        Arguments:
+        connections -- Number of files downloaded at the same time
+        progress -- Report the progress and throughput to stderr
+        """
+        self.connections = connections
+        self.progress = progress
+        self.local = threading.local()
+        self.opened = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def connection(self, scheme, netloc):
+        """Return the open connection of this thread to a server"""
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        key = (scheme, netloc)
+        conn = self.local.connections.get(key)
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc)
+            else:
+                conn = http.client.HTTPConnection(netloc)
+            self.local.connections[key] = conn
+            with self.lock:
+                self.opened.append(conn)
+        return conn
+
+    def drop_connection(self, scheme, netloc):
+        conn = self.local.connections.pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+    def request(self, url, offset):
+        """Send a GET request for url from byte offset on, following
+        redirects, and return the response"""
+        for _ in range(self.max_redirects+1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            headers = {}
+            if offset:
+                headers['Range'] = 'bytes={}-'.format(offset)
+            # A kept connection may have been closed by the server
+            for retry in (True, False):
+                conn = self.connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (http.client.RemoteDisconnected,
+                        ConnectionResetError, BrokenPipeError):
+                    self.drop_connection(parts.scheme, parts.netloc)
+                    if not retry:
+                        raise
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                url = urllib.parse.urljoin(url,
+                        response.getheader('Location', ''))
+                continue
+            return response, parts
+        raise DownloadError('Too many redirects for "{url}"'.format(
+            url=url))
+
+    def fetch(self, download):
+        """Download a file, continuing its .part file if it exists.
+        Return False if the download was stopped."""
+        offset = 0
+        if os.path.isfile(download.part_name):
+            offset = os.path.getsize(download.part_name)
+        response, parts = self.request(download.url, offset)
+        if response.status == 416:
+            # The .part file is complete or larger than the file
+            response.read()
+            total = response.getheader('Content-Range', '').rpartition('/')[2]
+            if total.isdigit() and int(total) == offset:
+                download.total = offset
+                self.finish(download)
+                return True
+            os.remove(download.part_name)
+            offset = 0
+            response, parts = self.request(download.url, offset)
+        if response.status == 206 and offset:
+            mode = 'ab'
+            total = response.getheader('Content-Range', '').rpartition('/')[2]
+            download.total = int(total) if total.isdigit() else None
+        elif response.status == 200:
+            # The server does not support ranges, start from the beginning
+            mode = 'wb'
+            offset = 0
+            length = response.getheader('Content-Length')
+            download.total = int(length) if length else None
+        else:
+            response.read()
+            raise DownloadError('Unable to download "{url}": HTTP {status}'
+                    .format(url=download.url, status=response.status))
+
+        download.offset = offset
+        download.received = offset
+        download.started = time.time()
+        with open(download.part_name, mode) as part:
+            while True:
+                if self.stop.is_set():
+                    self.drop_connection(parts.scheme, parts.netloc)
+                    return False
+                data = response.read(self.block_size)
+                if not data:
+                    break
+                part.write(data)
+                download.received += len(data)
+                self.report()
+        self.finish(download)
+        return True
+
+    def finish(self, download):
+        """Check the size of a complete .part file against the length
+        given by the server and move it in place"""
+        size = os.path.getsize(download.part_name)
+        if download.total is not None and size != download.total:
+            raise DownloadError('Download of "{url}" is incomplete: {size} '
+                    'of {total} bytes'.format(url=download.url, size=size,
+                        total=download.total))
+        os.replace(download.part_name, download.file_name)
+        with self.lock:
+            self.done += 1
+            # The OPUS API gives sizes in whole kilobytes from the corpus
+            # metadata, which can be out of date. The length given by the
+            # server was checked above, so the file is kept.
+            if (download.size is not None and
+                    abs(size/1024-download.size) > 1):
+                print('\x1b[2KWarning: size of "{file}" is {size} bytes, '
+                        'the OPUS API gives {expected} KB'.format(
+                            file=download.file_name, size=size,
+                            expected=download.size), file=sys.stderr)
+            if not self.progress:
+                return
+            elapsed = time.time() - (download.started or time.time())
+            received = download.received - download.offset
+            print('\x1b[2K{file} ... {size} in {elapsed:.1f} s, {rate}/s'
+                    .format(file=download.file_name,
+                        size=format_bytes(size), elapsed=elapsed,
+                        rate=format_bytes(received/elapsed) if elapsed
+                        else '-'), file=sys.stderr)
+
+    def report(self):
+        """Print the aggregate progress and throughput of all files"""
+        if not self.progress:
+            return
+        received = sum(d.received for d in self.downloads)
+        totals = [d.total for d in self.downloads]
+        elapsed = time.time() - self.started
+        total = ''
+        if None not in totals:
+            total = ' of ' + format_bytes(sum(totals))
+        with self.lock:
+            print('\x1b[2K{done}/{files} files, {received}{total}, '
+                    '{rate}/s'.format(done=self.done,
+                        files=len(self.downloads),
+                        received=format_bytes(received), total=total,
+                        rate=format_bytes(received/elapsed) if elapsed
+                        else '-'), end='\r', file=sys.stderr)
+
+    def run(self, downloads):
+        """Download files in parallel. The first error stops the other
+        downloads, which can be continued later from their .part files,
+        and is raised."""
+        self.downloads = downloads
+        self.done = 0
+        self.started = time.time()
+        self.stop.clear()
+        executor = concurrent.futures.ThreadPoolExecutor(
+                max(1, min(self.connections, len(downloads))))
+        try:
+            futures = [executor.submit(self.fetch, download)
+                    for download in downloads]
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception():
+                    self.stop.set()
+                    for other in futures:
+                        other.cancel()
+                    raise future.exception()
+        finally:
+            self.stop.set()
+            executor.shutdown(wait=True)
+            for conn in self.opened:
+                conn.close()
+            self.opened = []
+            if self.progress and self.done:
+                print('\x1b[2K{done}/{files} files downloaded'.format(
+                    done=self.done, files=len(downloads)), file=sys.stderr)
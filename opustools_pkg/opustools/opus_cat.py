@@ -1,10 +1,10 @@
 import argparse
-import zipfile
 import os
 
-from .opus_get import OpusGet
 from .parse.block_parser import BlockParser
 from .parse.sentence_parser import SentenceParser
+from .parse.zip_manifest import open_zip
+from .util import open_zip_member
 
 def parse_type(preprocessing, get_annotations):
     def xml_parse(bp, block, sentence, no_ids, maximum):
@@ -84,7 +84,8 @@ class OpusCat:
             maximum=-2, preprocess='xml', plain=False, file_name=None, release='latest',
             print_annotations=False, set_attribute=['pos', 'lem'],
             change_annotation_delimiter='|',
-            root_directory='/projappl/nlpl/data/OPUS', download_dir='.' ):
+            root_directory='/projappl/nlpl/data/OPUS', download_dir='.',
+            remote=False, cache_dir='~/.OpusTools/cache'):
         """Print the contents of a xml sentence file.
 
         Keyword arguments:
@@ -102,6 +103,10 @@ class OpusCat:
         root_directory -- Root directory for corpus files
             (default /projappl/nlpl/data/OPUS)
         download_dir -- Directory where files will be downloaded (default .)
+        remote -- Read a missing zip file from OPUS with http range
+            requests instead of downloading it
+        cache_dir -- Directory where blocks of remote files and OPUS API
+            responses are cached (default ~/.OpusTools/cache)
         """
 
         self.maximum = maximum
@@ -114,6 +119,8 @@ class OpusCat:
         self.no_ids = no_ids
         self.file_name = file_name
         self.plain = plain
+        self.remote = remote
+        self.cache_dir = cache_dir
 
         self.preprocess = preprocess
         parser_pp = preprocess
@@ -134,10 +141,24 @@ class OpusCat:
         """Open zip file."""
         try:
             try:
-                self.lzip = zipfile.ZipFile(localfile)
+                self.lzip = open_zip(localfile)
             except FileNotFoundError:
-                self.lzip = zipfile.ZipFile(defaultpath)
+                self.lzip = open_zip(defaultpath)
         except FileNotFoundError:
+            # opus_get and remote are imported only for missing files, as
+            # they pull in the http and database modules
+            from .opus_get import OpusGet
+            url = None
+            if self.remote:
+                og = OpusGet(directory=self.directory, source=self.language,
+                    target='', preprocess=self.preprocess,
+                    release=self.release, download_dir=self.download_dir,
+                    cache_dir=self.cache_dir)
+                url = og.get_remote_files().get(localfile)
+            if url:
+                from .remote import open_remote_zip
+                self.lzip = open_remote_zip(url, self.cache_dir)
+                return
             print('\nRequested file not found. The following files are '
                 'availble for downloading:\n')
             arguments = ['-d', self.directory, '-s', self.language, '-t', '',
@@ -145,14 +166,15 @@ class OpusCat:
                 self.download_dir]
             arguments={'directory': self.directory, 'source': self.language,
                 'target': '', 'preprocess': self.preprocess, 'list_resources': True,
-                'release': self.release, 'download_dir': self.download_dir}
+                'release': self.release, 'download_dir': self.download_dir,
+                'cache_dir': self.cache_dir}
             og = OpusGet(**arguments)
             og.get_files()
             arguments['list_resources'] = False
             og = OpusGet(**arguments)
             og.get_files()
             try:
-                self.lzip = zipfile.ZipFile(localfile)
+                self.lzip = open_zip(localfile)
             except FileNotFoundError:
                 print('No file found')
 
@@ -194,12 +216,12 @@ class OpusCat:
         """Print sentences from documents in a zip file."""
         try:
             if self.file_name:
-                with self.lzip.open(self.file_name, 'r') as f:
+                with open_zip_member(self.lzip, self.file_name) as f:
                     self.printFile(f, self.file_name)
             else:
                 for n in self.lzip.namelist():
                     if n[-4:] == '.xml':
-                        with self.lzip.open(n, 'r') as f:
+                        with open_zip_member(self.lzip, n) as f:
                             self.printFile(f, n)
         except AttributeError as e:
             print('Necessary files not found.')
@@ -2,13 +2,16 @@ import os
 import sys
 import zipfile
 
-from .util import file_open
-from .opus_get import OpusGet
+from .util import file_open, open_zip_member, is_url
+from .parse.sentence_index import SentenceIndex
+from .parse.langid_index import LanguageIdIndex
+from .parse.zip_manifest import open_zip
 
 class OpusFileHandler:
 
     def __init__(self, download_dir, source_zip, target_zip, directory,
-            release, preprocess, fromto, suppress_prompts):
+            release, preprocess, fromto, suppress_prompts, remote=False,
+            cache_dir=None):
 
         self.directory = directory
         self.release = release
@@ -16,6 +19,9 @@ class OpusFileHandler:
         self.fromto = fromto
 
         self.suppress_prompts = suppress_prompts
+        self.remote = remote
+        self.cache_dir = cache_dir
+        self.remote_urls = None
 
         self.download_dir = download_dir
 
@@ -23,13 +29,21 @@ class OpusFileHandler:
         self.trg_zip_name = target_zip
 
         self.zip_opened = False
+        self.src_index = None
+        self.trg_index = None
+        self.src_langids = None
+        self.trg_langids = None
 
     def download_files(self):
+        # opus_get and remote are imported only when files are missing,
+        # as they pull in the http and database modules
+        from .opus_get import OpusGet
         print('The following files are available for downloading:\n')
         arguments = {'source': self.fromto[0],
                 'target': self.fromto[1], 'directory': self.directory,
                 'release': self.release, 'preprocess': self.preprocess,
-                'download_dir': self.download_dir, 'list_resources': True}
+                'download_dir': self.download_dir, 'list_resources': True,
+                'cache_dir': self.cache_dir}
         og = OpusGet(**arguments)
         og.get_files()
         arguments['list_resources'] = False
@@ -38,6 +52,20 @@ class OpusFileHandler:
         og = OpusGet(**arguments)
         og.get_files()
 
+    def remote_url(self, local_name):
+        """Return the url of a corpus file in OPUS for reading it remotely
+        instead of downloading it to local_name, or None"""
+        if not self.remote:
+            return None
+        if self.remote_urls is None:
+            from .opus_get import OpusGet
+            og = OpusGet(source=self.fromto[0], target=self.fromto[1],
+                    directory=self.directory, release=self.release,
+                    preprocess=self.preprocess,
+                    download_dir=self.download_dir, cache_dir=self.cache_dir)
+            self.remote_urls = og.get_remote_files()
+        return self.remote_urls.get(local_name)
+
     def open_moses_files(self, outpath=None):
         moses_zip_name = os.path.join(self.download_dir, f'{self.directory}_{self.release}_moses_'
                 f'{self.fromto[0]}-{self.fromto[1]}.txt.zip')
@@ -53,25 +81,35 @@ class OpusFileHandler:
         return sorted(ret_file_names)
 
     def open_alignment_file(self, align_name):
-        """Open alignment file. Look first for specified file, then
-        look for pre-downloaded local file, and finally, download
-        missing files"""
+        """Open alignment file. Look first for specified file or url, then
+        look for pre-downloaded local file, then read the file from OPUS
+        in remote mode, and finally, download missing files"""
 
         local_align_name = os.path.join(self.download_dir,
                 self.directory+'_'+ self.release+'_xml_'+self.fromto[0]+'-'+
                 self.fromto[1]+'.xml.gz')
 
-        if os.path.isfile(align_name):
-            alignment = file_open(align_name, mode='r', encoding='utf-8')
+        if is_url(align_name):
+            from .remote import open_remote_file
+            alignment = open_remote_file(align_name, self.cache_dir)
+        elif os.path.isfile(align_name):
+            alignment = file_open(align_name, mode='r', encoding='utf-8',
+                    memory_map=True)
         elif os.path.isfile(local_align_name):
-            alignment = file_open(local_align_name, mode='r', encoding='utf-8')
+            alignment = file_open(local_align_name, mode='r',
+                    encoding='utf-8', memory_map=True)
+        elif self.remote_url(local_align_name):
+            from .remote import open_remote_file
+            alignment = open_remote_file(self.remote_url(local_align_name),
+                    self.cache_dir)
         else:
             print('No alignment file "{default}" or "{downloaded}" found'.format(
                 default=align_name, downloaded=local_align_name))
             self.download_files()
             if os.path.isfile(local_align_name):
                 alignment = file_open(
-                    local_align_name, mode='r', encoding='utf-8')
+                    local_align_name, mode='r', encoding='utf-8',
+                    memory_map=True)
             else:
                 raise FileNotFoundError('No alignment file "{default}" or'
                         ' "{downloaded}" found'.format(
@@ -79,27 +117,41 @@ class OpusFileHandler:
 
         return alignment
 
+    def open_zip(self, zip_name):
+        if is_url(zip_name):
+            from .remote import open_remote_zip
+            return open_remote_zip(zip_name, self.cache_dir)
+        return open_zip(zip_name)
+
     def open_specific_zips(self, src_zip_name, trg_zip_name):
-        src_zip = zipfile.ZipFile(src_zip_name, 'r')
-        trg_zip = zipfile.ZipFile(trg_zip_name, 'r')
+        src_zip = self.open_zip(src_zip_name)
+        trg_zip = self.open_zip(trg_zip_name)
         return src_zip, trg_zip
 
     def open_zipfiles(self):
-        """Open zip files. Look first for specified zip files, then
-        look for pre-downloaded local files, and finally, download
-        missing files"""
+        """Open zip files. Look first for specified zip files or urls,
+        then look for pre-downloaded local files, then read the files from
+        OPUS in remote mode, and finally, download missing files"""
 
         local_src_name = os.path.join(self.download_dir, self.directory+'_'+
                 self.release+'_'+ self.preprocess+'_'+self.fromto[0]+'.zip')
         local_trg_name = os.path.join(self.download_dir, self.directory+'_'+
                 self.release+'_'+ self.preprocess+'_'+self.fromto[1]+'.zip')
 
-        if os.path.isfile(self.src_zip_name) and os.path.isfile(self.trg_zip_name):
+        def available(zip_name):
+            return is_url(zip_name) or os.path.isfile(zip_name)
+
+        if available(self.src_zip_name) and available(self.trg_zip_name):
             self.src_zip, self.trg_zip = self.open_specific_zips(
                     self.src_zip_name, self.trg_zip_name)
         elif os.path.isfile(local_src_name) and os.path.isfile(local_trg_name):
             self.src_zip, self.trg_zip = self.open_specific_zips(
                     local_src_name, local_trg_name)
+        elif (self.remote_url(local_src_name) and
+                self.remote_url(local_trg_name)):
+            self.src_zip, self.trg_zip = self.open_specific_zips(
+                    self.remote_url(local_src_name),
+                    self.remote_url(local_trg_name))
         else:
             print('No zip files found.')
             self.download_files()
@@ -113,40 +165,98 @@ class OpusFileHandler:
                         local_src_name, local_trg_name))
 
         self.zip_opened = True
+        self.src_index = SentenceIndex.load(self.src_zip.filename)
+        self.trg_index = SentenceIndex.load(self.trg_zip.filename)
+        self.src_langids = LanguageIdIndex.load(self.src_zip.filename)
+        self.trg_langids = LanguageIdIndex.load(self.trg_zip.filename)
+
+    def build_sentence_indexes(self, verbose=False):
+        """Build sentence indexes for the source and target zip files"""
+        if not self.zip_opened:
+            self.open_zipfiles()
+        self.close_indexes()
+        self.src_index = SentenceIndex.build(self.src_zip.filename, verbose)
+        self.trg_index = SentenceIndex.build(self.trg_zip.filename, verbose)
+        return self.src_index.index_file, self.trg_index.index_file
+
+    def get_sentence_offsets(self, doc, direction):
+        """Return sentence offsets from the sentence index for a document
+        opened from a zip file, or None if the document is not indexed"""
+        if not isinstance(doc, zipfile.ZipExtFile):
+            return None
+        index = self.src_index if direction == 'src' else self.trg_index
+        if index is None:
+            return None
+        return index.get_offsets(doc.name)
+
+    def get_language_ids(self, doc_name, direction):
+        """Return the language id attributes of the sentences of a
+        document from the language id index of its zip file, or None if
+        the document is not in an up to date index"""
+        if os.path.isfile(os.path.join(self.download_dir, doc_name)):
+            return None
+        if not self.zip_opened:
+            self.open_zipfiles()
+        if direction == 'src':
+            zip_arc, index = self.src_zip, self.src_langids
+        else:
+            zip_arc, index = self.trg_zip, self.trg_langids
+        if index is None:
+            return None
+        return index.get_language_ids(self.member_name(zip_arc, doc_name))
+
+    def member_name(self, zip_arc, doc_name):
+        """Return the name of a document in a zip file"""
+        #In OPUS, directory and preprocessing information need to be added and
+        #the ".gz" ending needs to be removed.
+        opus_doc_name = self.directory+'/'+self.preprocess+'/'+doc_name[:-3]
+        try:
+            zip_arc.getinfo(opus_doc_name)
+            return opus_doc_name
+        except KeyError:
+            return doc_name
 
     def open_sentence_file(self, doc_name, direction):
+        """Open a sentence file and return it with its size. Zip members
+        report the uncompressed size stored in their ZipInfo, and local
+        files -1, which lets the parser measure them."""
         local_doc = os.path.join(self.download_dir, doc_name)
         try:
-            return file_open(local_doc)
+            return file_open(local_doc, memory_map=True), -1
         except FileNotFoundError:
             pass
 
         if not self.zip_opened:
             self.open_zipfiles()
 
-        #In OPUS, directory and preprocessing information need to be added and
-        #the ".gz" ending needs to be removed.
-        opus_doc_name = self.directory+'/'+self.preprocess+'/'+doc_name[:-3]
-
         try:
             if direction == 'src':
-                if opus_doc_name in self.src_zip.namelist():
-                    doc = self.src_zip.open(opus_doc_name, 'r')
-                else:
-                    doc = self.src_zip.open(doc_name, 'r')
+                info = self.src_zip.getinfo(
+                        self.member_name(self.src_zip, doc_name))
+                doc = open_zip_member(self.src_zip, info.filename)
         except KeyError as e:
             raise KeyError(e.args[0]+" '"+self.src_zip_name+"'")
         try:
             if direction == 'trg':
-                if opus_doc_name in self.trg_zip.namelist():
-                    doc = self.trg_zip.open(opus_doc_name, 'r')
-                else:
-                    doc = self.trg_zip.open(doc_name, 'r')
+                info = self.trg_zip.getinfo(
+                        self.member_name(self.trg_zip, doc_name))
+                doc = open_zip_member(self.trg_zip, info.filename)
         except KeyError as e:
             raise KeyError(e.args[0]+" '"+self.trg_zip_name+"'")
-        return doc
+        return doc, info.file_size
+
+    def close_indexes(self):
+        for index in (self.src_index, self.trg_index, self.src_langids,
+                self.trg_langids):
+            if index:
+                index.close()
+        self.src_index = None
+        self.trg_index = None
+        self.src_langids = None
+        self.trg_langids = None
 
     def close_zipfiles(self):
         if self.zip_opened:
             self.src_zip.close()
             self.trg_zip.close()
+        self.close_indexes()
@@ -1,18 +1,21 @@
 import urllib.request
-import json
 import argparse
 import sys
 import os
 import gzip
+import http.client
 
 from .db_operations import DbOperations
+from .api_cache import ApiCache, fetch_json
+from .download import Download, Downloader, DownloadError
 
 class OpusGet:
 
     def __init__(self, source=None, target=None, directory=None,
             release='latest', preprocess='xml', list_resources=False,
             list_languages=False, list_corpora=False, download_dir='.',
-            local_db=False, suppress_prompts=False, database='~/.OpusTools/opusdata.db'):
+            local_db=False, suppress_prompts=False, database='~/.OpusTools/opusdata.db',
+            connections=4, cache_dir='~/.OpusTools/cache', cache_ttl=3600):
         """Download files from OPUS.
 
         Keyword arguments:
@@ -28,6 +31,12 @@ class OpusGet:
         database -- Sqlite db file location (default ~/.OpusTools/opusdata.db)
         download_dir -- Directory where files will be downloaded (default .)
         suppress_prompts -- Download files without prompting "(y/n)"
+        connections -- Number of files downloaded at the same time
+            (default 4)
+        cache_dir -- Directory where OPUS API responses are cached in an
+            api subdirectory, None for no cache (default ~/.OpusTools/cache)
+        cache_ttl -- Seconds a cached response is used before it is
+            refreshed (default 3600)
         """
 
         self.list_languages = list_languages
@@ -74,6 +83,11 @@ class OpusGet:
         self.target = target
         self.list_resources = list_resources
         self.suppress_prompts = suppress_prompts
+        self.connections = connections
+        self.api_cache = None
+        if cache_dir:
+            self.api_cache = ApiCache(os.path.join(cache_dir, 'api'),
+                ttl=cache_ttl)
 
     def round_size(self, size, length, unit):
         """Round file size."""
@@ -97,12 +111,22 @@ class OpusGet:
         return size
 
     def get_response(self, url):
-        """Return data from a url."""
-        response = urllib.request.urlopen(url[:-1])
-        result = response.read().decode('utf-8')
-        data = json.loads(result)
+        """Return data from a url, or from the response cache."""
+        if self.api_cache:
+            return self.api_cache.get(url[:-1])
+        return fetch_json(url[:-1])
 
-        return data
+    def get_languages(self):
+        """Return the available languages."""
+        if self.local_db:
+            return self.dbo.run_languages_query(self.parameters)
+        return self.get_response(self.url+'languages=True')['languages']
+
+    def get_corpus_list(self):
+        """Return the available corpora."""
+        if self.local_db:
+            return self.dbo.run_corpora_query(self.parameters)
+        return self.get_response(self.url+'corpora=True')['corpora']
 
     def make_file_name(self, c):
         """Return file name based on corpus data."""
@@ -113,15 +137,22 @@ class OpusGet:
                 '_'+c['version']+'_', '_latest_')
         return os.path.join(self.download_dir, filename)
 
+    def get_corpora(self):
+        """Return the corpus data of all matching files."""
+        if self.local_db:
+            return self.dbo.get_corpora(self.parameters)
+        return self.get_response(self.url)['corpora']
+
+    def get_remote_files(self):
+        """Return a dictionary of local file name: url of the matching
+        files, for reading them remotely instead of downloading them."""
+        return {self.make_file_name(c): c['url'] for c in self.get_corpora()}
+
     def get_corpora_data(self):
         """Receive corpus data."""
         total_size = 0
 
-        if self.local_db:
-            corpora = self.dbo.get_corpora(self.parameters)
-        else:
-            data = self.get_response(self.url)
-            corpora = data['corpora']
+        corpora = self.get_corpora()
 
         ret_corpora = []
         for c in corpora:
@@ -138,14 +169,6 @@ class OpusGet:
 
         return ret_corpora, total_size
 
-    def progress_status(self, count, blockSize, totalSize):
-        """Report download progress."""
-        percent = int(count*blockSize*100/totalSize)
-        if percent > 100:
-            percent = 100
-        print('\r{0} ... {1}% of {2}'.format(self.filename, percent,
-            self.filesize), end='', flush=True)
-
     def download(self, corpora, total_size):
         """Download files."""
         if self.suppress_prompts == False:
@@ -155,16 +178,15 @@ class OpusGet:
             answer = 'y'
 
         if answer in ['y', '']:
-            for c in corpora:
-                self.filename = self.make_file_name(c)
-                self.filesize = self.format_size(c['size'])
-                try:
-                    urllib.request.urlretrieve(c['url'], self.filename,
-                        reporthook=self.progress_status)
-                    print('')
-                except urllib.error.URLError as e:
-                    print('Unable to retrieve the data.')
-                    return
+            downloads = [Download(c['url'], self.make_file_name(c),
+                c['size'] if isinstance(c['size'], int) else None)
+                for c in corpora]
+            try:
+                Downloader(self.connections).run(downloads)
+            except (OSError, http.client.HTTPException):
+                print('Unable to retrieve the data.')
+            except DownloadError as e:
+                print(e.message)
 
     def get_file_info_output(self, c):
         doc_name = f"{c['documents']} documents, "
@@ -190,17 +212,11 @@ class OpusGet:
         """Output corpus file information/data."""
         try:
             if self.list_languages:
-                if self.local_db:
-                    languages = self.dbo.run_languages_query(self.parameters)
-                else:
-                    languages = self.get_response(self.url+'languages=True')['languages']
+                languages = self.get_languages()
                 print(', '.join([str(l) for l in languages]))
                 return
             elif self.list_corpora:
-                if self.local_db:
-                    corpus_list = self.dbo.run_corpora_query(self.parameters)
-                else:
-                    corpus_list = self.get_response(self.url+'corpora=True')['corpora']
+                corpus_list = self.get_corpus_list()
                 print(', '.join([str(c) for c in corpus_list]))
                 return
             else:
@@ -1,24 +1,281 @@
+import io
 import os
+import sys
+import json
 import shutil
+import time
 import zipfile
 import argparse
 import tempfile
 import re
+import collections
+import concurrent.futures
+import functools
 
+import numpy as np
 import pycld2
 from langid.langid import LanguageIdentifier, model
-identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
 
 from .parse.block_parser import Block, BlockParser
+from .parse.langid_index import LanguageIdIndex, LANGID_ATTRIBUTES
+
+class BatchLanguageIdentifier:
+
+    window = 128
+
+    def __init__(self, identifier):
+        """Classify sentences with the naive Bayes model of a langid.py
+        identifier that normalizes probabilities.
+
+        The feature counts of a window of sentences are multiplied with
+        the model weights in one matrix product instead of one product
+        per sentence. The labels and confidences are the same as the
+        ones of identifier.classify.
+
+        Arguments:
+        identifier -- langid.py LanguageIdentifier
+        """
+        self.identifier = identifier
+        # classify casts the float32 weights to float64 on every call
+        self.nb_ptc = np.asarray(identifier.nb_ptc, dtype=np.float64)
+
+    def classify_window(self, sentences):
+        """Classify at most window sentences"""
+        features = np.zeros((len(sentences), self.identifier.nb_numfeats))
+        results = [None] * len(sentences)
+        for i, sentence in enumerate(sentences):
+            try:
+                features[i] = self.identifier.instance2fv(sentence)
+            except Exception as e:
+                results[i] = e
+        probs = np.dot(features, self.nb_ptc) + self.identifier.nb_pc
+        classes = probs.argmax(1)
+        best = probs[np.arange(len(sentences)), classes]
+        with np.errstate(over='ignore'):
+            confs = 1/np.exp(probs - best[:,None]).sum(1)
+        # Normalized probabilities of nearly equal classes may be equal,
+        # and classify picks the first one of them
+        if probs.shape[1] > 1:
+            close = best - np.partition(probs, -2, axis=1)[:,-2] < 1e-6
+        else:
+            close = np.zeros(len(sentences), dtype=bool)
+        for i in range(len(sentences)):
+            if results[i] is not None:
+                continue
+            if close[i]:
+                normalized = self.identifier.norm_probs(probs[i])
+                classes[i] = np.argmax(normalized)
+                confs[i] = normalized[classes[i]]
+            results[i] = (str(self.identifier.nb_classes[classes[i]]),
+                    float(confs[i]))
+        return results
+
+    def classify(self, sentences):
+        """Return a (language, confidence) pair for each sentence, or the
+        exception raised while reading the features of the sentence"""
+        results = []
+        for i in range(0, len(sentences), self.window):
+            results += self.classify_window(sentences[i:i+self.window])
+        return results
+
+@functools.lru_cache(maxsize=None)
+def get_identifier():
+    """Return the langid.py identifier. Its model takes a second to load,
+    so it is loaded when the first sentence is classified."""
+    return LanguageIdentifier.from_modelstring(model, norm_probs=True)
+
+@functools.lru_cache(maxsize=None)
+def get_batch_identifier():
+    return BatchLanguageIdentifier(get_identifier())
+
+def __getattr__(name):
+    if name == 'identifier':
+        return get_identifier()
+    if name == 'batch_identifier':
+        return get_batch_identifier()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def detect_language(sentence, sid, suppress, lidetails=None):
+    """Assign language ids and scores to a sentence. Language ids from
+    langid.py can be given as lidetails, either as a (language,
+    confidence) pair or as an exception raised during classification."""
+    try:
+        clddetails = pycld2.detect(sentence)
+    except Exception as e:
+        if not suppress:
+            print('Sentence id <{0}>: {1}'.format(sid, e))
+        clddetails = (0, 0, ((0, 'un', 0.0), 0))
+    try:
+        if lidetails is None:
+            lidetails = get_identifier().classify(sentence)
+        elif isinstance(lidetails, Exception):
+            raise lidetails
+    except Exception as e:
+        if not suppress:
+            print('Sentence id <{0}>: {1}'.format(sid, e))
+        lidetails = ('un', 0.0)
+
+    cldlan = clddetails[2][0][1]
+    cldconf = str(round(clddetails[2][0][2]/100, 2))
+    lilan, liconf = [str(round(x,2)) if type(x) == float
+            else x for x in lidetails]
+
+    return cldlan, cldconf, lilan, liconf
+
+def detect_languages(sentences, suppress):
+    """Assign language ids and scores to a batch of (sentence, sid)
+    pairs. langid.py scores the batch with BatchLanguageIdentifier."""
+    lidetails = get_batch_identifier().classify(
+            [sentence for sentence, sid in sentences])
+    return [detect_language(sentence, sid, suppress, details)
+            for (sentence, sid), details in zip(sentences, lidetails)]
+
+class LanguageIdCache:
+
+    # Approximate memory used by the dictionary entry of a sentence
+    entry_overhead = 100
+
+    def __init__(self, max_size):
+        """Remember the language ids of sentences, so that repeated
+        sentences are detected only once. Sentences are keyed by their
+        text as it is given to the language detectors, i.e. with tokens
+        joined by single spaces and surrounding whitespace stripped.
+
+        The least recently used sentences are dropped when the cached
+        sentences and ids take more than max_size bytes.
+
+        Arguments:
+        max_size -- Maximum size of the cache in bytes
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Entries added since new_entries was set to a list
+        self.new_entries = None
+
+    def entry_size(self, sentence, ids):
+        return (sys.getsizeof(sentence) + sys.getsizeof(ids) +
+                sum(sys.getsizeof(i) for i in ids) + self.entry_overhead)
+
+    def get(self, sentence):
+        """Return the cached ids of a sentence or None"""
+        ids = self.entries.get(sentence)
+        if ids is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(sentence)
+        return ids
+
+    def put(self, sentence, ids):
+        if sentence in self.entries:
+            self.size -= self.entry_size(sentence, self.entries.pop(sentence))
+        size = self.entry_size(sentence, ids)
+        if size > self.max_size:
+            return
+        self.entries[sentence] = ids
+        self.size += size
+        if self.new_entries is not None:
+            self.new_entries.append((sentence, ids))
+        while self.size > self.max_size:
+            old_sentence, old_ids = self.entries.popitem(last=False)
+            self.size -= self.entry_size(old_sentence, old_ids)
+
+    def update(self, entries):
+        """Add (sentence, ids) pairs to the cache"""
+        for sentence, ids in entries:
+            self.put(sentence, ids)
+
+    def load(self, path):
+        """Add the entries of a cache file to the cache, if the file
+        exists"""
+        if not os.path.isfile(path):
+            return
+        with open(path, 'r', encoding='utf-8') as cache_file:
+            self.update((sentence, tuple(ids))
+                    for sentence, ids in json.load(cache_file))
+
+    def save(self, path):
+        """Write the entries to a cache file, least recently used first"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tempname = tempfile.mkstemp(dir=directory)
+        with open(fd, 'w', encoding='utf-8') as cache_file:
+            json.dump(list(self.entries.items()), cache_file,
+                    ensure_ascii=False)
+        os.replace(tempname, path)
+
+worker_cache = None
+worker_zip = None
+
+def init_worker(entries, max_size, file_path):
+    """Give a worker process its own cache with the given entries, and
+    open the zip archive once for all the files the worker processes"""
+    global worker_cache, worker_zip
+    if max_size > 0:
+        worker_cache = LanguageIdCache(max_size)
+        worker_cache.update(entries)
+    # Workers of plain xml files only detect batches of sentences
+    if zipfile.is_zipfile(file_path):
+        worker_zip = zipfile.ZipFile(file_path, 'r')
+
+def add_ids_in_worker(member, *args):
+    """Add language ids to an xml file of the zip archive of a worker
+    process"""
+    return add_ids_to_member(worker_zip, member, *args)
+
+def add_ids_to_member(zip_arc, member, suppress, preprocess,
+        sidecar=False, language_ids=None, redetect=False):
+    """Add language ids to an xml file in an open zip archive with the
+    cache of the worker process. Return the new content of the file (None
+    if sidecar is True), the language id rows of the file, the number of
+    sentences, the entries added to the cache of the worker and the number
+    of cache hits and misses."""
+    new_entries, hits, misses = [], 0, 0
+    if worker_cache:
+        worker_cache.new_entries = new_entries
+        hits, misses = worker_cache.hits, worker_cache.misses
+    with zip_arc.open(member) as infile:
+        outfile = None if sidecar else io.BytesIO()
+        sparser = LanguageIdAdder(infile, outfile, suppress, True,
+                preprocess, cache=worker_cache, language_ids=language_ids,
+                redetect=redetect)
+        sparser.addIds()
+    if worker_cache:
+        worker_cache.new_entries = None
+        hits, misses = worker_cache.hits-hits, worker_cache.misses-misses
+    output = None if sidecar else outfile.getvalue()
+    return (output, sparser.rows, sparser.sentence_count, new_entries, hits,
+            misses)
 
 class LanguageIdAdder(BlockParser):
 
-    def __init__(self, document, out_file, suppress, iszip, preprocessing):
+    batch_size = 1000
+
+    def __init__(self, document, out_file, suppress, iszip, preprocessing,
+            executor=None, workers=1, cache=None, language_ids=None,
+            redetect=False):
         """Add language ids and confidence scores to sentences in a xml file.
 
+        Sentences are detected in batches of batch_size. The output is
+        kept in memory until the sentences of the batch have their ids.
+        The ids of all sentences are also collected in rows as (sentence
+        id, cld2, cld2conf, langid, langidconf).
+
         Positional arguments:
+        out_file -- Output file, or None to only collect the rows
         suppress -- Suppress errors in language identification
         iszip -- Parse zip file (bytes) instead of plain text
+
+        Keyword arguments:
+        executor -- Process pool that detects the batches
+        workers -- Number of processes in the pool
+        cache -- LanguageIdCache for the ids of repeated sentences
+        language_ids -- Dictionary of sentence id: (cld2, cld2conf, langid,
+            langidconf) for sentences that are not detected again
+        redetect -- Detect also sentences that already have language id
+            attributes. By default, their attributes are kept.
         """
 
         data_tag = 'w'
@@ -32,6 +289,21 @@ class LanguageIdAdder(BlockParser):
 
         self.s_blocks = []
 
+        self.executor = executor
+        self.workers = workers
+        self.cache = cache
+        self.language_ids = language_ids
+        self.redetect = redetect
+        # Output strings and the blocks of sentences waiting for their ids
+        self.pending = []
+        self.sentences = []
+        # Known ids of the waiting sentences, None for the ones to detect
+        self.given = []
+        self.rows = []
+        # Detected batches that are not written yet
+        self.detected = collections.deque()
+        self.sentence_count = 0
+
         def start_element(name, attrs):
             """Update current block"""
             sub_block = Block(parent=self.block, name=name, attributes=attrs)
@@ -56,30 +328,125 @@ class LanguageIdAdder(BlockParser):
         self.p.StartElementHandler = start_element
         self.p.EndElementHandler = end_element
         self.p.CharacterDataHandler = char_data
+        # char_data strips each piece of character data separately
+        self.p.buffer_text = False
+
+    def read_data(self):
+        """Read one line at a time, as the handlers write the output while
+        the blocks of the line are processed"""
+        return self.document.readline()
 
     def write_to_out(self, output):
+        if self.out_file is None:
+            return
+        if self.sentences or self.detected:
+            self.pending.append(output)
+            return
         if self.iszip:
             output = bytes(output, 'utf-8')
         self.out_file.write(output)
 
+    def format_s(self, s_blocks, ids):
+        """Return a sentence and its tokens with language ids added"""
+        cl, cc, ll, lc = ids
+        output = []
+        for block in s_blocks:
+            if block.name == 's':
+                block.attributes['cld2'] = cl
+                block.attributes['cld2conf'] = cc
+                block.attributes['langid'] = ll
+                block.attributes['langidconf'] = lc
+                attr_str = ' '.join([f'{k}="{v}"' for k, v in block.attributes.items()])
+                output.append(f'<{block.name} {attr_str}>{block.data}\n')
+            else:
+                attr_str = ' '.join([f'{k}="{v}"' for k, v in block.attributes.items()])
+                output.append(f'<{block.name} {attr_str}>{block.data}</{block.name}>\n')
+        output.append('</s>\n')
+        return ''.join(output)
+
+    def write_batch(self, pending, ids):
+        for s_blocks, details in zip([item for item in pending
+                if not isinstance(item, str)], ids):
+            self.rows.append((s_blocks[0].attributes['id'],) + tuple(details))
+        if self.out_file is None:
+            return
+        ids = iter(ids)
+        output = ''.join([item if isinstance(item, str)
+            else self.format_s(item, next(ids)) for item in pending])
+        if self.iszip:
+            output = bytes(output, 'utf-8')
+        self.out_file.write(output)
+
+    def lookup(self, sentences, given):
+        """Return the given or cached ids of a batch of sentences, with None
+        for the other sentences, and the (sentence, sid) pairs that have to
+        be detected. Repeated sentences are detected once."""
+        ids = list(given)
+        if self.cache is None:
+            return ids, [pair for pair, details in zip(sentences, ids)
+                    if details is None]
+        missing = {}
+        for i, (sentence, sid) in enumerate(sentences):
+            if ids[i] is not None:
+                continue
+            if sentence in missing:
+                self.cache.hits += 1
+                continue
+            ids[i] = self.cache.get(sentence)
+            if ids[i] is None:
+                missing[sentence] = sid
+        return ids, list(missing.items())
+
+    def fill(self, sentences, ids, missing, detected):
+        """Complete the ids of a batch with the detected ids of the missing
+        sentences, and add the detected ids to the cache"""
+        if self.cache is None:
+            detected = iter(detected)
+            return [details if details is not None else next(detected)
+                    for details in ids]
+        detected = dict(zip([sentence for sentence, sid in missing],
+            detected))
+        self.cache.update(detected.items())
+        return [details if details is not None else detected[sentence]
+                for (sentence, sid), details in zip(sentences, ids)]
+
+    def flush(self, wait=False):
+        """Detect the languages of the pending sentences and write the
+        pending output. With a process pool, up to 2*workers batches are
+        detected at the same time, and they are written in order."""
+        if self.sentences:
+            self.sentence_count += len(self.sentences)
+            ids, missing = self.lookup(self.sentences, self.given)
+            future = None
+            if self.executor and missing:
+                future = self.executor.submit(detect_languages, missing,
+                        self.suppress)
+            elif missing:
+                ids = self.fill(self.sentences, ids, missing,
+                        self.detect_languages(missing))
+            self.detected.append(
+                    (self.pending, self.sentences, ids, missing, future))
+            self.pending, self.sentences, self.given = [], [], []
+        while self.detected and (wait or not self.detected[0][4] or
+                len(self.detected) >= 2*self.workers):
+            pending, sentences, ids, missing, future = self.detected.popleft()
+            if future:
+                ids = self.fill(sentences, ids, missing, future.result())
+            self.write_batch(pending, ids)
+        if wait and self.pending:
+            self.write_batch(self.pending, [])
+            self.pending = []
+
     def xml_parse(self, block, sentence):
         if block.name == 's':
             sid = block.attributes['id']
             sentence.append(block.data.strip())
             sentence = ' '.join(sentence)
-            cl, cc, ll, lc = self.detectLanguage(sentence, sid)
-            for block in self.s_blocks:
-                if block.name == 's':
-                    block.attributes['cld2'] = cl
-                    block.attributes['cld2conf'] = cc
-                    block.attributes['langid'] = ll
-                    block.attributes['langidconf'] = lc
-                    attr_str = ' '.join([f'{k}="{v}"' for k, v in block.attributes.items()])
-                    self.write_to_out(f'<{block.name} {attr_str}>{block.data}\n')
-                else:
-                    attr_str = ' '.join([f'{k}="{v}"' for k, v in block.attributes.items()])
-                    self.write_to_out(f'<{block.name} {attr_str}>{block.data}</{block.name}>\n')
-            self.write_to_out('</s>\n')
+            self.pending.append(self.s_blocks)
+            self.sentences.append((sentence, sid))
+            self.given.append(self.given_ids(block))
+            if len(self.sentences) == self.batch_size:
+                self.flush()
 
             sentence = []
             self.s_blocks = []
@@ -90,27 +457,26 @@ class LanguageIdAdder(BlockParser):
                 sentence.append(data)
         return sentence
 
+    def given_ids(self, block):
+        """Return the known language ids of an <s> block or None"""
+        details = None
+        if self.language_ids is not None:
+            details = self.language_ids.get(block.attributes['id'])
+        if details is None and not self.redetect:
+            try:
+                details = tuple(block.attributes[name]
+                        for name in LANGID_ATTRIBUTES)
+            except KeyError:
+                pass
+        return details
+
     def detectLanguage(self, sentence, sid):
         """Assign language ids and scores to a sentence."""
-        try:
-            clddetails = pycld2.detect(sentence)
-        except Exception as e:
-            if not self.suppress:
-                print('Sentence id <{0}>: {1}'.format(sid, e))
-            clddetails = (0, 0, ((0, 'un', 0.0), 0))
-        try:
-            lidetails = identifier.classify(sentence)
-        except Exception as e:
-            if not self.suppress:
-                print('Sentence id <{0}>: {1}'.format(sid, e))
-            lidetails = ('un', 0.0)
-
-        cldlan = clddetails[2][0][1]
-        cldconf = str(round(clddetails[2][0][2]/100, 2))
-        lilan, liconf = [str(round(x,2)) if type(x) == float
-                else x for x in lidetails]
+        return detect_language(sentence, sid, self.suppress)
 
-        return cldlan, cldconf, lilan, liconf
+    def detect_languages(self, sentences):
+        """Assign language ids and scores to a batch of sentences."""
+        return detect_languages(sentences, self.suppress)
 
     def addIds(self):
         """Add language ids to sentences in an xml file."""
@@ -121,19 +487,49 @@ class LanguageIdAdder(BlockParser):
             for block in blocks:
                 sentence = self.xml_parse(block, sentence)
             blocks, cur_pos = self.get_complete_blocks(0)
+        self.flush(wait=True)
 
 class OpusLangid:
 
+    large_member_size = 64*1024*1024
+    # Seconds between commits of finished xml files to the index
+    checkpoint_interval = 10
+
     def __init__(self, file_path=None, target_file_path=None, verbosity=0,
-            suppress_errors=False, preprocess='xml'):
+            suppress_errors=False, preprocess='xml', workers=1,
+            cache_size=64, cache_file=None, sidecar=False, redetect=False):
         """Add language ids and confidence scores to sentences in plain xml
         files or xml file in zip archives.
 
+        The language ids of each finished xml file of a zip archive are
+        recorded in a temporary language id index (file_path +
+        ".langid.tmp"). If the run is interrupted, the next run takes the
+        ids of the finished files from the index instead of detecting them
+        again.
+
         Keyword arguments:
         file_path -- Path to the file where language ids will be added
         target_file -- Path to the output file
         verbosity -- Report progress during language identification
         suppress_errors -- Suppress errors in language detection
+        workers -- Number of processes for language identification
+            (default 1). Xml files in zip archives are processed in
+            parallel, and the sentences of plain xml files and of xml files
+            larger than large_member_size are detected in parallel batches.
+        cache_size -- Size of the cache for the ids of repeated sentences
+            in megabytes (default 64). The cache is shared by all xml files
+            of a zip archive. 0 disables the cache.
+        cache_file -- Load the cache from this file if it exists, and save
+            the cache to it afterwards
+        sidecar -- Write the language ids to a language id index next to
+            the file (file_path + ".langid") instead of adding them to the
+            xml files. The file itself is not changed, and opus_read reads
+            the ids from the index when sentences are filtered by language.
+            If the index exists, only the xml files that are not in the
+            index, or that have changed, are processed.
+        redetect -- Detect the languages of all sentences again. By
+            default, sentences that already have language id attributes
+            keep them, and finished files are taken from the index.
         """
 
         self.file_path = file_path
@@ -141,40 +537,212 @@ class OpusLangid:
         self.verbosity = verbosity
         self.suppress_errors = suppress_errors
         self.preprocess = preprocess
+        self.workers = workers
+        self.sentence_count = 0
+        self.cache_file = cache_file
+        self.sidecar = sidecar
+        self.redetect = redetect
+        self.index = None
+        self.finished = {}
+        self.last_commit = 0
+        self.cache = None
+        if cache_size > 0:
+            self.cache = LanguageIdCache(int(cache_size*1024*1024))
 
-    def processFiles(self):
-        """Add language ids and confidence score to xml files."""
+    def finished_ids(self, zip_info):
+        """Return the language ids of an xml file that is finished in the
+        index as a dictionary of sentence id: ids, or None if the file is
+        not finished or has changed"""
+        if self.finished.get(zip_info.filename) != zip_info.CRC:
+            return None
+        return {row[0]: tuple(row[1:])
+                for row in self.index.get_rows(zip_info.filename)}
+
+    def finish_member(self, zip_info, rows, resumed):
+        """Record the language ids of a processed xml file in the index,
+        and commit the index every checkpoint_interval seconds"""
+        if not resumed:
+            self.index.add_member(zip_info.filename, rows, zip_info.CRC)
+        if time.time() - self.last_commit >= self.checkpoint_interval:
+            self.index.commit()
+            self.last_commit = time.time()
+
+    def process_member(self, zip_arc, new_arc, zip_info, executor=None):
+        """Add language ids to an xml file in a zip archive and write it to
+        the new archive. Other files are copied as they are. In sidecar
+        mode, the ids are only recorded in the index."""
+        is_xml = zip_info.filename[-4:] == '.xml'
+        language_ids = self.finished_ids(zip_info) if is_xml else None
+        if self.sidecar and (not is_xml or language_ids is not None):
+            return
+        if self.verbosity > 0:
+            print(zip_info.filename)
+        if not is_xml:
+            with zip_arc.open(zip_info.filename) as infile:
+                new_bytes = b''.join(infile.readlines())
+            new_arc.writestr(zip_info, new_bytes)
+            return
+        outfile = None
+        if not self.sidecar:
+            tempxml = tempfile.mkstemp()
+            outfile = open(tempxml[0], 'wb')
+        try:
+            with zip_arc.open(zip_info.filename) as infile:
+                sparser = LanguageIdAdder(infile, outfile,
+                    self.suppress_errors, True, self.preprocess,
+                    executor, self.workers, self.cache, language_ids,
+                    self.redetect)
+                sparser.addIds()
+        finally:
+            if outfile:
+                outfile.close()
+        if not self.sidecar:
+            new_arc.write(tempxml[1], zip_info.filename)
+            os.remove(tempxml[1])
+        self.sentence_count += sparser.sentence_count
+        self.finish_member(zip_info, sparser.rows, language_ids is not None)
+
+    def process_members_in_parallel(self, zip_arc, new_arc, executor):
+        """Add language ids to the xml files of a zip archive in worker
+        processes, and write the files to the new archive in their original
+        order. Files larger than large_member_size are processed in this
+        process with their sentence batches detected in the workers."""
+        pending = collections.deque()
+
+        def write_next():
+            zip_info, future, resumed = pending.popleft()
+            if not future:
+                self.process_member(zip_arc, new_arc, zip_info, executor)
+                return
+            if self.verbosity > 0:
+                print(zip_info.filename)
+            output, rows, sentence_count, new_entries, hits, misses = \
+                    future.result()
+            if not self.sidecar:
+                new_arc.writestr(zip_info.filename, output)
+            self.sentence_count += sentence_count
+            self.finish_member(zip_info, rows, resumed)
+            if self.cache:
+                self.cache.update(new_entries)
+                self.cache.hits += hits
+                self.cache.misses += misses
+
+        for zip_info in zip_arc.filelist:
+            future = None
+            language_ids = None
+            if (zip_info.filename[-4:] == '.xml' and
+                    zip_info.file_size < self.large_member_size):
+                language_ids = self.finished_ids(zip_info)
+                if self.sidecar and language_ids is not None:
+                    continue
+                future = executor.submit(add_ids_in_worker,
+                        zip_info.filename, self.suppress_errors,
+                        self.preprocess, self.sidecar, language_ids,
+                        self.redetect)
+            pending.append((zip_info, future, language_ids is not None))
+            while pending and (len(pending) > 2*self.workers or
+                    not pending[0][1]):
+                write_next()
+        while pending:
+            write_next()
+
+    def process_file(self, executor):
+        """Add language ids to the xml files of a zip archive or to a plain
+        xml file. Return the name of the temporary file where the new file
+        is written, or None in sidecar mode. The ids of a plain xml file
+        are stored in the index under the name of the file."""
+        tempname = None
+        if not self.sidecar:
+            fd, tempname = tempfile.mkstemp()
+            os.close(fd)
         try:
-            tempname = tempfile.mkstemp()
             with zipfile.ZipFile(self.file_path, 'r') as zip_arc:
-                with zipfile.ZipFile(tempname[1], 'w') as new_arc:
-                    for filename in zip_arc.filelist:
-                        if self.verbosity > 0:
-                            print(filename.filename)
-                        tempxml = tempfile.mkstemp()
-                        if filename.filename[-4:] == '.xml':
-                            with zip_arc.open(filename.filename) as infile, open(tempxml[1], 'wb') as outfile:
-                                sparser = LanguageIdAdder(infile, outfile,
-                                    self.suppress_errors, True, self.preprocess)
-                                sparser.addIds()
-                            new_arc.write(tempxml[1], filename.filename)
-                        else:
-                            with zip_arc.open(filename.filename) as infile:
-                                new_bytes = b''.join(infile.readlines())
-                            new_arc.writestr(filename, new_bytes)
-                        os.remove(tempxml[1])
+                new_arc = None
+                if tempname:
+                    new_arc = zipfile.ZipFile(tempname, 'w')
+                try:
+                    if executor:
+                        self.process_members_in_parallel(zip_arc, new_arc,
+                                executor)
+                    else:
+                        for zip_info in zip_arc.filelist:
+                            self.process_member(zip_arc, new_arc, zip_info)
+                finally:
+                    if new_arc:
+                        new_arc.close()
         except zipfile.BadZipfile:
-            tempname = tempfile.mkstemp()
-            with open(tempname[1], 'w') as outfile:
+            outfile = None
+            if tempname:
+                outfile = open(tempname, 'w')
+            try:
                 with open(self.file_path, 'r') as infile:
                     sparser = LanguageIdAdder(infile, outfile,
-                            self.suppress_errors, False, self.preprocess)
+                            self.suppress_errors, False, self.preprocess,
+                            executor, self.workers, self.cache,
+                            redetect=self.redetect)
                     sparser.addIds()
+            finally:
+                if outfile:
+                    outfile.close()
+            if self.sidecar:
+                self.index.add_member(os.path.basename(self.file_path),
+                        sparser.rows)
+            self.sentence_count += sparser.sentence_count
+        return tempname
+
+    def processFiles(self):
+        """Add language ids and confidence score to xml files."""
+        start = time.time()
+        self.sentence_count = 0
+        if self.cache and self.cache_file:
+            self.cache.load(self.cache_file)
+        executor = None
+        if self.workers > 1:
+            # Forked workers share the model of this process
+            get_batch_identifier()
+            entries, max_size = [], 0
+            if self.cache:
+                entries = list(self.cache.entries.items())
+                max_size = self.cache.max_size
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers,
+                    initializer=init_worker,
+                    initargs=(entries, max_size, self.file_path))
+        self.index = LanguageIdIndex.resume(self.file_path, self.preprocess,
+                restart=self.redetect)
+        self.finished = self.index.get_members()
+        self.last_commit = time.time()
+        try:
+            tempname = self.process_file(executor)
+        except BaseException:
+            # Keep the finished files for the next run
+            self.index.commit()
+            self.index.close()
+            self.index = None
+            raise
+        finally:
+            if executor:
+                executor.shutdown()
+        index, self.index = self.index, None
 
-        if self.target_file_path:
-            shutil.move(tempname[1], self.target_file_path)
+        if self.sidecar:
+            index.finish(self.file_path).close()
         else:
-            os.remove(self.file_path)
-            shutil.move(tempname[1], self.file_path)
+            if self.target_file_path:
+                shutil.move(tempname, self.target_file_path)
+            else:
+                os.remove(self.file_path)
+                shutil.move(tempname, self.file_path)
+            index.discard()
 
+        if self.cache and self.cache_file:
+            self.cache.save(self.cache_file)
 
+        if self.verbosity > 0:
+            elapsed = time.time() - start
+            print('{} sentences in {:.2f} seconds ({:.1f} sentences/second)'
+                    .format(self.sentence_count, elapsed,
+                        self.sentence_count/elapsed if elapsed else 0))
+            if self.cache:
+                print('Cache: {} hits, {} misses, {} sentences'.format(
+                    self.cache.hits, self.cache.misses,
+                    len(self.cache.entries)))
@@ -1,11 +1,22 @@
+import collections
+import concurrent.futures
+import io
 import logging
 import os
+import queue
 import re
 import sys
 import tempfile
-
-from .parse.alignment_parser import AlignmentParser
-from .parse.sentence_parser import SentenceParser, SentenceParserError
+import threading
+import zipfile
+
+from .parse.alignment_parser import AlignmentParser, IndexedAlignmentParser, \
+    attribute_add_type
+from .parse.alignment_index import AlignmentIndex
+from .parse.sentence_parser import SentenceParser, SentenceParserError, \
+    IndexedSentenceParser
+from .parse.sentence_scanner import SentenceScanner
+from .parse.langid_index import LanguageIdReader
 from .util import file_open
 from .formatting import *
 from .opus_file_handler import OpusFileHandler
@@ -33,8 +44,42 @@ def skip_regex_type(n, N):
     return nothing
 
 
+SentencePair = collections.namedtuple('SentencePair', ['src', 'trg',
+    'src_ids', 'trg_ids', 'link_attrs', 'src_doc', 'trg_doc'])
+
+worker_read = None
+
+def init_worker(arguments, zip_names):
+    """Create the reader of a worker process"""
+    global worker_read
+    arguments = dict(arguments, write=None, write_ids=None, verbose=False,
+            workers=1)
+    worker_read = OpusReadWorker(**arguments)
+    # Workers are only started for chunks that need their sentences
+    worker_read.read_sentences = True
+    worker_read.of_handler.src_zip_name = zip_names[0]
+    worker_read.of_handler.trg_zip_name = zip_names[1]
+
+def read_chunk_in_worker(chunk, pair_reader='format_pairs'):
+    """Read the sentence pairs of a chunk in a worker process with the
+    OpusRead method named by pair_reader. Return an error message, the number of
+    links and the pairs."""
+    try:
+        link_list = worker_read.read_chunk(*chunk)
+    except (KeyError, SentenceParserError) as e:
+        return e.args[0], 0, []
+    return None, len(link_list), list(getattr(worker_read, pair_reader)(link_list))
+
+
 class OpusRead:
 
+    # Number of chunks that the reader and writer threads of the pipeline
+    # keep ready
+    read_ahead = 4
+    write_ahead = 4
+    # Largest zip member that the reader thread decompresses into memory
+    prefetch_size = 16*1024*1024
+
     def __init__(
             self, directory=None, source=None, target=None,
             release='latest', preprocess='xml', maximum=-1, src_range='all',
@@ -49,7 +94,10 @@ class OpusRead:
             src_cld2=None, trg_cld2=None, src_langid=None, trg_langid=None,
             write_ids=None, suppress_prompts=False, download_dir='.',
             preserve_inline_tags=False, n=None, N=None, chunk_size=1000000,
-            doc_level=False, len_name=50, verbose=False):
+            doc_level=False, len_name=50, verbose=False, workers=1,
+            pipeline=False, compress_level=None,
+            compress_block_size=1048576, remote=False,
+            cache_dir='~/.OpusTools/cache'):
         """Read xces alignment files and xml sentence files and output in
         desired format.
 
@@ -98,8 +146,27 @@ class OpusRead:
         doc_level -- Print full documents
         len_name -- Show the first N characters of file names when displaying progress
         verbose -- Print progress messages
+        workers -- Number of processes that read and format document pairs
+            in parallel (default 1)
+        pipeline -- Collect the links of the next chunks and decompress
+            their sentence documents in a reader thread, and write the
+            output in a writer thread, while the current chunk is parsed
+        compress_level -- Compression level of .gz, .xz and .zst output
+            files
+        compress_block_size -- Output files ending in .gz, .xz or .zst are
+            compressed in independent blocks of this many bytes in a pool
+            of threads (default 1048576). 0 writes .gz and .xz files as one
+            stream on a single thread.
+        remote -- Read missing corpus files from OPUS with http range
+            requests instead of downloading them
+        cache_dir -- Directory where blocks of remote files and OPUS API
+            responses are cached (default ~/.OpusTools/cache)
         """
 
+        # Worker processes create their own OpusRead from the same arguments
+        self.arguments = {key: value for key, value in locals().items()
+                if key != 'self'}
+
         self.doc_level = doc_level
         self.len_name = len_name
 
@@ -174,6 +241,11 @@ class OpusRead:
         self.skip_doc = skip_regex_type(n, N)
 
         self.chunk_size = chunk_size
+        self.workers = workers
+        self.pipeline = pipeline
+        self.compress_level = compress_level
+        self.compress_block_size = compress_block_size
+        self.failed_links = 0
 
         self.add_file_header = file_header_type(write_mode, write, source)
         self.add_doc_names = doc_name_type(write_mode, write, print_file_names)
@@ -192,14 +264,22 @@ class OpusRead:
             form_sent_langs = [self.fromto[1], self.fromto[0]]
         format_sentences = sentence_format_type(write_mode, form_sent_langs)
 
-        check_filters, self.check_lang = check_lang_conf_type(lang_filters)
+        self.check_filters, self.check_lang = check_lang_conf_type(
+                lang_filters)
         self.format_pair = pair_format_type(
-                write_mode, self.switch_langs, check_filters, self.check_lang,
+                write_mode, self.switch_langs, self.check_filters, self.check_lang,
                 format_sentences)
+        self.read_sentences = write_mode != 'links' or self.check_lang
+
+        self.src_parser = None
+        self.trg_parser = None
+        self.src_parser_doc = None
+        self.trg_parser_doc = None
 
         self.of_handler = OpusFileHandler(
                 download_dir, source_zip, target_zip, directory, release,
-                preprocess, self.fromto, suppress_prompts)
+                preprocess, self.fromto, suppress_prompts, remote,
+                cache_dir)
 
         if preprocess == 'moses':
             if self.write_mode != 'moses':
@@ -212,10 +292,32 @@ class OpusRead:
         if write_mode == "links" or write_ids is not None:
             store_attrs = True
 
-        self.alignment = self.of_handler.open_alignment_file(self.alignment)
-        self.alignmentParser = AlignmentParser(
-            self.alignment, (src_range, tgt_range), attribute, threshold,
+        parser_args = ((src_range, tgt_range), attribute, threshold,
             store_attrs, leave_non_alignments_out, self.len_name)
+        self.open_alignment_parser(parser_args, n or N)
+
+    def open_alignment_parser(self, parser_args, skip_docs):
+        """Open the alignment file and its parser. If documents are skipped
+        and the alignment file is indexed, read only the linkGrps of the
+        documents that are not skipped."""
+        self.alignment = self.of_handler.open_alignment_file(self.alignment)
+
+        alignment_index = None
+        if skip_docs:
+            alignment_index = AlignmentIndex.load(self.alignment.name)
+        if alignment_index:
+            link_groups = [(offset, length) for from_doc, _, _, offset, length
+                in alignment_index.get_link_groups()
+                if from_doc and not self.skip_doc(from_doc)]
+            alignment_index.close()
+            self.alignment.close()
+            self.alignment = file_open(self.alignment.name, 'rb',
+                    memory_map=True)
+            self.alignmentParser = IndexedAlignmentParser(
+                self.alignment, link_groups, *parser_args)
+        else:
+            self.alignmentParser = AlignmentParser(
+                self.alignment, *parser_args)
 
     def doc_level_link_list(self, link_list, src_parser, trg_parser):
         new_link_list = []
@@ -244,6 +346,479 @@ class OpusRead:
             new_link_list.append(('', tid))
         return new_link_list
 
+    def open_sentence_parser(self, parser, doc_name, direction, anno_attrs,
+            doc=None):
+        """Close the document of the previous parser and return a new
+        sentence parser for doc_name, or for doc, a (document, size) pair,
+        if the document has already been opened. If the sentences are filtered by language ids
+        and the zip file has a language id index, the ids are read from the
+        index, and in links mode the document is not parsed at all."""
+        if parser:
+            parser.close_document()
+        language_ids = None
+        if self.check_lang:
+            language_ids = self.of_handler.get_language_ids(
+                    doc_name, direction)
+            if language_ids is not None and self.write_mode == 'links':
+                return LanguageIdReader(language_ids)
+        if doc is None:
+            doc = self.of_handler.open_sentence_file(doc_name, direction)
+        doc, doc_size = doc
+        parser_args = {'preprocessing': self.preprocess,
+            'anno_attrs': anno_attrs, 'preserve': self.preserve,
+            'delimiter': self.annot_delimiter, 'doc_level': self.doc_level,
+            'len_name': self.len_name, 'language_ids': language_ids,
+            'doc_size': doc_size}
+        if not self.doc_level:
+            offsets = self.of_handler.get_sentence_offsets(doc, direction)
+            if offsets:
+                return IndexedSentenceParser(doc, offsets, **parser_args)
+            if self.preprocess in ['xml', 'raw'] and not self.preserve:
+                return SentenceScanner(doc, **parser_args)
+        return SentenceParser(doc, **parser_args)
+
+    def build_indexes(self):
+        """Build an index of linkGrps for the alignment file and sentence
+        indexes for the source and target zip files. Later runs use the
+        indexes to seek directly to the documents and sentences that are
+        needed."""
+        if self.preprocess == 'moses':
+            logger.warning('Indexes are not used with moses preprocessing.')
+            return
+        self.alignmentParser.close_document()
+        alignment_index = AlignmentIndex.build(self.alignment.name, self.verbose)
+        alignment_index.close()
+        logger.info('Alignment index written to %s', alignment_index.index_file)
+        index_names = self.of_handler.build_sentence_indexes(self.verbose)
+        logger.info('Sentence indexes written to %s', ', '.join(index_names))
+        self.of_handler.close_zipfiles()
+
+    def next_chunk_size(self, collected):
+        """Return the number of links to collect next, or None if no more
+        links are needed. If every collected link is printed, only the
+        remaining number of links and their sentences need to be read."""
+        chunk_size = self.chunk_size
+        if self.maximum > 0 and not self.check_lang and not self.doc_level:
+            remaining = self.maximum - collected
+            if remaining < 1:
+                return None
+            if chunk_size < 1 or remaining < chunk_size:
+                chunk_size = remaining
+        return chunk_size
+
+    def collect_chunk(self, cur_pos, chunk_size):
+        """Collect the next chunk of links from a document pair that is not
+        skipped"""
+        while True:
+            chunk = self.alignmentParser.collect_links(
+                    cur_pos, chunk_size, self.verbose)
+            if self.verbose:
+                print("", file=sys.stderr)
+            src_doc_name, cur_pos = chunk[4], chunk[6]
+            if not src_doc_name or not self.skip_doc(src_doc_name):
+                return chunk
+
+    def read_chunk(self, link_list, src_set, trg_set, src_doc_name,
+            trg_doc_name, src_doc=None, trg_doc=None):
+        """Store the sentences of a chunk and return the links to be
+        formatted. Parsers are kept open between chunks of the same
+        document so that the document is read only once. src_doc and
+        trg_doc are (document, size) pairs opened ahead by the reader
+        thread of the pipeline; they are closed if no new parser is
+        needed."""
+        if self.read_sentences:
+            try:
+                if src_doc_name != self.src_parser_doc:
+                    self.src_parser_doc = None
+                    self.src_parser = self.open_sentence_parser(
+                        self.src_parser, src_doc_name, 'src',
+                        self.src_annot, src_doc)
+                    self.src_parser_doc = src_doc_name
+                    src_doc = None
+                if trg_doc_name != self.trg_parser_doc:
+                    self.trg_parser_doc = None
+                    self.trg_parser = self.open_sentence_parser(
+                        self.trg_parser, trg_doc_name, 'trg',
+                        self.trg_annot, trg_doc)
+                    self.trg_parser_doc = trg_doc_name
+                    trg_doc = None
+            finally:
+                for doc in (src_doc, trg_doc):
+                    if doc:
+                        doc[0].close()
+
+            try:
+                self.src_parser.store_next_sentences(
+                        src_set, verbose=self.verbose)
+                self.trg_parser.store_next_sentences(
+                        trg_set, verbose=self.verbose)
+            except SentenceParserError:
+                self.src_parser_doc, self.trg_parser_doc = None, None
+                raise
+
+        if self.doc_level and self.write_mode != 'links':
+            link_list = self.doc_level_link_list(
+                    link_list, self.src_parser, self.trg_parser)
+
+        return link_list
+
+    def format_pairs(self, link_list):
+        """Yield the index and the formatted source and target of each link
+        that passes the language filters"""
+        for i, link_a in enumerate(link_list):
+            src_result, trg_result = self.format_pair(
+                    link_a, self.src_parser, self.trg_parser, self.fromto)
+            if src_result == -1:
+                continue
+            yield i, src_result, trg_result
+
+    def sentence_pairs(self, link_list):
+        """Yield the index, the source and target sentences and the source
+        and target ids of each link that passes the language filters"""
+        for i, link_a in enumerate(link_list):
+            src_ids = link_a[0].split()
+            trg_ids = link_a[1].split()
+            src_sentences, src_attrs = self.src_parser.read_sentence(src_ids)
+            trg_sentences, trg_attrs = self.trg_parser.read_sentence(trg_ids)
+            if self.check_filters(src_attrs, trg_attrs):
+                continue
+            yield i, src_sentences, trg_sentences, src_ids, trg_ids
+
+    def read_chunks(self, pair_reader='format_pairs'):
+        """Yield the document names, link attributes, number of links and
+        sentence pairs of each chunk. The pairs are produced by the method
+        named by pair_reader."""
+        cur_pos = 0
+        collected = 0
+        while True:
+            chunk_size = self.next_chunk_size(collected)
+            if chunk_size is None:
+                break
+            link_list, src_set, trg_set, attrs_list, src_doc_name, \
+                trg_doc_name, cur_pos = self.collect_chunk(cur_pos, chunk_size)
+            if not src_doc_name:
+                break
+            try:
+                link_list = self.read_chunk(link_list, src_set, trg_set,
+                        src_doc_name, trg_doc_name)
+            except (KeyError, SentenceParserError) as e:
+                print('\n'+e.args[0]+'\nContinuing from next sentence file pair.', file=sys.stderr)
+                continue
+            collected += len(link_list)
+            yield (src_doc_name, trg_doc_name, attrs_list, len(link_list),
+                    getattr(self, pair_reader)(link_list))
+
+    def read_chunks_in_parallel(self, pair_reader='format_pairs'):
+        """Yield the same chunks as read_chunks, but read and format the
+        sentence pairs in a pool of worker processes. The alignment file is
+        read in this process and the chunks are yielded in alignment order.
+        The zip files are opened, and downloaded if necessary, before the
+        workers are started."""
+        if not self.of_handler.zip_opened:
+            self.of_handler.open_zipfiles()
+        zip_names = (self.of_handler.src_zip.filename,
+                self.of_handler.trg_zip.filename)
+
+        with concurrent.futures.ProcessPoolExecutor(self.workers,
+                initializer=init_worker,
+                initargs=(self.arguments, zip_names)) as executor:
+            pending = collections.deque()
+            cur_pos = 0
+            collected = 0
+            end = False
+            try:
+                while True:
+                    chunk_size = self.next_chunk_size(collected)
+                    # A chunk cut by maximum waits for the earlier chunks,
+                    # as chunks that fail to read change its size
+                    if (not end and chunk_size is not None and
+                            len(pending) < 2*self.workers and
+                            (chunk_size == self.chunk_size or not pending)):
+                        link_list, src_set, trg_set, attrs_list, \
+                            src_doc_name, trg_doc_name, cur_pos = \
+                            self.collect_chunk(cur_pos, chunk_size)
+                        if not src_doc_name:
+                            end = True
+                            continue
+                        future = executor.submit(read_chunk_in_worker,
+                                (link_list, src_set, trg_set, src_doc_name,
+                                trg_doc_name), pair_reader)
+                        pending.append((future, src_doc_name, trg_doc_name,
+                            attrs_list, len(link_list)))
+                        collected += len(link_list)
+                        continue
+                    if not pending:
+                        break
+                    future, src_doc_name, trg_doc_name, attrs_list, \
+                        len_collected = pending.popleft()
+                    message, len_link_list, pairs = future.result()
+                    if message:
+                        print('\n'+message+'\nContinuing from next sentence file pair.', file=sys.stderr)
+                        collected -= len_collected
+                        continue
+                    yield (src_doc_name, trg_doc_name, attrs_list,
+                            len_link_list, pairs)
+            finally:
+                for future, *_ in pending:
+                    future.cancel()
+
+    def prefetch_document(self, doc_name, direction):
+        """Open a sentence document in the reader thread of the pipeline.
+        Zip members up to prefetch_size are read into memory, so that they
+        are decompressed while the main thread parses the previous chunks.
+        Return a (document, size) pair, or None if the document is read through a sentence index or
+        cannot be opened; the main thread then opens it as usual."""
+        index = (self.of_handler.src_index if direction == 'src'
+                else self.of_handler.trg_index)
+        if index is not None:
+            return None
+        try:
+            doc, doc_size = self.of_handler.open_sentence_file(
+                    doc_name, direction)
+        except KeyError:
+            return None
+        if (isinstance(doc, zipfile.ZipExtFile) and
+                doc_size <= self.prefetch_size):
+            data = io.BytesIO(doc.read())
+            data.name = doc.name
+            doc.close()
+            return data, doc_size
+        return doc, doc_size
+
+    def collect_chunks_ahead(self, chunks, stop):
+        """Collect the chunks of links in the reader thread of the
+        pipeline and put them to the chunks queue with the prefetched
+        documents of each new document pair. None is put at the end, and
+        an exception if reading fails. The size of the last chunk before
+        maximum depends on the chunks that could not be read, so it is
+        collected only after the main thread has read the earlier
+        chunks."""
+        cur_pos = 0
+        collected = 0
+        src_doc_name, trg_doc_name = None, None
+        try:
+            while not stop.is_set():
+                chunk_size = self.next_chunk_size(
+                        collected - self.failed_links)
+                if chunk_size != self.chunk_size:
+                    chunks.join()
+                    chunk_size = self.next_chunk_size(
+                            collected - self.failed_links)
+                    if chunk_size is None:
+                        break
+                chunk = self.collect_chunk(cur_pos, chunk_size)
+                cur_pos = chunk[6]
+                if not chunk[4]:
+                    break
+                collected += len(chunk[0])
+                src_doc, trg_doc = None, None
+                if self.read_sentences and self.write_mode != 'links':
+                    if chunk[4] != src_doc_name:
+                        src_doc = self.prefetch_document(chunk[4], 'src')
+                    if chunk[5] != trg_doc_name:
+                        trg_doc = self.prefetch_document(chunk[5], 'trg')
+                src_doc_name, trg_doc_name = chunk[4], chunk[5]
+                chunks.put((chunk, src_doc, trg_doc))
+        except BaseException as e:
+            chunks.put(e)
+            return
+        chunks.put(None)
+
+    def read_chunks_ahead(self, pair_reader='format_pairs'):
+        """Yield the same chunks as read_chunks, but collect the links and
+        open the sentence documents in a reader thread, which keeps
+        read_ahead chunks ready while the current chunk is parsed. The
+        pairs of each chunk are returned as a list. The zip files are
+        opened, and downloaded if necessary, before the thread is
+        started."""
+        if self.read_sentences and not self.of_handler.zip_opened:
+            self.of_handler.open_zipfiles()
+        chunks = queue.Queue(self.read_ahead)
+        stop = threading.Event()
+        self.failed_links = 0
+        reader = threading.Thread(target=self.collect_chunks_ahead,
+                args=(chunks, stop), daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = chunks.get()
+                try:
+                    if item is None:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    (link_list, src_set, trg_set, attrs_list, src_doc_name,
+                        trg_doc_name, _), src_doc, trg_doc = item
+                    try:
+                        link_list = self.read_chunk(link_list, src_set,
+                                trg_set, src_doc_name, trg_doc_name,
+                                src_doc, trg_doc)
+                    except (KeyError, SentenceParserError) as e:
+                        print('\n'+e.args[0]+'\nContinuing from next sentence file pair.', file=sys.stderr)
+                        self.failed_links += len(link_list)
+                        continue
+                    pairs = list(getattr(self, pair_reader)(link_list))
+                finally:
+                    chunks.task_done()
+                yield (src_doc_name, trg_doc_name, attrs_list, len(link_list),
+                        pairs)
+        finally:
+            stop.set()
+            while reader.is_alive() or not chunks.empty():
+                try:
+                    item = chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if isinstance(item, tuple):
+                    for doc in item[1:]:
+                        if doc:
+                            doc[0].close()
+                chunks.task_done()
+            reader.join()
+
+    def close_sentence_parsers(self):
+        for parser in (self.src_parser, self.trg_parser):
+            if parser:
+                parser.close_document()
+        self.src_parser, self.trg_parser = None, None
+        self.src_parser_doc, self.trg_parser_doc = None, None
+
+    def iter_pairs(self):
+        """Yield the sentence pairs as SentencePair tuples instead of
+        writing them. Each tuple holds the source and target text, the
+        source and target sentence ids, the link attributes and the source
+        and target document names. The sentences of a pair are joined with
+        spaces. Links are read in chunks of chunk_size, so only the current
+        chunk is held in memory.
+
+        The write and write_mode arguments are ignored, and the files are
+        closed when the generator is exhausted or closed. Moses
+        preprocessing is not supported.
+        """
+        if self.preprocess == 'moses':
+            raise ValueError(
+                'iter_pairs is not available for moses preprocessing')
+
+        self.alignmentParser.add_attributes = attribute_add_type(True)
+        self.read_sentences = True
+
+        if self.workers > 1:
+            chunks = self.read_chunks_in_parallel('sentence_pairs')
+        elif self.pipeline:
+            chunks = self.read_chunks_ahead('sentence_pairs')
+        else:
+            chunks = self.read_chunks('sentence_pairs')
+
+        total = 0
+        try:
+            for src_doc_name, trg_doc_name, attrs_list, len_link_list, pairs \
+                    in chunks:
+                for i, src_sentences, trg_sentences, src_ids, trg_ids in pairs:
+                    # Document level pairs do not correspond to links
+                    link_attr = None
+                    if not self.doc_level and i < len(attrs_list):
+                        link_attr = attrs_list[i]
+                    if self.switch_langs:
+                        yield SentencePair(' '.join(trg_sentences),
+                                ' '.join(src_sentences), trg_ids, src_ids,
+                                link_attr, trg_doc_name, src_doc_name)
+                    else:
+                        yield SentencePair(' '.join(src_sentences),
+                                ' '.join(trg_sentences), src_ids, trg_ids,
+                                link_attr, src_doc_name, trg_doc_name)
+                    total += 1
+                    if total == self.maximum:
+                        return
+        finally:
+            chunks.close()
+            self.close_sentence_parsers()
+            self.alignmentParser.close_document()
+            self.of_handler.close_zipfiles()
+
+    def write_chunks(self, chunks, resultfile, mosessrc, mosestrg, id_file):
+        """Write the sentence pairs of the chunks until maximum pairs have
+        been written"""
+        total = 0
+        stop = False
+
+        for src_doc_name, trg_doc_name, attrs_list, len_link_list, pairs \
+                in chunks:
+            self.add_doc_names(
+                src_doc_name, trg_doc_name, resultfile, mosessrc, mosestrg)
+
+            for i, src_result, trg_result in pairs:
+                if self.verbose:
+                    if i % 1000 == 0 or i + 1 == len_link_list:
+                        progress = str(round((i+1)/len_link_list*100, 2))
+                        print("\x1b[2KWriting chunk ... {}%".format(progress), end="\r", file=sys.stderr)
+
+                link_attr = attrs_list[i] if i < len(attrs_list) else None
+
+                self.out_put_pair(
+                    src_result, trg_result, resultfile, mosessrc, mosestrg,
+                    link_attr, id_file, src_doc_name, trg_doc_name)
+
+                total += 1
+                if total == self.maximum:
+                    stop = True
+                    break
+
+            self.add_doc_ending(resultfile)
+
+            if self.verbose and self.write:
+                print("\033[F\033[F\033[F", end="", file=sys.stderr)
+
+            if stop:
+                return
+
+    def write_chunks_in_thread(self, chunks, *files):
+        """Write the chunks with write_chunks in the writer thread of the
+        pipeline, which is passed write_ahead chunks at a time. Reading
+        stops when the writer has written maximum pairs, and an exception
+        raised in the writer is raised again here."""
+        pending = queue.Queue(self.write_ahead)
+        done = threading.Event()
+        errors = []
+
+        def queued_chunks():
+            while True:
+                chunk = pending.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        def write():
+            queued = queued_chunks()
+            try:
+                self.write_chunks(queued, *files)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                done.set()
+                # Take the remaining chunks so that the main thread is not
+                # blocked
+                for chunk in queued:
+                    pass
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            for chunk in chunks:
+                if done.is_set():
+                    break
+                pending.put(chunk)
+        finally:
+            pending.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+
+    def open_output(self, file_name):
+        """Open an output file, compressed by its extension"""
+        return file_open(file_name, mode='w', encoding='utf-8',
+                compresslevel=self.compress_level,
+                block_size=self.compress_block_size)
+
     def printPairs(self):
         logger.debug("printPairs called!")
         resultfile = None
@@ -252,14 +827,14 @@ class OpusRead:
         id_file = None
 
         if self.write_ids:
-            id_file = file_open(self.write_ids, 'w', encoding='utf-8')
+            id_file = self.open_output(self.write_ids)
 
         if self.write:
             if self.write_mode == 'moses' and len(self.write) == 2:
-                mosessrc = file_open(self.write[0], mode='w', encoding='utf-8')
-                mosestrg = file_open(self.write[1], mode='w', encoding='utf-8')
+                mosessrc = self.open_output(self.write[0])
+                mosestrg = self.open_output(self.write[1])
             else:
-                resultfile = file_open(self.write[0], mode='w', encoding='utf-8')
+                resultfile = self.open_output(self.write[0])
 
         if self.preprocess == 'moses':
             # If preprocessing is moses, download
@@ -291,105 +866,30 @@ class OpusRead:
 
         self.add_file_header(resultfile)
 
-        src_parser = None
-        trg_parser = None
-
-        total = 0
-        stop = False
-        cur_pos = 0
-
-        prev_src_doc_name = None
-        prev_trg_doc_name = None
-        src_doc_size = -1
-        trg_doc_size = -1
-
-        while True:
-            link_list, src_set, trg_set, attrs_list, src_doc_name, trg_doc_name, cur_pos = \
-                self.alignmentParser.collect_links(cur_pos, self.chunk_size, self.verbose)
-
-            if src_doc_name != prev_src_doc_name:
-                src_doc_size = -1
-            prev_src_doc_name = src_doc_name
-            if trg_doc_name != prev_trg_doc_name:
-                trg_doc_size = -1
-            prev_trg_doc_name = trg_doc_name
-
-            if self.verbose:
-                print("", file=sys.stderr)
-
-            if not src_doc_name:
-                break
-
-            if self.skip_doc(src_doc_name):
-                continue
-
-            if (self.write_mode != 'links' or
-                    (self.write_mode == 'links' and self.check_lang)):
-                try:
-                    src_doc = self.of_handler.open_sentence_file(src_doc_name, 'src')
-                    trg_doc = self.of_handler.open_sentence_file(trg_doc_name, 'trg')
-                except KeyError as e:
-                    print('\n'+e.args[0]+'\nContinuing from next sentence file pair.', file=sys.stderr)
-                    continue
-
-                try:
-                    src_parser = SentenceParser(
-                        src_doc, preprocessing=self.preprocess, anno_attrs=self.src_annot,
-                        preserve=self.preserve, delimiter=self.annot_delimiter, doc_level=self.doc_level, len_name=self.len_name)
-                    src_doc_size = src_parser.store_sentences(src_set, src_doc_size, self.verbose)
-                    trg_parser = SentenceParser(
-                        trg_doc, preprocessing=self.preprocess, anno_attrs=self.trg_annot,
-                        preserve=self.preserve, delimiter=self.annot_delimiter, doc_level=self.doc_level, len_name=self.len_name)
-                    trg_doc_size = trg_parser.store_sentences(trg_set, trg_doc_size, self.verbose)
-                except SentenceParserError as e:
-                    print('\n'+e.message+'\nContinuing from next sentence file pair.', file=sys.stderr)
-                    continue
-
-            self.add_doc_names(
-                src_doc_name, trg_doc_name, resultfile, mosessrc, mosestrg)
-
-            if self.doc_level and self.write_mode != 'links':
-                link_list = self.doc_level_link_list(link_list, src_parser, trg_parser)
-
-            len_link_list = len(link_list)
-
-            for i, link_a in enumerate(link_list):
-                if self.verbose:
-                    if i % 1000 == 0 or i + 1 == len_link_list:
-                        progress = str(round((i+1)/len_link_list*100, 2))
-                        print("\x1b[2KWriting chunk ... {}%".format(progress), end="\r", file=sys.stderr)
-
-                src_result, trg_result = self.format_pair(
-                        link_a, src_parser, trg_parser, self.fromto)
-
-                if src_result == -1:
-                    continue
-
-                link_attr = attrs_list[i] if i < len(attrs_list) else None
-
-                self.out_put_pair(
-                    src_result, trg_result, resultfile, mosessrc, mosestrg,
-                    link_attr, id_file, src_doc_name, trg_doc_name)
-
-                total += 1
-                if total == self.maximum:
-                    stop = True
-                    break
-
-            self.add_doc_ending(resultfile)
-
-            if self.verbose and self.write:
-                print("\033[F\033[F\033[F", end="", file=sys.stderr)
+        if self.workers > 1 and self.read_sentences:
+            chunks = self.read_chunks_in_parallel()
+        elif self.pipeline:
+            chunks = self.read_chunks_ahead()
+        else:
+            chunks = self.read_chunks()
 
-            if stop:
-                break
+        try:
+            if self.pipeline:
+                self.write_chunks_in_thread(chunks, resultfile, mosessrc,
+                        mosestrg, id_file)
+            else:
+                self.write_chunks(chunks, resultfile, mosessrc, mosestrg,
+                        id_file)
+        finally:
+            chunks.close()
 
         if self.verbose and self.write:
             print("\n\n", file=sys.stderr)
 
         self.add_file_ending(resultfile)
 
-        self.alignmentParser.bp.close_document()
+        self.close_sentence_parsers()
+        self.alignmentParser.close_document()
 
         if self.write:
             if self.write_mode == 'moses' and mosessrc:
@@ -402,3 +902,10 @@ class OpusRead:
             id_file.close()
 
         self.of_handler.close_zipfiles()
+
+
+class OpusReadWorker(OpusRead):
+
+    def open_alignment_parser(self, parser_args, skip_docs):
+        """Workers receive their links from the main process and do not
+        read the alignment file"""
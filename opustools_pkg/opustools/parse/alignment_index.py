@@ -0,0 +1,51 @@
+import sys
+
+import xml.parsers.expat
+
+from .sidecar_index import SidecarIndex, SidecarIndexError, scan_elements
+from ..util import file_open
+
+
+class AlignmentIndex(SidecarIndex):
+
+    schema = ['CREATE TABLE linkgrp (position integer PRIMARY KEY, '
+            'from_doc text, to_doc text, links integer, offset integer, '
+            'length integer)']
+
+    def __init__(self, index_file):
+        """Index of linkGrp elements in an xces alignment file.
+
+        The index stores the fromDoc and toDoc attributes, the number of
+        links and the byte offset and length in the uncompressed
+        alignment file of each linkGrp.
+
+        Arguments:
+        index_file -- Path to the index file
+        """
+        super().__init__(index_file)
+
+    @classmethod
+    def build(cls, alignment_name, verbose=False):
+        """Index all linkGrps in an alignment file and return the index"""
+        index = cls.create(alignment_name)
+        if verbose:
+            print('Indexing "{}" ...'.format(alignment_name), file=sys.stderr)
+        with file_open(alignment_name, 'rb', memory_map=True) as alignment:
+            try:
+                spans = scan_elements(alignment, 'linkGrp', 'link')
+            except xml.parsers.expat.ExpatError as e:
+                index.discard()
+                raise SidecarIndexError(
+                    "Alignment file '{name}' could not be indexed: "
+                    "{error}".format(name=alignment_name, error=e.args[0]))
+        index.conn.executemany('INSERT INTO linkgrp VALUES (?, ?, ?, ?, ?, ?)',
+                [(i, attrs.get('fromDoc'), attrs.get('toDoc'), links, offset,
+                    length) for i, (attrs, offset, length, links)
+                    in enumerate(spans)])
+        return index.finish(alignment_name)
+
+    def get_link_groups(self):
+        """Return (fromDoc, toDoc, number of links, offset, length) of
+        each linkGrp in file order"""
+        return self.conn.execute('SELECT from_doc, to_doc, links, offset, '
+                'length FROM linkgrp ORDER BY position').fetchall()
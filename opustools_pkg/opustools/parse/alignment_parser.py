@@ -1,4 +1,7 @@
+import io
+
 from .block_parser import BlockParser, BlockParserError
+from ..util import compressed_file
 
 class AlignmentParserError(Exception):
 
@@ -66,11 +69,10 @@ class AlignmentParser:
 
         self.alignment_file = alignment_file
 
-        self.alignment_file.seek(0, 2)
-        self.af_size = self.alignment_file.tell()
-        self.alignment_file.seek(0)
-
+        self.len_name = len_name
         self.bp = BlockParser(alignment_file, len_name=len_name)
+        self.af_size = self.bp.doc_size
+        self.pending_blocks = []
         self.filters = []
 
         src_range, trg_range = src_trg_range
@@ -116,17 +118,23 @@ class AlignmentParser:
         src_id_set, trg_id_set = set(), set()
         src_doc, trg_doc = None, None
 
+        # Blocks left over from the previous chunk are processed first
+        blocks = self.pending_blocks
+        self.pending_blocks = []
         try:
-            blocks, cur_pos = self.bp.get_complete_blocks(cur_pos, verbose)
+            if not blocks:
+                blocks, cur_pos = self.bp.get_complete_blocks(cur_pos, verbose)
             while blocks:
-                for block in blocks:
+                for i, block in enumerate(blocks):
                     if block.name == 'link':
                         self.add_link(block, link_list, src_id_set, trg_id_set, attrs)
                         if len(link_list) == chunk_size:
+                            self.pending_blocks = blocks[i+1:]
                             src_doc = block.parent.attributes['fromDoc']
                             trg_doc = block.parent.attributes['toDoc']
                             return link_list, src_id_set, trg_id_set, attrs, src_doc, trg_doc, cur_pos
                     elif block.name == 'linkGrp':
+                        self.pending_blocks = blocks[i+1:]
                         src_doc = block.attributes['fromDoc']
                         trg_doc = block.attributes['toDoc']
                         return link_list, src_id_set, trg_id_set, attrs, src_doc, trg_doc, cur_pos
@@ -137,3 +145,51 @@ class AlignmentParser:
 
         return link_list, src_id_set, trg_id_set, attrs, src_doc, trg_doc, cur_pos
 
+    def close_document(self):
+        self.bp.close_document()
+
+
+class IndexedAlignmentParser(AlignmentParser):
+
+    def __init__(self, alignment_file, link_groups, *args, **kwargs):
+        """Parse only the given linkGrps of an xces alignment file using
+        byte offsets from an alignment index.
+
+        Arguments:
+        alignment_file -- Alignment file opened in binary mode
+        link_groups -- List of (offset, length) of the linkGrps to be
+            parsed, in file order
+        Other arguments are passed to AlignmentParser.
+        """
+
+        super().__init__(alignment_file, *args, **kwargs)
+        self.link_groups = list(link_groups)
+        self.link_groups.reverse()
+        self.open_fragment(b'')
+
+    def open_fragment(self, data):
+        """Parse the given bytes next"""
+        fragment = io.BytesIO(data)
+        fragment.name = self.alignment_file.name
+        self.bp = BlockParser(fragment, doc_size=self.af_size,
+                len_name=self.len_name)
+        self.pending_blocks = []
+        self.bp.compressed_file = compressed_file(self.alignment_file)
+
+    def next_link_group(self):
+        """Read the next linkGrp and return its offset"""
+        offset, length = self.link_groups.pop()
+        self.alignment_file.seek(offset)
+        self.open_fragment(self.alignment_file.read(length))
+        return offset
+
+    def collect_links(self, cur_pos=0, chunk_size=1000000, verbose=False):
+        """Collect links for the next linkGrp in link_groups"""
+        while True:
+            result = super().collect_links(cur_pos, chunk_size, verbose)
+            if result[4] is not None or not self.link_groups:
+                return result
+            cur_pos = self.next_link_group()
+
+    def close_document(self):
+        self.alignment_file.close()
@@ -1,7 +1,8 @@
+import io
 import sys
 
 import xml.parsers.expat
-from ..util import file_open
+from ..util import file_open, compressed_file, file_size
 
 
 class BlockParserError(Exception):
@@ -16,6 +17,8 @@ class BlockParserError(Exception):
 
 class Block:
 
+    __slots__ = ('parent', 'name', 'data', 'attributes')
+
     def __init__(self, parent=None, name=None, data='', attributes=None):
         """Xml block instance held in memory by BlockParser"""
         self.parent = parent
@@ -44,9 +47,14 @@ class Block:
 
 class BlockParser:
 
+    first_read_size = 8192
+    read_size = 65536
+
     def __init__(self, document, data_tag=None, doc_size=-1, len_name=-1):
-        """Parse an xml document line by line removing each element
-        from memory as soon as its end tag is found.
+        """Parse an xml document in blocks of bytes removing each element
+        from memory as soon as its end tag is found. The block size starts
+        from first_read_size and doubles up to read_size, so that reading
+        only the beginning of a document stays cheap.
 
         Positional arguments:
         document -- Xml document to be parsed
@@ -54,33 +62,48 @@ class BlockParser:
         """
 
         self.document = document
+        # Text documents are read as bytes and decoded by expat
+        self.stream = document
+        if isinstance(document, io.TextIOWrapper):
+            self.stream = document.buffer
+        # Memory mapped files are fed to expat without copying
+        self.read = getattr(self.stream, 'read_view', self.stream.read)
+        self.next_read_size = self.first_read_size
         self.data_tag = data_tag
         self.len_name = len_name
         self.block = Block(name='root')
         self.completeBlocks = []
 
+        # Progress of gzip files is measured in compressed bytes so that
+        # the file does not need to be decompressed to find out its size
+        self.compressed_file = compressed_file(document)
         if doc_size == -1:
-            print(f'Measuring file "{document.name[:self.len_name]}" ...', end="\r", file=sys.stderr)
-            self.document.seek(0, 2)
-            self.doc_size = self.document.tell()
-            self.document.seek(0)
+            self.doc_size = file_size(document)
         else:
             self.doc_size = doc_size
 
+        # Character data of the open data_tag elements, joined when the
+        # element ends
+        data_parts = []
+
         def start_element(name, attrs):
             """Update current block"""
-            sub_block = Block(parent=self.block, name=name, attributes=attrs)
-            self.block = sub_block
+            self.block = Block(self.block, name, '', attrs)
+            if name == data_tag:
+                data_parts.append([])
 
         def end_element(name):
             """Update complete blocks, and move up one level on block tree"""
-            self.completeBlocks.append(self.block)
-            self.block = self.block.parent
+            block = self.block
+            if name == data_tag:
+                block.data = ''.join(data_parts.pop())
+            self.completeBlocks.append(block)
+            self.block = block.parent
 
         def char_data(data):
             """Update current block's character data"""
-            if self.block.name == self.data_tag:
-                self.block.data += data
+            if self.block.name == data_tag:
+                data_parts[-1].append(data)
 
         self.p = xml.parsers.expat.ParserCreate()
 
@@ -88,6 +111,7 @@ class BlockParser:
         self.p.EndElementHandler = end_element
         if data_tag:
             self.p.CharacterDataHandler = char_data
+            self.p.buffer_text = True
 
     def parse_line(self, line):
         try:
@@ -102,31 +126,39 @@ class BlockParser:
         self.document.close()
 
     def report_progress(self, cur_pos):
+        if self.compressed_file:
+            cur_pos = self.compressed_file.tell()
         progress = str(round(cur_pos/self.doc_size*100, 2) if self.doc_size > 0 else 0)
         print("\x1b[2KParsing file \"{}\" ... {}%".format(self.document.name[:self.len_name], progress), end="\r", file=sys.stderr)
 
+    def read_data(self):
+        """Return the next piece of the document to be parsed"""
+        data = self.read(min(self.next_read_size, self.read_size))
+        self.next_read_size *= 2
+        return data
+
     def get_complete_blocks(self, cur_pos, verbose=False):
         """
-        Read lines until one or more end tags are found on a single line,
-        and return the block trees corresponding to those end tags.
+        Read data until one or more end tags are found, and return the
+        block trees corresponding to all end tags found in the data.
 
         cur_pos -- Current position in file
         verbose -- Print progress messages
         """
 
-        for line in self.document:
-            if verbose:
-                if cur_pos%10000 == 0 or cur_pos == self.doc_size:
+        while not self.completeBlocks:
+            data = self.read_data()
+            if not data:
+                if verbose:
                     self.report_progress(cur_pos)
-            cur_pos += len(line)
-            self.parse_line(line)
-            if len(self.completeBlocks) > 0:
-                ret_blocks = self.completeBlocks
-                self.completeBlocks = []
-                return ret_blocks, cur_pos
-        if verbose:
-            self.report_progress(cur_pos)
-        return None, cur_pos
+                return None, cur_pos
+            cur_pos += len(data)
+            self.parse_line(data)
+            if verbose:
+                self.report_progress(cur_pos)
+        ret_blocks = self.completeBlocks
+        self.completeBlocks = []
+        return ret_blocks, cur_pos
 
     @staticmethod
     def tag_in_parents(tag, block):
@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import sqlite3
+import zlib
+
+from .sidecar_index import SidecarIndex
+
+LANGID_ATTRIBUTES = ('cld2', 'cld2conf', 'langid', 'langidconf')
+
+class LanguageIdIndex(SidecarIndex):
+
+    extension = '.langid'
+    schema = ['CREATE TABLE langid (member text PRIMARY KEY, crc integer, '
+            'sentences blob)']
+
+    def __init__(self, index_file):
+        """Language ids and confidence scores of the sentences of xml
+        documents in a zip file, stored next to the zip file instead of as
+        attributes of the <s> elements.
+
+        Each zip member has one compressed array of (sentence id, cld2,
+        cld2conf, langid, langidconf) rows and the CRC-32 of the member, so
+        that an unfinished index can be completed later.
+
+        Arguments:
+        index_file -- Path to the index file
+        """
+        super().__init__(index_file)
+
+    @classmethod
+    def resume(cls, file_name, preprocess, restart=False):
+        """Return an unfinished index of a file with documents of the given
+        preprocessing type: the temporary index of an interrupted run, a
+        copy of an earlier index of the file, or a new index if restart is
+        True or there is no index to continue"""
+        index_file = cls.index_name(file_name)
+        temp_file = index_file + '.tmp'
+        if restart:
+            return cls.start(file_name, preprocess)
+        if not os.path.isfile(temp_file) and os.path.isfile(index_file):
+            shutil.copyfile(index_file, temp_file)
+        if os.path.isfile(temp_file):
+            index = cls(temp_file)
+            try:
+                meta = dict(index.conn.execute('SELECT key, value FROM meta'))
+                index.get_members()
+                if meta.get('preprocess') == preprocess:
+                    index.conn.execute('DELETE FROM meta '
+                            'WHERE key != "preprocess"')
+                    return index
+            except sqlite3.DatabaseError:
+                pass
+            index.close()
+        return cls.start(file_name, preprocess)
+
+    @classmethod
+    def start(cls, file_name, preprocess):
+        """Return a new empty index for documents of the given
+        preprocessing type"""
+        index = cls.create(file_name)
+        index.conn.execute('INSERT INTO meta VALUES (?, ?)',
+                ('preprocess', preprocess))
+        return index
+
+    def add_member(self, member, rows, crc=None):
+        """Store the (sentence id, cld2, cld2conf, langid, langidconf) rows
+        and the CRC-32 of a zip member"""
+        data = zlib.compress(json.dumps(rows, ensure_ascii=False,
+            separators=(',', ':')).encode('utf-8'))
+        self.conn.execute('INSERT OR REPLACE INTO langid VALUES (?, ?, ?)',
+                (member, crc, data))
+
+    def get_members(self):
+        """Return a dictionary of member: CRC-32 of the members in the
+        index"""
+        return dict(self.conn.execute('SELECT member, crc FROM langid'))
+
+    def get_rows(self, member):
+        """Return the (sentence id, cld2, cld2conf, langid, langidconf) rows
+        of a zip member, or None if the member is not in the index"""
+        row = self.conn.execute('SELECT sentences FROM langid '
+                'WHERE member = ?', (member,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def get_language_ids(self, member):
+        """Return a dictionary of sentence id: language id attributes for a
+        zip member, or None if the member is not in the index"""
+        rows = self.get_rows(member)
+        if rows is None:
+            return None
+        return {row[0]: dict(zip(LANGID_ATTRIBUTES, row[1:])) for row in rows}
+
+    def commit(self):
+        self.conn.commit()
+
+class LanguageIdReader:
+
+    def __init__(self, language_ids):
+        """Read the language id attributes of sentences from a language id
+        index in place of a sentence parser, when the sentences themselves
+        are not needed.
+
+        Arguments:
+        language_ids -- Dictionary of sentence id: language id attributes
+        """
+        self.language_ids = language_ids
+        self.doc_level_ids = []
+
+    def store_next_sentences(self, id_set, doc_size=-1, verbose=False):
+        return doc_size
+
+    def read_sentence(self, ids):
+        """Return empty sentences and the language id attributes of the
+        given sentence ids"""
+        if len(ids) == 0 or ids[0] == '':
+            return '', []
+        return ['']*len(ids), [self.language_ids.get(sid, {}) for sid in ids]
+
+    def close_document(self):
+        pass
@@ -0,0 +1,68 @@
+import sys
+import zipfile
+
+import xml.parsers.expat
+
+from .sidecar_index import SidecarIndex, SidecarIndexError, scan_elements
+from ..util import open_zip_member
+
+
+def scan_sentences(document, read_size=1048576):
+    """Return (sentence id, byte offset, byte length) of each <s> element
+    in a binary xml document"""
+    return [(attrs['id'], offset, length) for attrs, offset, length, _
+            in scan_elements(document, 's', read_size=read_size)
+            if 'id' in attrs]
+
+class SentenceIndex(SidecarIndex):
+
+    schema = ['CREATE TABLE sentence (member text, sid text, '
+            'offset integer, length integer, PRIMARY KEY(member, sid)) '
+            'WITHOUT ROWID']
+
+    def __init__(self, index_file):
+        """Index of sentence byte offsets for xml documents in a zip file.
+
+        The index maps each sentence id of each zip member to the byte
+        offset and length of the <s> element in the uncompressed member.
+
+        Arguments:
+        index_file -- Path to the index file
+        """
+        super().__init__(index_file)
+
+    @classmethod
+    def build(cls, zip_name, verbose=False):
+        """Index all xml documents in a zip file and return the index"""
+        index = cls.create(zip_name)
+        cur = index.conn.cursor()
+        with zipfile.ZipFile(zip_name, 'r') as zip_arc:
+            for info in zip_arc.infolist():
+                if not info.filename.endswith('.xml'):
+                    continue
+                if verbose:
+                    print('\x1b[2KIndexing "{}" ...'.format(info.filename),
+                            end='\r', file=sys.stderr)
+                with open_zip_member(zip_arc, info.filename) as document:
+                    try:
+                        spans = scan_sentences(document)
+                    except xml.parsers.expat.ExpatError as e:
+                        index.discard()
+                        raise SidecarIndexError(
+                            "Document '{document}' could not be indexed: "
+                            "{error}".format(document=info.filename,
+                                error=e.args[0]))
+                cur.executemany('INSERT OR REPLACE INTO sentence VALUES '
+                        '(?, ?, ?, ?)', [(info.filename,)+s for s in spans])
+        if verbose:
+            print('', file=sys.stderr)
+        return index.finish(zip_name)
+
+    def get_offsets(self, member):
+        """Return a dictionary of sentence id: (offset, length) for a zip
+        member, or None if the member is not indexed"""
+        rows = self.conn.execute('SELECT sid, offset, length FROM sentence '
+                'WHERE member = ?', (member,)).fetchall()
+        if not rows:
+            return None
+        return {sid: (offset, length) for sid, offset, length in rows}
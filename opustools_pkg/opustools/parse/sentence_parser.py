@@ -1,3 +1,4 @@
+import io
 import sys
 
 from .block_parser import BlockParser, BlockParserError
@@ -209,7 +210,8 @@ def parse_type(preprocess, preserve, get_annotations):
 class SentenceParser:
 
     def __init__(self, document, preprocessing=None, anno_attrs=['all_attrs'],
-            delimiter='|', preserve=None, doc_level=False, len_name=50):
+            delimiter='|', preserve=None, doc_level=False, len_name=50,
+            language_ids=None, doc_size=-1):
         """Parse xml sentence files that have sentence ids in any order.
 
         Arguments:
@@ -220,9 +222,15 @@ class SentenceParser:
         preserve -- Preserve inline tags
         doc_level -- Print whole documents
         len_name -- Show the first N characters of file names when displaying progress
+        language_ids -- Dictionary of sentence id: language id attributes
+            that replace the same attributes in the document
+        doc_size -- Size of the document for progress reports, -1 to
+            measure it from the document
         """
 
         self.document = document
+        self.doc_size = doc_size
+        self.language_ids = language_ids
         self.delimiter = delimiter
         self.anno_attrs = anno_attrs
         self.doc_level = doc_level
@@ -240,38 +248,94 @@ class SentenceParser:
         if preprocessing == 'raw':
             self.data_tag = 's'
 
+        self.bp = None
+        self.cur_pos = 0
+        self.pending_blocks = []
+        self.passed_ids = set()
+        self.sentence = []
+        self.exhausted = False
+
     def store_sentences(self, id_set, doc_size, verbose=False):
         """Read document and store sentences in a dictionary."""
-        bp = BlockParser(self.document, data_tag=self.data_tag, doc_size=doc_size, len_name=self.len_name)
-        sentence = []
-        sid = None
+        doc_size = self.store_next_sentences(id_set, doc_size, verbose)
+        self.close_document()
+        return doc_size
 
-        cur_pos = 0
+    def store_next_sentences(self, id_set, doc_size=-1, verbose=False):
+        """Store sentences for the next chunk of links in the document.
 
-        stop = False
+        Parsing continues from where the previous call stopped, and
+        sentences not included in id_set are dropped. The document is
+        read again from the beginning only if id_set contains sentences
+        that were already passed by earlier calls.
+        """
+        if self.bp is None:
+            if doc_size == -1:
+                doc_size = self.doc_size
+            self.bp = BlockParser(self.document, data_tag=self.data_tag,
+                    doc_size=doc_size, len_name=self.len_name)
+        elif not self.doc_level:
+            self.sentences = {sid: self.sentences[sid] for sid in id_set
+                    if sid in self.sentences}
+            for sid in id_set:
+                if sid in self.passed_ids and sid not in self.sentences:
+                    self.rewind()
+                    break
+
+        if self.exhausted or (len(self.sentences) == len(id_set) and
+                not self.doc_level):
+            return self.bp.doc_size
 
         try:
-            blocks, cur_pos = bp.get_complete_blocks(cur_pos, verbose)
-            while blocks and not stop:
-                for block in blocks:
-                    if self.doc_level:
-                        sentence = self.parse_block(
-                                bp, block, sentence, self.sentences, id_set, self.doc_level_ids)
-                    else:
-                        sentence = self.parse_block(
-                                bp, block, sentence, self.sentences, id_set)
-                    if len(self.sentences) == len(id_set) and not self.doc_level:
-                        stop = True
-                        break
-                blocks, cur_pos= bp.get_complete_blocks(cur_pos, verbose)
-            bp.close_document()
+            self.parse_sentences(id_set, verbose)
             if verbose:
-                bp.report_progress(cur_pos)
+                self.bp.report_progress(self.cur_pos)
                 print("", file=sys.stderr)
         except BlockParserError as e:
             raise SentenceParserError(
                 'Error while parsing sentence file: {error}'.format(error=e.args[0]))
-        return bp.doc_size
+        return self.bp.doc_size
+
+    def parse_sentences(self, id_set, verbose=False):
+        """Parse blocks until all sentences in id_set are found or the
+        document ends. Blocks left over from a read are kept for the next
+        call."""
+        blocks = self.pending_blocks
+        self.pending_blocks = []
+        if not blocks:
+            blocks, self.cur_pos = self.bp.get_complete_blocks(self.cur_pos, verbose)
+        while blocks:
+            for i, block in enumerate(blocks):
+                if self.doc_level:
+                    self.sentence = self.parse_block(self.bp, block,
+                            self.sentence, self.sentences, id_set, self.doc_level_ids)
+                else:
+                    self.sentence = self.parse_block(self.bp, block,
+                            self.sentence, self.sentences, id_set)
+                    if block.name == 's':
+                        self.passed_ids.add(block.attributes['id'])
+                    if len(self.sentences) == len(id_set):
+                        self.pending_blocks = blocks[i+1:]
+                        return
+            blocks, self.cur_pos = self.bp.get_complete_blocks(self.cur_pos, verbose)
+        self.exhausted = True
+
+    def rewind(self):
+        """Start parsing the document again from the beginning."""
+        self.document.seek(0)
+        self.bp = BlockParser(self.document, data_tag=self.data_tag,
+                doc_size=self.bp.doc_size, len_name=self.len_name)
+        self.cur_pos = 0
+        self.pending_blocks = []
+        self.passed_ids = set()
+        self.sentence = []
+        self.exhausted = False
+
+    def close_document(self):
+        if self.bp:
+            self.bp.close_document()
+        else:
+            self.document.close()
 
     def get_annotations(self, block):
         annotations = ''
@@ -302,7 +366,67 @@ class SentenceParser:
         attrsList = []
         for sid in ids:
             newSentence, attrs = self.get_sentence(sid)
+            if self.language_ids is not None:
+                attrs = {**attrs, **self.language_ids.get(sid, {})}
             sentence.append(newSentence)
             attrsList.append(attrs)
 
         return sentence, attrsList
+
+
+class IndexedSentenceParser(SentenceParser):
+
+    def __init__(self, document, offsets, **kwargs):
+        """Parse only the sentences that are needed from an xml sentence
+        file using byte offsets from a sentence index.
+
+        The sentences of each call are read in the order of their
+        offsets, so a deflated zip member is decompressed at most once
+        per call. A sentence that lies before the sentences of the
+        previous call is a backward seek, which decompresses the member
+        again from the start; this happens only when the links of a
+        document are not in the order of the sentences.
+
+        Arguments:
+        document -- Xml file to be parsed, opened in binary mode
+        offsets -- Dictionary of sentence id: (byte offset, byte length)
+        Other keyword arguments are passed to SentenceParser.
+        """
+
+        super().__init__(document, **kwargs)
+        self.offsets = offsets
+
+    def store_next_sentences(self, id_set, doc_size=-1, verbose=False):
+        """Read the <s> elements of the sentences in id_set and store the
+        sentences. Sentences not included in id_set are dropped."""
+        self.sentences = {sid: self.sentences[sid] for sid in id_set
+                if sid in self.sentences}
+        spans = sorted(self.offsets[sid] for sid in id_set
+                if sid in self.offsets and sid not in self.sentences)
+        if not spans:
+            return 0
+
+        fragments = [b'<fragments>']
+        for offset, length in spans:
+            self.document.seek(offset)
+            fragments.append(self.document.read(length))
+        fragments.append(b'</fragments>')
+        fragment_doc = io.BytesIO(b''.join(fragments))
+        fragment_doc.name = self.document.name
+
+        self.bp = BlockParser(fragment_doc, data_tag=self.data_tag,
+                doc_size=0, len_name=self.len_name)
+        self.cur_pos = 0
+        self.pending_blocks = []
+        self.passed_ids = set()
+        self.sentence = []
+        self.exhausted = False
+        try:
+            self.parse_sentences(id_set, verbose)
+        except BlockParserError as e:
+            raise SentenceParserError(
+                'Error while parsing sentence file: {error}'.format(error=e.args[0]))
+        return 0
+
+    def close_document(self):
+        self.document.close()
@@ -0,0 +1,274 @@
+import io
+import re
+import sys
+
+from .sentence_parser import SentenceParser
+from ..util import compressed_file, file_size
+
+
+class SentenceScannerError(Exception):
+
+    def __init__(self, message):
+        """Raise error when a document contains something that the scanner
+        does not handle.
+
+        Arguments:
+        message -- Error message to be printed
+        """
+        self.message = message
+
+ATTRIBUTES = r'(?:\s+[^\s=/>]+\s*=\s*(?:"[^"<]*"|\'[^\'<]*\'))*'
+ATTRIBUTE = re.compile(r'([^\s=/>]+)\s*=\s*(?:"([^"<]*)"|\'([^\'<]*)\')')
+ID_ATTRIBUTE = re.compile(r'\s+id\s*=\s*(?:"([^"&<\t\n]*)"|\'([^\'&<\t\n]*)\')\s*')
+S_ELEMENT = re.compile(r'<s(' + ATTRIBUTES +
+        r')\s*(?:/>|>([^<]*(?:<(?!/s[\s>])[^<]*)*)</s\s*>)')
+S_START = re.compile(r'<s[\s/>]')
+W_START = re.compile(r'<w[\s/>]')
+W_ELEMENT = re.compile(r'<w' + ATTRIBUTES + r'\s*(?:/>|>([^<]*)</w\s*>)')
+TAG = re.compile(r'<[^\s/>!?]+' + ATTRIBUTES + r'\s*(/?)>|</[^\s>]+\s*>')
+ENCODING = re.compile(rb'<\?xml[^>]*encoding\s*=\s*["\']([^"\']*)')
+ENTITY = re.compile(r'&(?:(amp|lt|gt|quot|apos)|#([0-9]+)|#x([0-9a-fA-F]+));')
+
+ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+# Markup that changes how expat reports text or attributes
+UNSUPPORTED = (b'<!--', b'<![CDATA[', b'<!ENTITY', b'<!ATTLIST', b'\r')
+
+def replace_entity(match):
+    name, dec, hexa = match.groups()
+    if name:
+        return ENTITIES[name]
+    code = int(dec) if dec else int(hexa, 16)
+    if (code < 0x20 and code not in (0x9, 0xa, 0xd)) or \
+            0xd800 <= code <= 0xdfff or code > 0x10ffff:
+        raise SentenceScannerError(
+            'Invalid character reference {}'.format(match.group(0)))
+    return chr(code)
+
+def unescape(text):
+    """Replace entity and character references"""
+    if '&' not in text:
+        return text
+    if '&#' not in text:
+        unescaped = text.replace('&lt;', '<').replace('&gt;', '>').replace(
+                '&quot;', '"').replace('&apos;', "'")
+        if '&' not in unescaped:
+            return unescaped
+        if unescaped.count('&') == unescaped.count('&amp;'):
+            return unescaped.replace('&amp;', '&')
+    if text.count('&') != len(ENTITY.findall(text)):
+        raise SentenceScannerError('Unknown entity in "{}"'.format(text))
+    return ENTITY.sub(replace_entity, text)
+
+def parse_attributes(data):
+    """Return the attributes of a tag as a dictionary like expat does"""
+    match = ID_ATTRIBUTE.fullmatch(data)
+    if match:
+        value = match.group(1)
+        if value is None:
+            value = match.group(2)
+        return {'id': value}
+    attrs = {}
+    for match in ATTRIBUTE.finditer(data):
+        name = match.group(1)
+        if name in attrs:
+            raise SentenceScannerError(
+                'Duplicate attribute "{}"'.format(name))
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        attrs[name] = unescape(value.replace('\t', ' ').replace('\n', ' '))
+    return attrs
+
+def xml_sentence(text):
+    """Join the tokens of an <s> element of an xml document"""
+    if not text:
+        return ''
+    words = W_ELEMENT.findall(text)
+    if len(words) != text.count('<w') and \
+            len(words) != len(W_START.findall(text)):
+        raise SentenceScannerError('Unexpected <w> element')
+    if '&#' in text:
+        # Character references may stand for whitespace to be stripped
+        return ' '.join([unescape(word).strip() for word in words])
+    return unescape(' '.join([word.strip() for word in words]))
+
+def raw_sentence(text):
+    """Return the text of an <s> element of a raw document"""
+    if '<' in text:
+        for match in TAG.finditer(text):
+            if not match.group(1):
+                raise SentenceScannerError('Element within <s> element')
+        text = TAG.sub('', text)
+        if '<' in text:
+            raise SentenceScannerError('Unexpected markup')
+    return unescape(text).strip()
+
+
+class SentenceScanner(SentenceParser):
+
+    read_size = 65536
+
+    def __init__(self, document, preprocessing='xml', **kwargs):
+        """Read sentences from xml and raw documents in the standard OPUS
+        format by scanning the bytes of <s> and <w> elements with regular
+        expressions instead of building a block tree with expat.
+
+        If the document contains anything the scanner does not handle,
+        e.g. comments, nested elements within tokens or an encoding other
+        than utf-8, the document is parsed again with SentenceParser. The
+        sentences are the same in both cases.
+
+        Arguments:
+        document -- Xml file to be parsed
+        preprocessing -- Preprocessing type of the document, xml or raw
+        Other keyword arguments are passed to SentenceParser.
+        """
+
+        super().__init__(document, preprocessing=preprocessing, **kwargs)
+        if preprocessing == 'raw':
+            self.scan_sentence = raw_sentence
+        else:
+            self.scan_sentence = xml_sentence
+        self.stream = document
+        if isinstance(document, io.TextIOWrapper):
+            self.stream = document.buffer
+        self.scanning = True
+        self.reset_scan()
+
+    def reset_scan(self):
+        self.buffer = b''
+        self.pending_elements = []
+        self.last_bytes = b''
+        self.first_read = True
+
+    def read_data(self):
+        """Read the next piece of the document and check that it contains
+        nothing that the scanner does not handle"""
+        data = self.stream.read(self.read_size)
+        if not isinstance(data, bytes):
+            raise SentenceScannerError('Document is not binary')
+        if self.first_read:
+            self.first_read = False
+            if data.startswith((b'\xef\xbb\xbf', b'\xff\xfe', b'\xfe\xff')):
+                raise SentenceScannerError('Byte order mark')
+            match = ENCODING.match(data)
+            if match and match.group(1).lower() not in (b'utf-8', b'utf8'):
+                raise SentenceScannerError('Encoding is not utf-8')
+        checked = self.last_bytes + data
+        for markup in UNSUPPORTED:
+            if markup in checked:
+                raise SentenceScannerError(
+                    'Unsupported markup {}'.format(markup))
+        self.last_bytes = data[-8:]
+        self.cur_pos += len(data)
+        return data
+
+    def get_complete_elements(self, verbose=False):
+        """Read data until one or more <s> elements are complete, and return
+        the attributes and contents of all complete elements. Return None
+        at the end of the document."""
+        while True:
+            data = self.read_data()
+            if verbose:
+                self.report_progress()
+            if data:
+                self.buffer += data
+                end = self.buffer.rfind(b'</s>')
+                if end == -1:
+                    continue
+                end += 4
+            else:
+                if not self.buffer:
+                    return None
+                end = len(self.buffer)
+            try:
+                # The region ends with an ascii character, so it can be
+                # decoded separately
+                region = self.buffer[:end].decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise SentenceScannerError(str(e))
+            self.buffer = self.buffer[end:]
+            elements = S_ELEMENT.findall(region)
+            if len(elements) != region.count('<s') and \
+                    len(elements) != len(S_START.findall(region)):
+                raise SentenceScannerError('Unexpected <s> element')
+            if not data and not elements:
+                return None
+            return elements
+
+    def scan_sentences(self, id_set, verbose=False):
+        """Scan <s> elements until all sentences in id_set are found or the
+        document ends. Elements left over from a read are kept for the next
+        call."""
+        elements = self.pending_elements
+        self.pending_elements = []
+        if not elements:
+            elements = self.get_complete_elements(verbose)
+        while elements is not None:
+            for i, (attributes, content) in enumerate(elements):
+                attrs = parse_attributes(attributes)
+                if 'id' not in attrs:
+                    raise SentenceScannerError('<s> element without id')
+                sid = attrs['id']
+                self.passed_ids.add(sid)
+                if sid in id_set:
+                    self.sentences[sid] = (self.scan_sentence(content), attrs)
+                    if len(self.sentences) == len(id_set):
+                        self.pending_elements = elements[i+1:]
+                        return
+            elements = self.get_complete_elements(verbose)
+        self.exhausted = True
+
+    def report_progress(self):
+        if self.doc_size == -1:
+            self.doc_size = file_size(self.document)
+        raw = compressed_file(self.document)
+        cur_pos = raw.tell() if raw else self.cur_pos
+        progress = str(round(cur_pos/self.doc_size*100, 2) if self.doc_size > 0 else 0)
+        print("\x1b[2KParsing file \"{}\" ... {}%".format(self.document.name[:self.len_name], progress), end="\r", file=sys.stderr)
+
+    def store_next_sentences(self, id_set, doc_size=-1, verbose=False):
+        """Store sentences for the next chunk of links in the document.
+
+        Scanning continues from where the previous call stopped, and
+        sentences not included in id_set are dropped. The document is
+        read again from the beginning only if id_set contains sentences
+        that were already passed by earlier calls.
+        """
+        if not self.scanning:
+            return super().store_next_sentences(id_set, doc_size, verbose)
+
+        self.sentences = {sid: self.sentences[sid] for sid in id_set
+                if sid in self.sentences}
+        for sid in id_set:
+            if sid in self.passed_ids and sid not in self.sentences:
+                self.rewind()
+                break
+
+        if self.exhausted or len(self.sentences) == len(id_set):
+            return doc_size
+
+        try:
+            self.scan_sentences(id_set, verbose)
+        except SentenceScannerError:
+            # Parse the whole document again with expat
+            self.scanning = False
+            self.document.seek(0)
+            self.sentences = {}
+            self.passed_ids = set()
+            self.cur_pos = 0
+            self.exhausted = False
+            return super().store_next_sentences(id_set, doc_size, verbose)
+        if verbose:
+            print("", file=sys.stderr)
+        return doc_size
+
+    def rewind(self):
+        """Start scanning the document again from the beginning."""
+        if not self.scanning:
+            return super().rewind()
+        self.document.seek(0)
+        self.reset_scan()
+        self.cur_pos = 0
+        self.passed_ids = set()
+        self.exhausted = False
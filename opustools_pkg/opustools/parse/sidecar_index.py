@@ -0,0 +1,141 @@
+import os
+import sqlite3
+
+import xml.parsers.expat
+
+
+class SidecarIndexError(Exception):
+
+    def __init__(self, message):
+        """Raise error when building an index fails.
+
+        Arguments:
+        message -- Error message to be printed
+        """
+        self.message = message
+
+def scan_elements(document, tag, child_tag=None, read_size=1048576):
+    """Return (attributes, byte offset, byte length, number of child_tag
+    elements) of each tag element in a binary xml document"""
+
+    spans = []
+    opened = []
+    ended = []
+
+    p = xml.parsers.expat.ParserCreate()
+
+    def close_ended():
+        """An element ends where the next parser event begins"""
+        if ended:
+            attrs, offset, children = ended.pop()
+            spans.append((attrs, offset, p.CurrentByteIndex-offset, children))
+
+    def start_element(name, attrs):
+        close_ended()
+        if name == tag:
+            opened.append([attrs, p.CurrentByteIndex, 0])
+        elif name == child_tag and opened:
+            opened[-1][2] += 1
+
+    def end_element(name):
+        close_ended()
+        if name == tag and opened:
+            ended.append(opened.pop())
+
+    def other_event(data, *args):
+        close_ended()
+
+    p.StartElementHandler = start_element
+    p.EndElementHandler = end_element
+    p.CharacterDataHandler = other_event
+    p.CommentHandler = other_event
+    p.ProcessingInstructionHandler = other_event
+
+    data = document.read(read_size)
+    while data:
+        p.Parse(data, False)
+        data = document.read(read_size)
+    p.Parse(b'', True)
+    close_ended()
+
+    return spans
+
+class SidecarIndex:
+
+    extension = '.idx'
+    schema = []
+    check_same_thread = True
+
+    def __init__(self, index_file):
+        """Sqlite index file stored next to the file it indexes.
+
+        The index records the size and modification time of the indexed
+        file and is ignored if the file changes.
+
+        Arguments:
+        index_file -- Path to the index file
+        """
+        self.index_file = index_file
+        self.conn = sqlite3.connect(index_file,
+                check_same_thread=self.check_same_thread)
+
+    @classmethod
+    def index_name(cls, file_name):
+        return file_name + cls.extension
+
+    @staticmethod
+    def file_stamp(file_name):
+        stat = os.stat(file_name)
+        return str(stat.st_size), str(stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, file_name):
+        """Return the index of a file, or None if the index does not exist
+        or the file has changed after indexing"""
+        index_file = cls.index_name(file_name)
+        if not os.path.isfile(index_file):
+            return None
+        index = cls(index_file)
+        try:
+            stamp = dict(index.conn.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            index.close()
+            return None
+        size, mtime = cls.file_stamp(file_name)
+        if stamp.get('size') != size or stamp.get('mtime') != mtime:
+            index.close()
+            return None
+        return index
+
+    @classmethod
+    def create(cls, file_name):
+        """Return a new empty index in a temporary file"""
+        temp_file = cls.index_name(file_name) + '.tmp'
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+        index = cls(temp_file)
+        index.conn.execute('CREATE TABLE meta (key text PRIMARY KEY, '
+                'value text)')
+        for sql in cls.schema:
+            index.conn.execute(sql)
+        return index
+
+    def finish(self, file_name):
+        """Store the stamp of the indexed file, move the temporary index
+        file in place and return the finished index"""
+        size, mtime = self.file_stamp(file_name)
+        self.conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                [('size', size), ('mtime', mtime)])
+        self.conn.commit()
+        self.close()
+        index_file = self.index_name(file_name)
+        os.replace(self.index_file, index_file)
+        return type(self)(index_file)
+
+    def discard(self):
+        """Remove an unfinished index"""
+        self.close()
+        os.remove(self.index_file)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import zipfile
+
+from .sidecar_index import SidecarIndex
+
+class ZipManifest(SidecarIndex):
+
+    extension = '.manifest'
+    schema = ['CREATE TABLE member (name text PRIMARY KEY, '
+            'header_offset integer, compress_size integer, '
+            'file_size integer, compress_type integer, crc integer, '
+            'flag_bits integer)']
+    # The reader thread of the OpusRead pipeline looks up members as well
+    check_same_thread = False
+
+    def __init__(self, index_file):
+        """Central directory of a zip file: the header offset, sizes,
+        compression method, CRC-32 and flags of each member, so that
+        members can be opened without reading the central directory.
+
+        Arguments:
+        index_file -- Path to the index file
+        """
+        super().__init__(index_file)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, zip_arc):
+        """Store the members of an opened zip file and return the
+        manifest"""
+        index = cls.create(zip_arc.filename)
+        try:
+            index.conn.executemany('INSERT OR REPLACE INTO member VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?)', ((info.orig_filename,
+                        info.header_offset, info.compress_size,
+                        info.file_size, info.compress_type, info.CRC,
+                        info.flag_bits) for info in zip_arc.infolist()))
+        except BaseException:
+            index.discard()
+            raise
+        return index.finish(zip_arc.filename)
+
+    @staticmethod
+    def zip_info(row):
+        name, header_offset, compress_size, file_size, compress_type, crc, \
+            flag_bits = row
+        info = zipfile.ZipInfo(name)
+        info.header_offset = header_offset
+        info.compress_size = compress_size
+        info.file_size = file_size
+        info.compress_type = compress_type
+        info.CRC = crc
+        info.flag_bits = flag_bits
+        return info
+
+    def get_info(self, name):
+        """Return the ZipInfo of a member, or None if the zip file has no
+        such member"""
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM member WHERE name = ?',
+                    (name,)).fetchone()
+        if row is None:
+            return None
+        return self.zip_info(row)
+
+    def get_infos(self):
+        """Return the ZipInfos of all members in zip file order"""
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM member '
+                    'ORDER BY rowid').fetchall()
+        return [self.zip_info(row) for row in rows]
+
+class ManifestZipFile(zipfile.ZipFile):
+
+    def __init__(self, file_name, manifest):
+        """Zip file opened for reading whose members are looked up in a
+        ZipManifest instead of the central directory of the file.
+
+        Arguments:
+        file_name -- Path to the zip file
+        manifest -- Up to date ZipManifest of the zip file
+        """
+        self.manifest = manifest
+        super().__init__(file_name, 'r')
+
+    def _RealGetContents(self):
+        # Members are read from the manifest when they are looked up
+        pass
+
+    def getinfo(self, name):
+        info = self.NameToInfo.get(name)
+        if info is None:
+            info = self.manifest.get_info(name)
+            if info is None:
+                raise KeyError(
+                    'There is no item named %r in the archive' % name)
+            self.NameToInfo[name] = info
+        return info
+
+    def infolist(self):
+        return self.manifest.get_infos()
+
+    def namelist(self):
+        return [info.filename for info in self.infolist()]
+
+    def close(self):
+        super().close()
+        self.manifest.close()
+
+def open_zip(file_name):
+    """Open a zip file for reading through its manifest. Without an up to
+    date manifest, the central directory is read as usual and stored in a
+    new manifest, if the directory of the zip file is writable."""
+    manifest = ZipManifest.load(file_name)
+    if manifest is not None:
+        return ManifestZipFile(file_name, manifest)
+    zip_arc = zipfile.ZipFile(file_name, 'r')
+    try:
+        ZipManifest.build(zip_arc).close()
+    except (OSError, sqlite3.Error):
+        pass
+    return zip_arc
@@ -3,25 +3,83 @@ import sqlite3
 import logging
 import os
 import gzip
+import hashlib
+import threading
+import concurrent.futures
 
 from ruamel.yaml import YAML, scanner, reader
 
 
 logger = logging.getLogger(__name__)
 
+URL_BASE = 'https://raw.githubusercontent.com/Helsinki-NLP/OPUS/main/corpus/'
+
+# YAML instances are not thread-safe, each fetching thread has its own
+yaml_local = threading.local()
+
 
 def read_url(url):
     return urllib.request.urlopen(url).read().decode('utf-8').split('\n')
 
 
-def read_url_yaml(url, yaml):
+def load_yaml(raw):
+    if not hasattr(yaml_local, 'yaml'):
+        yaml_local.yaml = YAML(typ='safe')
+    return yaml_local.yaml.load(raw)
+
+
+def open_url(url, headers):
+    """Return the response to a GET request, or None if the server reports
+    that the file is not modified"""
+    try:
+        return urllib.request.urlopen(urllib.request.Request(url,
+            headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def read_url_yaml(url, stamp=None):
+    """Fetch and parse a yaml file, or its gzipped version if the file is
+    missing. stamp is the (etag, last_modified, sha1) of the file from the
+    previous update: if the server reports the file as not modified, or
+    its content has the same sha1, it is not parsed and None is returned
+    as the data. Return the data and the stamp of the file."""
+    headers = {}
+    if stamp:
+        etag, last_modified, sha1 = stamp
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    compressed = False
     try:
-        raw = urllib.request.urlopen(url).read().decode('utf-8')
+        response = open_url(url, headers)
     except urllib.error.HTTPError:
-        gzbytes = urllib.request.urlopen(url+'.gz').read()
-        raw = gzip.decompress(gzbytes).decode('utf-8')
-    data = yaml.load(raw)
-    return data
+        response = open_url(url+'.gz', headers)
+        compressed = True
+    if response is None:
+        return None, stamp
+    with response:
+        raw = response.read()
+        new_stamp = (response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            hashlib.sha1(raw).hexdigest())
+    if stamp and new_stamp[2] == stamp[2]:
+        return None, new_stamp
+    if compressed:
+        raw = gzip.decompress(raw)
+    return load_yaml(raw.decode('utf-8')), new_stamp
+
+
+def fetch_yaml(url, stamp=None):
+    """Return the result of read_url_yaml and None, or None and the error
+    if the file cannot be fetched or parsed"""
+    try:
+        return read_url_yaml(url, stamp), None
+    except (scanner.ScannerError, urllib.error.HTTPError, reader.ReaderError) as e:
+        return None, e
 
 
 def create_table(cur):
@@ -42,24 +100,31 @@ def create_table(cur):
     updated integer
     );'''
     cur.execute(create_opusfile_table)
-    create_url_index = 'CREATE INDEX IF NOT EXISTS idx_url ON opusfile(url)'
+    # Databases from before the upserts have a non-unique url index
+    for index in cur.execute('PRAGMA index_list(opusfile)').fetchall():
+        if index[1] == 'idx_url' and not index[2]:
+            cur.execute('DELETE FROM opusfile WHERE url IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM opusfile GROUP BY url)')
+            cur.execute('DROP INDEX idx_url')
+    create_url_index = 'CREATE UNIQUE INDEX IF NOT EXISTS idx_url ON opusfile(url)'
     cur.execute(create_url_index)
     cur.execute('CREATE INDEX IF NOT EXISTS idx_corpusdata ON opusfile(source,target,corpus,preprocessing,latest)')
+    # Stamps of the statistics files from the previous update
+    create_yamlfile_table = '''CREATE TABLE IF NOT EXISTS yamlfile (
+    url text PRIMARY KEY,
+    etag text,
+    last_modified text,
+    sha1 text,
+    corpus text,
+    version text
+    );'''
+    cur.execute(create_yamlfile_table)
 
 
-def execute_sql(cur, opusfile):
+def write_rows(cur, opusfiles):
     columns = ['source', 'target', 'corpus', 'preprocessing', 'version', 'url', 'size', 'documents', 'alignment_pairs', 'source_tokens', 'target_tokens', 'latest']
-    #wheres = [f'{columns[i]}="{opusfile[i]}"' for i in range(6)]
-    #sql = f'SELECT * FROM opusfile WHERE {" AND ".join(wheres)}'
-    sql = f'SELECT * FROM opusfile WHERE url="{opusfile[5]}"'
-    res = cur.execute(sql).fetchall()
-    if len(res) == 1:
-        sets = [f'{columns[i]}="{opusfile[i]}"' for i in range(6, len(columns))]
-        sql = f'UPDATE opusfile SET {", ".join(sets)}, updated=1 WHERE id={res[0][0]}'
-        cur.execute(sql)
-    elif len(res) == 0:
-        sql = f'INSERT INTO opusfile({", ".join(columns)}, updated) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,1)'
-        cur.execute(sql, opusfile)
+    sets = [f'{column}=excluded.{column}' for column in columns[6:]]
+    sql = f'INSERT INTO opusfile({", ".join(columns)}, updated) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,1) ON CONFLICT(url) DO UPDATE SET {", ".join(sets)}, updated=1'
+    cur.executemany(sql, opusfiles)
 
 
 def get_lang_info(name, data, data_type, info):
@@ -133,32 +198,33 @@ def get_size_url_prep(name, data, data_type, info):
 
     return size, url, preprocessing
 
-def get_tmx_entries(corpus, version, latest, tmx, cur, info):
+
+def get_tmx_entries(corpus, version, latest, tmx, rows, info):
     for item in tmx:
         source, target, documents, alignment_pairs, source_tokens, target_tokens = get_lang_info(item, tmx[item], 'tmx', info)
         size, url, preprocessing = get_size_url_prep(item, tmx[item], 'tmx', info)
         opusfile = (source, target, corpus, preprocessing, version, url, size, documents, alignment_pairs, source_tokens, target_tokens, latest)
-        execute_sql(cur, opusfile)
+        rows.append(opusfile)
 
 
-def get_moses_entries(corpus, version, latest, moses, cur, info):
+def get_moses_entries(corpus, version, latest, moses, rows, info):
     for item in moses:
         source, target, documents, alignment_pairs, source_tokens, target_tokens = get_lang_info(item, moses[item], 'moses', info)
         size, url, preprocessing = get_size_url_prep(item, moses[item], 'moses', info)
         opusfile = (source, target, corpus, preprocessing, version, url, size, documents, alignment_pairs, source_tokens, target_tokens, latest)
-        execute_sql(cur, opusfile)
+        rows.append(opusfile)
 
 
-def get_monolingual_entries(corpus, version, latest, monolingual, cur, info):
+def get_monolingual_entries(corpus, version, latest, monolingual, rows, info):
     for item in monolingual:
         source, target, documents, alignment_pairs, source_tokens, target_tokens = get_lang_info(item, monolingual[item], 'monolingual', info)
         for entry in monolingual[item]['downloads'].items():
             size, url, preprocessing = get_size_url_prep(item, entry[1], 'monolingual', info)
             opusfile = (source, target, corpus, preprocessing, version, url, size, documents, alignment_pairs, source_tokens, target_tokens, latest)
-            execute_sql(cur, opusfile)
+            rows.append(opusfile)
 
 
-def get_bitext_entries(corpus, version, latest, bitexts, cur, info):
+def get_bitext_entries(corpus, version, latest, bitexts, rows, info):
     for item in bitexts:
         source, target, documents, alignment_pairs, source_tokens, target_tokens = get_lang_info(item, bitexts[item], 'bitexts', info)
         for entry in bitexts[item]['downloads'].items():
@@ -166,7 +232,7 @@ def get_bitext_entries(corpus, version, latest, bitexts, cur, info):
             if 'language' not in entry[0]:
                 size, url, preprocessing = get_size_url_prep(item, entry[1], 'bitexts', info)
                 opusfile = (source, target, corpus, preprocessing, version, url, size, documents, alignment_pairs, source_tokens, target_tokens, latest)
-                execute_sql(cur, opusfile)
+                rows.append(opusfile)
 
 
 def remove_missing_items(cur):
@@ -176,9 +242,18 @@ def remove_missing_items(cur):
     cur.execute(sql)
 
 
-def update_db(db_file=None, log_type='errors'):
-    yaml = YAML()
+def update_db(db_file=None, log_type='errors', url_base=URL_BASE, workers=8):
+    """Update the corpus database from the info.yaml and statistics.yaml
+    files of the OPUS repository. The files are fetched in parallel, and
+    statistics files that have not changed since the previous update are
+    not parsed again. The rows are written in one transaction.
 
+    Arguments:
+    db_file -- Sqlite db file (default opusdata.db in the package directory)
+    log_type -- Log "errors" or also "warnings" in opusdb_update_error.log
+    url_base -- Url of the corpus directory of the OPUS repository
+    workers -- Number of files fetched at the same time (default 8)
+    """
     if log_type == 'warnings':
         logging.basicConfig(filename='opusdb_update_error.log', level=logging.WARNING,
                 format='%(asctime)s %(levelname)s:%(name)s: %(message)s', datefmt='%x %X')
@@ -189,63 +264,95 @@ def update_db(db_file=None, log_type='errors'):
     if not db_file:
         db_file = os.path.join(os.path.dirname(__file__), 'opusdata.db')
 
-    con = sqlite3.connect(db_file)
+    # Transactions are started explicitly, so that readers of the
+    # database see either the old or the updated rows
+    con = sqlite3.connect(os.path.expanduser(db_file), isolation_level=None)
     cur = con.cursor()
 
+    cur.execute('BEGIN IMMEDIATE')
     create_table(cur)
+    cur.execute('COMMIT')
+    stamps = {row[0]: row[1:] for row in cur.execute('SELECT * FROM yamlfile')}
 
-    URL_BASE = 'https://raw.githubusercontent.com/Helsinki-NLP/OPUS/main/corpus/'
-    index_info = read_url(URL_BASE + 'index-info.txt')
+    index_info = read_url(url_base + 'index-info.txt')
 
-    for info in index_info:
+    def fetch(info):
         info_s = info.split('/')
         if len(info_s) == 2:
-            try:
-                gen_info = read_url_yaml(URL_BASE + info, yaml)
-            except (scanner.ScannerError, urllib.error.HTTPError, reader.ReaderError) as e:
-                logger.error(f'{info}, {type(e).__name__}: {e}')
-                gen_info = {}
-            corpus = gen_info.get('name')
-            if not corpus:
-                logger.warning(f'{info}, corpus name missing')
-            print(f'Processing corpus {corpus}')
-            latest_v = gen_info.get('latest_release')
-            if not latest_v:
-                logger.error(f'{info}, latest_release missing')
+            return fetch_yaml(url_base + info)
         elif len(info_s) == 3:
-            version = info_s[1]
-            if not corpus:
-                corpus = info_s[0]
-            latest = 'False'
-            if version == latest_v:
-                latest = 'True'
             stats = info.replace('info.yaml', 'statistics.yaml')
-            try:
-                corpus_data = read_url_yaml(URL_BASE + stats, yaml)
-            except (scanner.ScannerError, urllib.error.HTTPError, reader.ReaderError) as e:
-                logger.error(f'{stats}, {type(e).__name__}: {e}')
-                continue
-
-            get_entries = {'bitexts': get_bitext_entries,
-                            'monolingual': get_monolingual_entries,
-                            'moses': get_moses_entries,
-                            'tmx': get_tmx_entries}
-
-            if not corpus_data:
-                logger.error(f'{info}, corpus_data is empty')
-                continue
-
-            for item in get_entries.keys():
-                sub_data = corpus_data.get(item)
-                if sub_data:
-                    get_entries[item](corpus, version, latest, sub_data, cur, info)
+            stamp = stamps.get(stats)
+            return fetch_yaml(url_base + stats, stamp and stamp[:3])
+        return None, None
+
+    get_entries = {'bitexts': get_bitext_entries,
+                    'monolingual': get_monolingual_entries,
+                    'moses': get_moses_entries,
+                    'tmx': get_tmx_entries}
+
+    rows, unchanged, new_stamps = [], [], []
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        # The files are processed in index order as they arrive
+        for info, (result, error) in zip(index_info, executor.map(fetch, index_info)):
+            info_s = info.split('/')
+            if len(info_s) == 2:
+                if error:
+                    logger.error(f'{info}, {type(error).__name__}: {error}')
+                    gen_info = {}
                 else:
-                    logger.warning(f'{info}, {item} data missing')
+                    gen_info = result[0]
+                corpus = gen_info.get('name')
+                if not corpus:
+                    logger.warning(f'{info}, corpus name missing')
+                print(f'Processing corpus {corpus}')
+                latest_v = gen_info.get('latest_release')
+                if not latest_v:
+                    logger.error(f'{info}, latest_release missing')
+            elif len(info_s) == 3:
+                version = info_s[1]
+                if not corpus:
+                    corpus = info_s[0]
+                latest = 'False'
+                if version == latest_v:
+                    latest = 'True'
+                stats = info.replace('info.yaml', 'statistics.yaml')
+                if error:
+                    logger.error(f'{stats}, {type(error).__name__}: {error}')
+                    continue
+
+                corpus_data, stamp = result
+                new_stamps.append((stats, *stamp, corpus, version))
+                if corpus_data is None:
+                    # The rows from the previous update are kept
+                    unchanged.append((corpus, latest, stamps[stats][3], version))
+                    continue
+
+                if not corpus_data:
+                    logger.error(f'{info}, corpus_data is empty')
+                    continue
+
+                for item in get_entries.keys():
+                    sub_data = corpus_data.get(item)
+                    if sub_data:
+                        get_entries[item](corpus, version, latest, sub_data, rows, info)
+                    else:
+                        logger.warning(f'{info}, {item} data missing')
 
-    remove_missing_items(cur)
-
-    con.commit()
-    con.close()
+    try:
+        cur.execute('BEGIN IMMEDIATE')
+        cur.executemany('UPDATE opusfile SET corpus=?, latest=?, updated=1 WHERE corpus=? AND version=?', unchanged)
+        write_rows(cur, rows)
+        cur.execute('DELETE FROM yamlfile')
+        cur.executemany('INSERT INTO yamlfile VALUES(?,?,?,?,?,?)', new_stamps)
+        remove_missing_items(cur)
+        cur.execute('COMMIT')
+    except BaseException:
+        if con.in_transaction:
+            cur.execute('ROLLBACK')
+        raise
+    finally:
+        con.close()
 
 
 def main():
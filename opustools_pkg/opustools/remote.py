@@ -0,0 +1,228 @@
+import bz2
+import collections
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import urllib.parse
+import urllib.request
+import zipfile
+
+from .util import ZstdFile, is_url
+
+class RemoteFileError(Exception):
+
+    def __init__(self, message):
+        """Raise error when a remote file cannot be read with range
+        requests.
+
+        Arguments:
+        message -- Error message to be printed
+        """
+        self.message = message
+
+class RemoteFile(io.BufferedIOBase):
+
+    # Bytes fetched at a time and the number of blocks kept in memory
+    block_size = 1048576
+    memory_blocks = 32
+
+    def __init__(self, url, cache_dir=None):
+        """Readable and seekable file on an http server that supports
+        range requests. The file is read in blocks of block_size bytes,
+        and only the blocks that are read are fetched. Consecutive missing
+        blocks are fetched with one request.
+
+        Fetched blocks are also stored in cache_dir, in a directory of
+        their own for each url, and read from there in later runs as long
+        as the size, ETag and Last-Modified of the remote file stay the
+        same.
+
+        Arguments:
+        url -- Url of the file
+        cache_dir -- Directory of the block cache, None for no cache
+        """
+        self.url = url
+        self.name = url
+        self.pos = 0
+        self.requests = 0
+        self.blocks = collections.OrderedDict()
+        with self.request(0, 0) as response:
+            content_range = response.headers.get('Content-Range', '')
+            size = content_range.rpartition('/')[2]
+            if response.status != 206 or not size.isdigit():
+                raise RemoteFileError('Server does not support range '
+                        'requests for "{url}"'.format(url=url))
+            stamp = {'url': url, 'size': int(size),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')}
+        self.size = stamp['size']
+        self.cache = None
+        if cache_dir:
+            self.cache = self.open_cache(os.path.expanduser(cache_dir), stamp)
+
+    def request(self, start, end):
+        self.requests += 1
+        request = urllib.request.Request(self.url,
+                headers={'Range': 'bytes={}-{}'.format(start, end)})
+        return urllib.request.urlopen(request)
+
+    def open_cache(self, cache_dir, stamp):
+        """Return the cache directory of the url, emptied if the remote
+        file has changed, or None if it cannot be created"""
+        path = os.path.join(cache_dir,
+                hashlib.sha1(self.url.encode('utf-8')).hexdigest())
+        stamp_file = os.path.join(path, 'stamp.json')
+        try:
+            with open(stamp_file) as f:
+                if json.load(f) == stamp:
+                    return path
+        except (OSError, ValueError):
+            pass
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path, exist_ok=True)
+            with open(stamp_file, 'w') as f:
+                json.dump(stamp, f)
+        except OSError:
+            return None
+        return path
+
+    def cached_block(self, number):
+        block = self.blocks.get(number)
+        if block is not None:
+            self.blocks.move_to_end(number)
+            return block
+        if self.cache:
+            try:
+                with open(os.path.join(self.cache, str(number)), 'rb') as f:
+                    block = f.read()
+            except OSError:
+                return None
+            self.keep_block(number, block)
+        return block
+
+    def keep_block(self, number, block):
+        self.blocks[number] = block
+        if len(self.blocks) > self.memory_blocks:
+            self.blocks.popitem(last=False)
+
+    def store_block(self, number, block):
+        self.keep_block(number, block)
+        if not self.cache:
+            return
+        # Workers reading the same url may store the same block at once
+        try:
+            fd, temp_name = tempfile.mkstemp(dir=self.cache)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(block)
+            os.replace(temp_name, os.path.join(self.cache, str(number)))
+        except OSError:
+            pass
+
+    def fetch(self, first, last):
+        """Fetch blocks first to last with one request and return them"""
+        start = first*self.block_size
+        end = min((last+1)*self.block_size, self.size)-1
+        with self.request(start, end) as response:
+            data = response.read()
+            status = response.status
+        if status != 206 or len(data) != end-start+1:
+            raise RemoteFileError('Incomplete range {start}-{end} of '
+                    '"{url}"'.format(start=start, end=end, url=self.url))
+        blocks = []
+        for number in range(first, last+1):
+            offset = (number-first)*self.block_size
+            block = data[offset:offset+self.block_size]
+            self.store_block(number, block)
+            blocks.append(block)
+        return blocks
+
+    def get_blocks(self, first, last):
+        blocks = []
+        missing = None
+        for number in range(first, last+1):
+            block = self.cached_block(number)
+            if block is None:
+                if missing is None:
+                    missing = number
+                continue
+            if missing is not None:
+                blocks.extend(self.fetch(missing, number-1))
+                missing = None
+            blocks.append(block)
+        if missing is not None:
+            blocks.extend(self.fetch(missing, last))
+        return blocks
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('read of closed file')
+        end = self.size
+        if size is not None and size >= 0:
+            end = min(self.pos+size, self.size)
+        if end <= self.pos:
+            return b''
+        first = self.pos // self.block_size
+        last = (end-1) // self.block_size
+        data = b''.join(self.get_blocks(first, last))
+        offset = first*self.block_size
+        data = data[self.pos-offset:end-offset]
+        self.pos = end
+        return data
+
+    read1 = read
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def close(self):
+        self.blocks.clear()
+        super().close()
+
+def open_remote_zip(url, cache_dir=None):
+    """Open a zip file on an http server for reading. Only the central
+    directory and the members that are read are fetched."""
+    return zipfile.ZipFile(RemoteFile(url, cache_dir))
+
+def open_remote_file(url, cache_dir=None, encoding='utf8'):
+    """Open a file on an http server for reading in text mode with
+    implicit gzip/bz2/xz/zstd support"""
+    remote = RemoteFile(url, cache_dir)
+    path = urllib.parse.urlparse(url).path
+    if path.endswith('.gz'):
+        document = gzip.GzipFile(fileobj=remote, mode='rb')
+    elif path.endswith('.bz2'):
+        document = bz2.BZ2File(remote)
+    elif path.endswith('.xz'):
+        document = lzma.LZMAFile(remote)
+    elif path.endswith('.zst'):
+        document = ZstdFile(remote, url)
+    else:
+        document = remote
+    if not hasattr(document, 'name'):
+        document.name = url
+    return io.TextIOWrapper(document, encoding=encoding)
@@ -1,21 +1,481 @@
 """Utility functions"""
 
 import bz2
+import collections
+import concurrent.futures
+import functools
 import gzip
+import io
+import lzma
+import mmap
+import os
+import struct
+import zipfile
 
+# Compression method of zstd in zip files, supported by zipfile only from
+# Python 3.14 on
+ZIP_ZSTANDARD = 93
 
-def file_open(filename, mode='r', encoding='utf8'):
-    """Open file with implicit gzip/bz2 support
 
-    Uses text mode by default regardless of the compression.
+def is_url(name):
+    """Return True if a file name is an http or https url"""
+    return isinstance(name, str) and name.startswith(('http://', 'https://'))
+
+
+def import_zstandard():
+    """Import the optional zstandard package"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading and writing zstd compressed files '
+                'requires the zstandard package') from None
+    return zstandard
+
+
+def zstd_compress(data, level):
+    """Compress data into one zstd frame"""
+    zstandard = import_zstandard()
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def block_compressor(filename, compresslevel=None):
+    """Return a function that compresses a block of data into a complete
+    gzip member, xz stream or zstd frame by the extension of filename, or
+    None for other files
+
+    Concatenated members, streams and frames are valid files of their
+    format. The default compression levels are those of the gzip and lzma
+    modules and of zstd.
+
+    """
+    if filename.endswith('.gz'):
+        if compresslevel is None:
+            compresslevel = 9
+        return functools.partial(gzip.compress, compresslevel=compresslevel,
+                mtime=0)
+    if filename.endswith('.xz'):
+        return functools.partial(lzma.compress, preset=compresslevel)
+    if filename.endswith('.zst'):
+        import_zstandard()
+        if compresslevel is None:
+            compresslevel = 3
+        return functools.partial(zstd_compress, level=compresslevel)
+    return None
+
+
+class BlockCompressedWriter(io.BufferedIOBase):
+
+    def __init__(self, filename, compress, mode='wb', block_size=1048576,
+            threads=None):
+        """Binary file that is written in independent compressed blocks,
+        like pigz. The data is cut into blocks of at least block_size bytes,
+        and the blocks are compressed in a pool of threads and written in
+        order. zlib, lzma and zstd release the GIL while compressing, so
+        the blocks are compressed in parallel with each other and with the
+        code that produces the data.
+
+        Arguments:
+        filename -- Name of the file
+        compress -- Function that compresses a block, see block_compressor
+        mode -- Mode to open the file in, 'wb', 'xb' or 'ab'
+        block_size -- Size of the uncompressed blocks in bytes
+        threads -- Number of compressing threads, by default the number of
+            CPUs. With one thread, the blocks are compressed in the thread
+            that writes.
+        """
+        self.fileobj = open(filename, mode)
+        self.name = filename
+        self.compress = compress
+        self.block_size = block_size
+        self.blocks = []
+        self.buffered = 0
+        threads = threads or os.cpu_count() or 1
+        self.executor = None
+        if threads > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.max_pending = 2*threads
+        self.pending = collections.deque()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed file')
+        data = bytes(data)
+        self.blocks.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.submit()
+        return len(data)
+
+    def flush(self):
+        """Flushing does not end the current block, so that small writes
+        followed by flushes do not make tiny blocks"""
+        if self.closed:
+            raise ValueError('flush of closed file')
+
+    def submit(self):
+        """Compress the buffered data as one block"""
+        block = b''.join(self.blocks)
+        self.blocks = []
+        self.buffered = 0
+        if not block:
+            return
+        if self.executor is None:
+            self.fileobj.write(self.compress(block))
+            return
+        self.pending.append(self.executor.submit(self.compress, block))
+        while len(self.pending) >= self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.submit()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            for future in self.pending:
+                future.cancel()
+            if self.executor:
+                self.executor.shutdown()
+            self.fileobj.close()
+            super().close()
+
+
+class ZstdFile(io.BufferedIOBase):
+
+    def __init__(self, fileobj, name=None):
+        """Readable zstd compressed file. Concatenated frames, as written by
+        BlockCompressedWriter, are read as one stream. Seeking backwards
+        decompresses the file again from the beginning, as in gzip files.
+
+        Arguments:
+        fileobj -- Compressed binary file, closed with the ZstdFile
+        name -- Name of the file
+        """
+        zstandard = import_zstandard()
+        self.fileobj = fileobj
+        self.name = name or getattr(fileobj, 'name', None)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.rewind()
+
+    def rewind(self):
+        self.fileobj.seek(0)
+        self.reader = self.decompressor.stream_reader(self.fileobj,
+                read_across_frames=True, closefd=False)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.reader.readall()
+        else:
+            data = self.reader.read(size)
+        self.pos += len(data)
+        return data
+
+    read1 = read
+
+    def readinto(self, b):
+        n = self.reader.readinto(b)
+        self.pos += n
+        return n
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation(
+                    'zstd files can only be seeked from the start')
+        if offset < self.pos:
+            self.rewind()
+        while self.pos < offset:
+            if not self.read(min(offset-self.pos, 1048576)):
+                break
+        return self.pos
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.reader.close()
+            self.fileobj.close()
+        finally:
+            super().close()
+
+
+class XzFile(lzma.LZMAFile):
+
+    def __init__(self, filename):
+        """Readable xz compressed file that keeps its compressed file in
+        fileobj, so that progress can be measured in compressed bytes"""
+        self.fileobj = open(filename, 'rb')
+        self.name = filename
+        super().__init__(self.fileobj)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.fileobj.close()
+
+
+class MappedFile(io.BufferedIOBase):
+
+    def __init__(self, filename):
+        """Readable uncompressed file backed by a read-only memory map.
+        read_view returns slices of the map without copying them, which
+        BlockParser passes directly to expat.
+
+        Arguments:
+        filename -- Name of a non-empty file
+        """
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.name = filename
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read_view(self, size=-1):
+        """Return the next size bytes as a memoryview of the map"""
+        if self.closed:
+            raise ValueError('read of closed file')
+        end = len(self.map)
+        if size is not None and size >= 0:
+            end = min(self.pos+size, end)
+        view = memoryview(self.map)[self.pos:end]
+        self.pos = max(end, self.pos)
+        return view
+
+    def read(self, size=-1):
+        return self.read_view(size).tobytes()
+
+    read1 = read
+
+    def readinto(self, b):
+        view = self.read_view(len(b))
+        b[:len(view)] = view
+        return len(view)
+
+    def readline(self, size=-1):
+        if self.closed:
+            raise ValueError('read of closed file')
+        end = self.map.find(b'\n', self.pos)
+        end = len(self.map) if end == -1 else end+1
+        if size is not None and size >= 0:
+            end = min(end, self.pos+size)
+        return self.read(end-self.pos)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.map)
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # A memoryview of the map is still in use, the map is closed
+            # when it is garbage collected
+            pass
+        super().close()
+
+
+class ZipMemberFile(io.RawIOBase):
+
+    def __init__(self, zip_arc, info):
+        """Readable compressed data of a zip member, read from the file
+        object of the zip file in bounded slices. The position of the
+        shared file object is set under the lock of the zip file before
+        each read, as in zipfile, so members of the same zip file, also of
+        one read over http, can be read at the same time.
+
+        Arguments:
+        zip_arc -- Open ZipFile
+        info -- ZipInfo of the member
+        """
+        self.zip_arc = zip_arc
+        self.name = info.filename
+        self.size = info.compress_size
+        with zip_arc._lock:
+            zip_arc.fp.seek(info.header_offset)
+            header = zip_arc.fp.read(30)
+        if len(header) != 30 or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile(
+                    'Bad local file header of {}'.format(info.filename))
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        self.start = info.header_offset+30+name_length+extra_length
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('read of closed file')
+        size = self.size-self.pos if size is None or size < 0 else \
+                min(size, self.size-self.pos)
+        if size <= 0:
+            return b''
+        with self.zip_arc._lock:
+            self.zip_arc.fp.seek(self.start+self.pos)
+            data = self.zip_arc.fp.read(size)
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = min(max(offset, 0), self.size)
+        return self.pos
+
+
+def open_zip_member(zip_arc, name):
+    """Open a member of a zip file for reading. Members compressed with
+    zstd, which zipfile supports only from Python 3.14 on, are
+    decompressed with zstandard while they are read."""
+    info = zip_arc.getinfo(name)
+    if (info.compress_type != ZIP_ZSTANDARD or
+            hasattr(zipfile, 'ZIP_ZSTANDARD')):
+        return zip_arc.open(info)
+    return ZstdFile(ZipMemberFile(zip_arc, info), info.filename)
+
+
+def file_open(filename, mode='r', encoding='utf8', compresslevel=None,
+        block_size=None, threads=None, memory_map=False):
+    """Open file with implicit gzip/bz2/xz/zstd support
+
+    Uses text mode by default regardless of the compression. Binary
+    modes ignore the encoding.
+
+    If block_size is given, .gz, .xz and .zst files opened for writing
+    are written with a BlockCompressedWriter that compresses blocks of
+    block_size bytes in threads threads. .zst files are always written that
+    way, in blocks of 1 MiB by default. compresslevel sets the compression
+    level of gzip, the preset of xz and the level of zstd.
+
+    .xz and .zst files are also read transparently. With memory_map,
+    uncompressed files are read through a MappedFile.
 
     """
+    if 'b' in mode:
+        encoding = None
+    if mode.rstrip('bt') in {'w', 'x', 'a'}:
+        compress = block_compressor(filename, compresslevel)
+        if compress and (block_size or filename.endswith('.zst')):
+            writer = BlockCompressedWriter(filename, compress,
+                    mode.rstrip('bt')+'b', block_size or 1048576, threads)
+            if 'b' in mode:
+                return writer
+            return io.TextIOWrapper(writer, encoding=encoding)
+    elif filename.endswith(('.xz', '.zst')) or (memory_map and
+            not filename.endswith(('.gz', '.bz2')) and
+            os.path.getsize(filename) > 0):
+        if filename.endswith('.xz'):
+            reader = XzFile(filename)
+        elif filename.endswith('.zst'):
+            reader = ZstdFile(open(filename, 'rb'), filename)
+        else:
+            reader = MappedFile(filename)
+        if 'b' in mode:
+            return reader
+        return io.TextIOWrapper(reader, encoding=encoding)
     if filename.endswith('.bz2'):
         if mode in {'r', 'w', 'x', 'a'}:
             mode += 't'
-        return bz2.open(filename, mode=mode, encoding=encoding)
+        document = bz2.open(filename, mode=mode, encoding=encoding)
+        binary = getattr(document, 'buffer', document)
+        if not hasattr(binary, 'name'):
+            # BZ2File has no name before Python 3.13
+            binary.name = filename
+        return document
     if filename.endswith('.gz'):
         if mode in {'r', 'w', 'x', 'a'}:
             mode += 't'
-        return gzip.open(filename, mode=mode, encoding=encoding)
+        if compresslevel is None:
+            compresslevel = 9
+        return gzip.open(filename, mode=mode, encoding=encoding,
+                compresslevel=compresslevel)
+    if filename.endswith('.xz'):
+        if mode in {'w', 'x', 'a'}:
+            mode += 't'
+        return lzma.open(filename, mode=mode, encoding=encoding,
+                preset=compresslevel)
     return open(filename, mode=mode, encoding=encoding)
+
+
+def compressed_file(document):
+    """Return the underlying compressed file of an opened gzip, xz or zstd
+    file, or None for other files
+
+    Positions in the compressed file show how much of a gzip file has
+    been read without knowing its uncompressed size.
+
+    """
+    if isinstance(document, io.TextIOWrapper):
+        document = document.buffer
+    if isinstance(document, (gzip.GzipFile, XzFile, ZstdFile)):
+        return document.fileobj
+    return None
+
+
+def file_size(document):
+    """Return the size of an opened file without decompressing it
+
+    Gzip files report their compressed size and other files their size.
+    Returns 0 if the size is not known, e.g. for zip members, whose
+    uncompressed size is read from their ZipInfo when they are opened.
+
+    """
+    raw = compressed_file(document)
+    if raw is None:
+        if isinstance(document, io.TextIOWrapper):
+            document = document.buffer
+        if isinstance(document, (zipfile.ZipExtFile, bz2.BZ2File,
+                lzma.LZMAFile)):
+            return 0
+        raw = document
+    try:
+        pos = raw.tell()
+        size = raw.seek(0, 2)
+        raw.seek(pos)
+    except (AttributeError, OSError):
+        return 0
+    return size
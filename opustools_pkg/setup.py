@@ -5,9 +5,11 @@ with open("README.md", "r") as fh:
 
 install_requires = ['ruamel.yaml']
 
-langid_require = ['pycld2', 'langid']
+langid_require = ['pycld2', 'langid', 'numpy']
 
-all_require = langid_require
+zstd_require = ['zstandard']
+
+all_require = langid_require + zstd_require
 
 setuptools.setup(
     name="opustools",
@@ -28,5 +30,6 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ),
     install_requires=install_requires,
-    extras_require={'langid': langid_require, 'all': all_require}
+    extras_require={'langid': langid_require, 'zstd': zstd_require,
+        'all': all_require}
 )
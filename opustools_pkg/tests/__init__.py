@@ -1,8 +1,18 @@
 from .test_block_parser import TestBlockParser
 from .test_sentence_parser import TestSentenceParser
+from .test_sentence_scanner import TestSentenceScanner
+from .test_sentence_index import TestSentenceIndex
 from .test_alignment_parser import TestAlignmentParser
+from .test_alignment_index import TestAlignmentIndex
+from .test_langid_index import TestLanguageIdIndex
 from .test_opus_read import TestOpusRead, add_to_root_dir
 from .test_opus_cat import TestOpusCat
 from .test_opus_get import TestOpusGet
 from .test_opus_langid import TestOpusLangid
-from .test_db_operations import TestDbOperations
+from .test_db_operations import TestDbOperations, TestDbConnection
+from .test_util import TestUtil
+from .test_zip_manifest import TestZipManifest
+from .test_remote import TestRemote
+from .test_download import TestDownload
+from .test_readopusdata import TestUpdateDb
+from .test_api_cache import TestApiCache
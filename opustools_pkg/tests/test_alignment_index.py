@@ -0,0 +1,97 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from opustools.parse.alignment_index import AlignmentIndex
+from opustools.parse.alignment_parser import IndexedAlignmentParser
+from opustools.util import file_open
+
+
+class TestAlignmentIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+
+        self.align_path_gz = os.path.join(self.tempdir, 'align.xml.gz')
+        with gzip.open(self.align_path_gz, 'wb') as align_xml_gz:
+            align_xml_gz.write(b"""<?xml version="1.0" encoding="utf-8"?>
+                <!DOCTYPE cesAlign PUBLIC "-//CES//DTD XML cesAlign//EN" "">
+                <cesAlign version="1.0">
+                <linkGrp targType="s" fromDoc="en/1.xml.gz" toDoc="fi/1.xml.gz" >
+                <link xtargets="s1;s1" id="SL1"/>
+                <link xtargets=";s2" id="SL2"/>
+                  </linkGrp>
+                <linkGrp targType="s" fromDoc="en/2.xml.gz" toDoc="fi/2.xml.gz" >
+                <link xtargets="s21;" id="SL1"/>
+                <link xtargets="s0 s1;s2 s3" id="SL2"/>
+                <link xtargets="s4;s4" id="SL3"/>
+                  </linkGrp>
+                <linkGrp targType="s" fromDoc="en/3.xml.gz" toDoc="fi/3.xml.gz" >
+                <link xtargets="s1;s1" id="SL1"/></linkGrp>
+                </cesAlign>
+                """)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_build_and_load(self):
+        AlignmentIndex.build(self.align_path_gz).close()
+        index = AlignmentIndex.load(self.align_path_gz)
+        link_groups = index.get_link_groups()
+        index.close()
+        self.assertEqual([lg[:3] for lg in link_groups],
+            [('en/1.xml.gz', 'fi/1.xml.gz', 2),
+            ('en/2.xml.gz', 'fi/2.xml.gz', 3),
+            ('en/3.xml.gz', 'fi/3.xml.gz', 1)])
+        with file_open(self.align_path_gz, 'rb') as f:
+            for _, _, _, offset, length in link_groups:
+                f.seek(offset)
+                fragment = f.read(length)
+                self.assertTrue(fragment.startswith(b'<linkGrp '))
+                self.assertTrue(fragment.endswith(b'</linkGrp>'))
+
+    def test_indexed_alignment_parser(self):
+        index = AlignmentIndex.build(self.align_path_gz)
+        link_groups = [lg[3:] for lg in index.get_link_groups()]
+        index.close()
+        ap = IndexedAlignmentParser(file_open(self.align_path_gz, 'rb'),
+                [link_groups[0], link_groups[2]])
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(0)
+        self.assertEqual(links, [('s1', 's1'), ('', 's2')])
+        self.assertEqual(src_doc, 'en/1.xml.gz')
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(cur_pos)
+        self.assertEqual(links, [('s1', 's1')])
+        self.assertEqual(trg_doc, 'fi/3.xml.gz')
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(cur_pos)
+        self.assertEqual(links, [])
+        self.assertEqual(src_doc, None)
+        ap.close_document()
+
+    def test_indexed_alignment_parser_chunks(self):
+        index = AlignmentIndex.build(self.align_path_gz)
+        link_groups = [lg[3:] for lg in index.get_link_groups()]
+        index.close()
+        ap = IndexedAlignmentParser(file_open(self.align_path_gz, 'rb'),
+                link_groups[1:2])
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(0, chunk_size=2)
+        self.assertEqual(links, [('s21', ''), ('s0 s1', 's2 s3')])
+        self.assertEqual(src_doc, 'en/2.xml.gz')
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(cur_pos, chunk_size=2)
+        self.assertEqual(links, [('s4', 's4')])
+        self.assertEqual(src_doc, 'en/2.xml.gz')
+        links, src_set, trg_set, attrs, src_doc, trg_doc, cur_pos = \
+                ap.collect_links(cur_pos, chunk_size=2)
+        self.assertEqual(src_doc, None)
+        ap.close_document()
+
+if __name__ == '__main__':
+    unittest.main()
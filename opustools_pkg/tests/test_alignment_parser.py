@@ -74,4 +74,28 @@ class TestAlignmentParser(unittest.TestCase):
         self.assertEqual(trg_doc, None)
         ap.bp.close_document()
 
+    def test_collect_links_in_chunks(self):
+        ap = AlignmentParser(file_open(self.align_path_gz))
+        links, src_set, trg_set, attrs_list, src_doc, trg_doc, cur_pos = \
+            ap.collect_links(0, chunk_size=3)
+        self.assertEqual(links, [('s1', 's1'), ('', 's2')])
+        self.assertEqual(src_doc,
+            'en/Doyle_Arthur_Conan-Hound_of_the_Baskervilles.xml.gz')
+        links, src_set, trg_set, attrs_list, src_doc, trg_doc, cur_pos = \
+            ap.collect_links(cur_pos, chunk_size=1)
+        self.assertEqual(links, [('s21', '')])
+        self.assertEqual(src_doc, 'en/2.xml.gz')
+        links, src_set, trg_set, attrs_list, src_doc, trg_doc, cur_pos = \
+            ap.collect_links(cur_pos, chunk_size=1)
+        self.assertEqual(links, [('s0 s1', 's2 s3')])
+        self.assertEqual(src_doc, 'en/2.xml.gz')
+        links, src_set, trg_set, attrs_list, src_doc, trg_doc, cur_pos = \
+            ap.collect_links(cur_pos, chunk_size=1)
+        self.assertEqual(links, [])
+        self.assertEqual(src_doc, 'en/2.xml.gz')
+        links, src_set, trg_set, attrs_list, src_doc, trg_doc, cur_pos = \
+            ap.collect_links(cur_pos, chunk_size=1)
+        self.assertEqual(src_doc, None)
+        ap.close_document()
+
 
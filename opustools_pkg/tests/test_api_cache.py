@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import urllib.error
+from unittest import mock
+
+from opustools.api_cache import ApiCache
+from opustools.opus_get import OpusGet
+
+
+class FakeApi:
+    """Count the fetches of each url and answer with the count, or fail
+    with URLError if offline is True"""
+
+    def __init__(self):
+        self.fetches = []
+        self.offline = False
+
+    def __call__(self, url, timeout):
+        if self.offline:
+            raise urllib.error.URLError('offline')
+        self.fetches.append(url)
+        return {'url': url, 'count': self.fetches.count(url)}
+
+class TestApiCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = ApiCache(self.tempdir, ttl=60, max_stale=600)
+        self.api = FakeApi()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def get(self, url, age=0):
+        with mock.patch('time.time', return_value=time.time()+age):
+            data = self.cache.get(url, self.api)
+        for thread in self.cache.refreshing.values():
+            thread.join()
+        return data
+
+    def test_fresh_response(self):
+        self.assertEqual(self.get('http://api/?a=1')['count'], 1)
+        self.assertEqual(self.get('http://api/?a=1', 30)['count'], 1)
+        self.assertEqual(self.get('http://api/?a=2')['count'], 1)
+        self.assertEqual(self.api.fetches, ['http://api/?a=1',
+            'http://api/?a=2'])
+
+    def test_stale_response_is_refreshed(self):
+        self.get('http://api/?a=1')
+        # The stale response is returned and refreshed in the background
+        self.assertEqual(self.get('http://api/?a=1', 120)['count'], 1)
+        self.assertEqual(len(self.api.fetches), 2)
+        self.assertEqual(ApiCache(self.tempdir).get('http://api/?a=1',
+            self.api)['count'], 2)
+
+    def test_expired_response(self):
+        self.get('http://api/?a=1')
+        self.assertEqual(self.get('http://api/?a=1', 1000)['count'], 2)
+
+    def test_offline(self):
+        self.get('http://api/?a=1')
+        self.api.offline = True
+        self.assertEqual(self.get('http://api/?a=1', 1000)['count'], 1)
+        with self.assertRaises(urllib.error.URLError):
+            self.get('http://api/?a=2')
+
+    def test_unwritable_cache_dir(self):
+        cache = ApiCache(os.path.join(self.tempdir, 'file', 'api'))
+        open(os.path.join(self.tempdir, 'file'), 'w').close()
+        self.assertEqual(cache.get('http://api/?a=1', self.api)['count'], 1)
+        self.assertEqual(cache.get('http://api/?a=1', self.api)['count'], 2)
+
+    def test_opus_get_list_corpora(self):
+        response = {'corpora': ['Books', 'RF']}
+        with mock.patch('opustools.api_cache.fetch_json',
+                return_value=response) as fetch, \
+                mock.patch('sys.stdout', new=io.StringIO()) as output:
+            for i in range(2):
+                OpusGet(source='en', list_corpora=True,
+                    download_dir=self.tempdir,
+                    cache_dir=self.tempdir).get_files()
+        self.assertEqual(output.getvalue(), 'Books, RF\nBooks, RF\n')
+        self.assertEqual(fetch.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
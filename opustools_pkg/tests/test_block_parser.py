@@ -1,11 +1,22 @@
+import io
 import unittest
 import tempfile
 import shutil
 import os
+import gzip
+import zipfile
 
 from opustools.util import file_open
 from opustools.parse.block_parser import BlockParser
 
+def get_all_blocks(bp):
+    all_blocks = []
+    blocks, curpos = bp.get_complete_blocks(0)
+    while blocks:
+        all_blocks += blocks
+        blocks, curpos = bp.get_complete_blocks(curpos)
+    return all_blocks
+
 class TestBlockParser(unittest.TestCase):
 
     @classmethod
@@ -140,12 +151,59 @@ class TestBlockParser(unittest.TestCase):
         blocks, curpos = bp.get_complete_blocks(0)
         self.assertEqual(blocks[0].name, 'stamp')
         self.assertEqual(blocks[0].data, '123')
+        self.assertEqual(blocks[1].name, 'child1')
+        self.assertEqual(blocks[2].name, 'stamp')
+        self.assertEqual(blocks[2].data, '321')
+        self.assertEqual(blocks[3].name, 'child2')
+        self.assertEqual(curpos, os.path.getsize(self.xml_path))
         blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 'child1')
-        blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 'stamp')
-        self.assertEqual(blocks[0].data, '321')
-        self.assertEqual(blocks[1].name, 'child2')
+        self.assertEqual(blocks, None)
+        bp.close_document()
+
+    def test_get_complete_blocks_small_reads(self):
+        bp = BlockParser(file_open(self.xml_path), data_tag='stamp')
+        bp.read_size = 10
+        blocks = get_all_blocks(bp)
+        self.assertEqual([b.name for b in blocks],
+                ['stamp', 'child1', 'stamp', 'child2', 'parent'])
+        self.assertEqual(blocks[2].data, '321')
+        bp.close_document()
+
+    def test_text_split_across_reads(self):
+        text = 'word '*50 + '&amp; more words'
+        document = io.BytesIO('<text><s id="1">{}</s><s id="2">x</s>'
+                '</text>'.format(text).encode('utf-8'))
+        bp = BlockParser(document, data_tag='s')
+        bp.read_size = 7
+        blocks = get_all_blocks(bp)
+        self.assertEqual([b.data for b in blocks],
+                ['word '*50 + '& more words', 'x', ''])
+        bp.close_document()
+
+    def test_nested_data_tags(self):
+        document = io.BytesIO(b'<s id="1">outer <s id="2">inner</s> '
+                b'text <b>bold</b> end</s>')
+        bp = BlockParser(document, data_tag='s')
+        bp.read_size = 5
+        blocks = get_all_blocks(bp)
+        self.assertEqual([(b.name, b.data) for b in blocks],
+                [('s', 'inner'), ('b', ''), ('s', 'outer  text  end')])
+        self.assertIs(blocks[0].parent, blocks[2])
+        bp.close_document()
+
+    def test_unbuffered_text(self):
+        document = io.BytesIO(b'<s><w>a &amp; b\nc</w><w>&lt;d&gt;</w></s>')
+        bp = BlockParser(document, data_tag='w')
+        bp.p.buffer_text = False
+        parts = []
+        char_data = bp.p.CharacterDataHandler
+        def count_parts(data):
+            parts.append(data)
+            char_data(data)
+        bp.p.CharacterDataHandler = count_parts
+        blocks = get_all_blocks(bp)
+        self.assertEqual([b.data for b in blocks], ['a & b\nc', '<d>', ''])
+        self.assertGreater(len(parts), 2)
         bp.close_document()
 
     def test_parse_document(self):
@@ -164,66 +222,88 @@ class TestBlockParser(unittest.TestCase):
 
     def test_parsing_books(self):
         bp = BlockParser(file_open(self.books_path), data_tag='w')
-        curpos = 0
-        for i in range(22):
-            blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 'w')
-        self.assertEqual(blocks[0].data, 'Project')
-        self.assertEqual(blocks[0].attributes['tree'], 'NP')
-        self.assertEqual(blocks[0].parent.name, 'chunk')
-        self.assertEqual(blocks[0].parent.parent.name, 's')
-        self.assertEqual(blocks[0].parent.parent.attributes['id'], 's1')
+        blocks = get_all_blocks(bp)
+        self.assertEqual(blocks[22].name, 'w')
+        self.assertEqual(blocks[22].data, 'Project')
+        self.assertEqual(blocks[22].attributes['tree'], 'NP')
+        self.assertEqual(blocks[22].parent.name, 'chunk')
+        self.assertEqual(blocks[22].parent.parent.name, 's')
+        self.assertEqual(blocks[22].parent.parent.attributes['id'], 's1')
         bp.close_document()
 
     def test_parsing_books_raw(self):
         bp = BlockParser(file_open(self.books_raw_path), data_tag='s')
-        curpos = 0
-        for i in range(5):
-            blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 's')
-        self.assertEqual(blocks[0].attributes['id'], 's3')
-        self.assertEqual(blocks[0].data, 'Victor Hugo')
+        blocks = get_all_blocks(bp)
+        self.assertEqual(blocks[4].name, 's')
+        self.assertEqual(blocks[4].attributes['id'], 's3')
+        self.assertEqual(blocks[4].data, 'Victor Hugo')
         bp.close_document()
 
     def test_parsing_os(self):
         bp = BlockParser(file_open(self.os_path), data_tag='w')
-        blocks, curpos = bp.get_complete_blocks(0)
+        blocks = get_all_blocks(bp)
         self.assertEqual(blocks[0].name, 'time')
         self.assertEqual(blocks[0].parent.name, 's')
-        blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 'w')
-        self.assertEqual(blocks[0].parent.name, 's')
-        for i in range(8):
-            blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 'w')
-        self.assertEqual(blocks[0].parent.attributes['id'], '2')
+        self.assertEqual(blocks[1].name, 'w')
+        self.assertEqual(blocks[1].parent.name, 's')
+        self.assertEqual(blocks[9].name, 'w')
+        self.assertEqual(blocks[9].parent.attributes['id'], '2')
         bp.close_document()
 
     def test_parsing_os_raw(self):
         bp = BlockParser(file_open(self.os_raw_path), data_tag='s')
-        blocks, curpos = bp.get_complete_blocks(0)
+        blocks = get_all_blocks(bp)
         self.assertEqual(blocks[0].name, 'time')
         self.assertEqual(blocks[0].parent.name, 's')
-        blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].name, 's')
-        self.assertEqual(blocks[0].data.strip(), '- How\'d you score that?')
-        self.assertEqual(blocks[0].parent.name, 'document')
+        self.assertEqual(blocks[1].name, 's')
+        self.assertEqual(blocks[1].data.strip(), '- How\'d you score that?')
+        self.assertEqual(blocks[1].parent.name, 'document')
         bp.close_document()
 
     def test_tag_in_parents(self):
         bp = BlockParser(file_open(self.books_path))
-        curpos = 0
-        for i in range(22):
+        blocks = get_all_blocks(bp)
+        self.assertTrue(bp.tag_in_parents('chunk', blocks[22]))
+        self.assertTrue(bp.tag_in_parents('s', blocks[22]))
+        bp.close_document()
+
+    def test_document_size(self):
+        bp = BlockParser(file_open(self.xml_path))
+        self.assertEqual(bp.doc_size, os.path.getsize(self.xml_path))
+        bp.close_document()
+
+        gz_path = os.path.join(self.tempdir, 'test.xml.gz')
+        with open(self.xml_path, 'rb') as xml_file:
+            with gzip.open(gz_path, 'wb') as gz_file:
+                gz_file.write(xml_file.read())
+        bp = BlockParser(file_open(gz_path))
+        self.assertEqual(bp.doc_size, os.path.getsize(gz_path))
+        self.assertEqual(bp.document.tell(), 0)
+        blocks, curpos = bp.get_complete_blocks(0)
+        while blocks:
             blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertTrue(bp.tag_in_parents('chunk', blocks[0]))
-        self.assertTrue(bp.tag_in_parents('s', blocks[0]))
+        self.assertEqual(bp.compressed_file.tell(), bp.doc_size)
         bp.close_document()
 
+        zip_path = os.path.join(self.tempdir, 'test.zip')
+        with zipfile.ZipFile(zip_path, 'w',
+                compression=zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(self.xml_path, 'test.xml')
+        with zipfile.ZipFile(zip_path) as zip_file:
+            # The size of a zip member is only known from its ZipInfo
+            bp = BlockParser(zip_file.open('test.xml'))
+            self.assertEqual(bp.doc_size, 0)
+            bp.close_document()
+            info = zip_file.getinfo('test.xml')
+            bp = BlockParser(zip_file.open(info), doc_size=info.file_size)
+            self.assertEqual(bp.doc_size, os.path.getsize(self.xml_path))
+            self.assertEqual(bp.compressed_file, None)
+            bp.close_document()
+
     def test_get_raw_tag(self):
         bp = BlockParser(file_open(self.os_path), data_tag='w')
         blocks, curpos = bp.get_complete_blocks(0)
         self.assertEqual(blocks[0].get_raw_tag(),
                 '<time id="T1S" value="00:00:05,897" />')
-        blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(blocks[0].get_raw_tag(), '<w id="1.1">-</w>')
+        self.assertEqual(blocks[1].get_raw_tag(), '<w id="1.1">-</w>')
         bp.close_document()
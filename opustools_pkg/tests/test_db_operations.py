@@ -1,7 +1,11 @@
+import os
+import shutil
 import sqlite3
+import tempfile
 import unittest
 
 from opustools import DbOperations
+from opustools.readopusdata import create_table
 
 #DB_FILE = 'tests/testdata.db'
 #db_operations.DB_FILE = DB_FILE
@@ -143,3 +147,56 @@ class TestDbOperations(unittest.TestCase):
         self.assertEqual(len(ret), 15)
         for i in ret:
             self.assertTrue(i['id'] in [140742, 140743, 140744, 140745, 140747, 140748, 140749, 140751, 140752, 140754, 140755, 140756, 140753, 140750, 140746])
+
+class TestDbConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tempdir, 'opusdata.db')
+        rows = [('en', 'fi', "O'Corpus", 'xml', 'v1', 'True')]
+        for language in ['fi', 'sv', 'en']:
+            for preprocessing in ['xml', 'raw']:
+                rows.append((language, '', "O'Corpus", preprocessing, 'v1',
+                    'True'))
+        rows.append(('en', 'sv', "O'Corpus", 'xml', 'v1', 'True'))
+        conn = sqlite3.connect(self.db_file)
+        create_table(conn.cursor())
+        conn.executemany('INSERT INTO opusfile (source, target, corpus, '
+            'preprocessing, version, latest) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.commit()
+        conn.close()
+        self.dbo = DbOperations(db_file=self.db_file)
+
+    def tearDown(self):
+        self.dbo.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_connection_is_reused(self):
+        self.dbo.run_corpora_query({'source': 'en'})
+        self.dbo.get_corpora({'source': 'en', 'preprocessing': 'raw'})
+        self.assertEqual(len(self.dbo.connections), 1)
+
+    def test_connection_is_read_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.dbo.run_query("DELETE FROM opusfile")
+
+    def test_quotes_in_values(self):
+        self.assertEqual(self.dbo.run_corpora_query({'source': 'en'}),
+                ["O'Corpus"])
+        ret = self.dbo.run_default_query({'corpus': "O'Corpus",
+            'source': 'fi', 'target': 'en', 'preprocessing': 'xml'})
+        self.assertEqual([(i['source'], i['target']) for i in ret],
+                [('en', 'fi')])
+
+    def test_sentence_files_in_language_order(self):
+        ret = self.dbo.get_corpora({'source': 'en', 'preprocessing': 'raw',
+            'version': 'latest'})
+        self.assertEqual([(i['source'], i['target'], i['preprocessing'])
+            for i in ret], [('en', 'fi', 'xml'), ('en', 'sv', 'xml'),
+                ('en', '', 'raw'), ('fi', '', 'raw'), ('sv', '', 'raw')])
+
+    def test_monolingual_files_source_first(self):
+        ret = self.dbo.run_default_query({'source': 'sv', 'target': 'en',
+            'latest': 'True'})
+        self.assertEqual([(i['source'], i['target']) for i in ret],
+                [('en', 'sv'), ('en', ''), ('en', ''), ('sv', ''), ('sv', '')])
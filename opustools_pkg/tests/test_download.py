@@ -0,0 +1,199 @@
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from opustools.download import Download, Downloader, DownloadError
+from opustools.opus_get import OpusGet
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    """Serve files from memory over keep-alive connections, with or
+    without range support"""
+
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    ranges = True
+    requests = []
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_GET(self):
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/a.zip')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get('Range')
+        type(self).requests.append((self.path, requested))
+        if requested and self.ranges:
+            start = int(requested[len('bytes='):].rstrip('-'))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range',
+                        'bytes */{}'.format(len(data)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = data[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(data)-1, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestDownload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        FileHandler.files = {'/{}.zip'.format(name): os.urandom(size)
+                for name, size in [('a', 300000), ('b', 5000), ('c', 70000)]}
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                FileHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever,
+                daemon=True).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        FileHandler.ranges = True
+        FileHandler.requests = []
+        FileHandler.connections = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def download(self, name, path=None, size=None):
+        return Download(self.url+path if path else self.url+'/'+name,
+                os.path.join(self.tempdir, name), size)
+
+    def read(self, name):
+        with open(os.path.join(self.tempdir, name), 'rb') as f:
+            return f.read()
+
+    def test_parallel_downloads(self):
+        downloads = [self.download(path[1:], size=len(data)//1024)
+                for path, data in FileHandler.files.items()]
+        with mock.patch('sys.stderr', new=io.StringIO()) as progress:
+            Downloader(connections=3).run(downloads)
+        for path, data in FileHandler.files.items():
+            self.assertEqual(self.read(path[1:]), data)
+        self.assertEqual(sorted(os.listdir(self.tempdir)),
+                ['a.zip', 'b.zip', 'c.zip'])
+        self.assertIn('3/3 files downloaded', progress.getvalue())
+        self.assertIn('MB/s', progress.getvalue())
+
+    def test_connection_reuse(self):
+        downloads = [self.download(name) for name in
+                ['a.zip', 'b.zip', 'c.zip']]
+        Downloader(connections=1, progress=False).run(downloads)
+        self.assertEqual(FileHandler.connections, 1)
+        self.assertEqual(len(FileHandler.requests), 3)
+
+    def test_resume(self):
+        data = FileHandler.files['/a.zip']
+        with open(os.path.join(self.tempdir, 'a.zip.part'), 'wb') as f:
+            f.write(data[:100000])
+        Downloader(progress=False).run([self.download('a.zip')])
+        self.assertEqual(self.read('a.zip'), data)
+        self.assertEqual(FileHandler.requests,
+                [('/a.zip', 'bytes=100000-')])
+        self.assertFalse(os.path.isfile(
+            os.path.join(self.tempdir, 'a.zip.part')))
+
+    def test_resume_complete_part(self):
+        data = FileHandler.files['/b.zip']
+        with open(os.path.join(self.tempdir, 'b.zip.part'), 'wb') as f:
+            f.write(data)
+        Downloader(progress=False).run([self.download('b.zip')])
+        self.assertEqual(self.read('b.zip'), data)
+
+    def test_resume_without_range_support(self):
+        FileHandler.ranges = False
+        data = FileHandler.files['/c.zip']
+        with open(os.path.join(self.tempdir, 'c.zip.part'), 'wb') as f:
+            f.write(b'x'*1000)
+        Downloader(progress=False).run([self.download('c.zip')])
+        self.assertEqual(self.read('c.zip'), data)
+
+    def test_redirect(self):
+        Downloader(progress=False).run([self.download('a.zip', '/moved')])
+        self.assertEqual(self.read('a.zip'), FileHandler.files['/a.zip'])
+
+    def test_outdated_api_size(self):
+        # The server length matches, so the file is kept with a warning
+        downloads = [self.download('a.zip', size=1000),
+                self.download('b.zip', size=4)]
+        with mock.patch('sys.stderr', new=io.StringIO()) as progress:
+            Downloader(connections=1).run(downloads)
+        self.assertEqual(self.read('a.zip'), FileHandler.files['/a.zip'])
+        self.assertEqual(self.read('b.zip'), FileHandler.files['/b.zip'])
+        self.assertEqual(progress.getvalue().count('Warning'), 1)
+        self.assertIn('the OPUS API gives 1000 KB', progress.getvalue())
+        self.assertIn('2/2 files downloaded', progress.getvalue())
+
+    def test_incomplete_download(self):
+        # The server closes the connection before the announced length
+        with mock.patch.object(Downloader, 'block_size', 1000), \
+                mock.patch('http.client.HTTPResponse.read',
+                    side_effect=[b'x'*1000, b'']):
+            with self.assertRaises(DownloadError) as error:
+                Downloader(progress=False).run([self.download('b.zip')])
+        self.assertIn('incomplete: 1000 of 5000 bytes',
+                error.exception.message)
+        self.assertEqual(os.listdir(self.tempdir), ['b.zip.part'])
+
+    def test_missing_file(self):
+        with self.assertRaises(DownloadError) as error:
+            Downloader(progress=False).run([self.download('missing.zip')])
+        self.assertIn('HTTP 404', error.exception.message)
+
+    def test_opus_get_download(self):
+        opg = OpusGet(directory='RF', source='en', target='sv',
+                download_dir=self.tempdir, suppress_prompts=True,
+                connections=2)
+        corpora = [{'url': self.url+'/a.zip', 'size': 293, 'version': 'v1'},
+                {'url': self.url+'/b.zip', 'size': 5, 'version': 'v1'}]
+        with mock.patch('sys.stderr', new=io.StringIO()), \
+                mock.patch('sys.stdout', new=io.StringIO()) as output:
+            opg.download(corpora, '298 KB')
+        self.assertEqual(output.getvalue(), '')
+        for c in corpora:
+            with open(opg.make_file_name(c), 'rb') as f:
+                self.assertEqual(f.read(),
+                        FileHandler.files[c['url'][len(self.url):]])
+
+    def test_opus_get_unreachable_server(self):
+        opg = OpusGet(directory='RF', source='en', target='sv',
+                download_dir=self.tempdir, suppress_prompts=True)
+        with mock.patch('sys.stdout', new=io.StringIO()) as output:
+            opg.download([{'url': 'http://127.0.0.1:1/a.zip', 'size': 1,
+                'version': 'v1'}], '1 KB')
+        self.assertEqual(output.getvalue(), 'Unable to retrieve the data.\n')
+
+if __name__ == '__main__':
+    unittest.main()
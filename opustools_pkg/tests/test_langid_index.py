@@ -0,0 +1,152 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from opustools import OpusRead
+from opustools.parse.langid_index import LanguageIdIndex, LanguageIdReader
+from opustools.parse.sentence_parser import SentenceParser
+
+
+def write_zip(path, language, sentences):
+    xml = ('<?xml version="1.0" encoding="utf-8"?>\n<text>\n' +
+        ''.join('<s id="s{}">{}</s>\n'.format(i+1, sentence)
+            for i, sentence in enumerate(sentences)) + '</text>\n')
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('Corp/raw/{}/doc.xml'.format(language), xml)
+    return xml
+
+def write_index(path, rows):
+    index = LanguageIdIndex.create(path)
+    index.add_member('Corp/raw/{}/doc.xml'.format(path[-6:-4]), rows)
+    index.finish(path).close()
+
+class TestLanguageIdIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.en_zip = os.path.join(self.tempdir, 'en.zip')
+        self.fi_zip = os.path.join(self.tempdir, 'fi.zip')
+        self.en_xml = write_zip(self.en_zip, 'en',
+                ['Good morning', 'Guten Tag', 'Yes.'])
+        write_zip(self.fi_zip, 'fi', ['Hyvää huomenta', 'Hyvää päivää',
+            'Kyllä.'])
+        write_index(self.en_zip, [('s1', 'en', '0.99', 'en', '0.9'),
+            ('s2', 'de', '0.98', 'de', '1.0'),
+            ('s3', 'un', '0.0', 'en', '0.17')])
+        write_index(self.fi_zip, [('s1', 'fi', '0.99', 'fi', '1.0'),
+            ('s2', 'fi', '0.99', 'fi', '1.0'),
+            ('s3', 'un', '0.0', 'fi', '0.6')])
+
+        self.alignment = os.path.join(self.tempdir, 'en-fi.xml')
+        with open(self.alignment, 'w') as f:
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                '<!DOCTYPE cesAlign PUBLIC "-//CES//DTD XML cesAlign//EN" "">\n'
+                '<cesAlign version="1.0">\n'
+                '<linkGrp targType="s" fromDoc="en/doc.xml.gz" '
+                'toDoc="fi/doc.xml.gz" >\n'
+                '<link xtargets="s1;s1" id="SL1" />\n'
+                '<link xtargets="s2;s2" id="SL2" />\n'
+                '<link xtargets="s3;s3" id="SL3" />\n'
+                '</linkGrp>\n</cesAlign>\n')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tempdir)
+
+    def read(self, **kwargs):
+        with mock.patch('sys.stdout', new=io.StringIO()) as output:
+            OpusRead(directory='Corp', source='en', target='fi',
+                    preprocess='raw', alignment_file=self.alignment,
+                    source_zip=self.en_zip, target_zip=self.fi_zip,
+                    download_dir=self.tempdir, **kwargs).printPairs()
+        return output.getvalue()
+
+    def test_load(self):
+        index = LanguageIdIndex.load(self.en_zip)
+        language_ids = index.get_language_ids('Corp/raw/en/doc.xml')
+        self.assertEqual(language_ids['s2'], {'cld2': 'de',
+            'cld2conf': '0.98', 'langid': 'de', 'langidconf': '1.0'})
+        self.assertEqual(sorted(language_ids), ['s1', 's2', 's3'])
+        self.assertEqual(index.get_language_ids('Corp/raw/en/other.xml'),
+                None)
+        index.close()
+
+    def test_changed_zip_is_not_loaded(self):
+        path = os.path.join(self.tempdir, 'sv.zip')
+        write_zip(path, 'sv', ['Ja.'])
+        write_index(path, [('s1', 'sv', '0.9', 'sv', '0.9')])
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns+1))
+        self.assertEqual(LanguageIdIndex.load(path), None)
+
+    def test_resume(self):
+        path = os.path.join(self.tempdir, 'da.zip')
+        write_zip(path, 'da', ['Ja.'])
+        index = LanguageIdIndex.resume(path, 'raw')
+        index.add_member('Corp/raw/da/doc.xml',
+                [('s1', 'da', '0.9', 'da', '0.9')], 1234)
+        index.commit()
+        index.close()
+        index = LanguageIdIndex.resume(path, 'raw')
+        self.assertEqual(index.get_members(), {'Corp/raw/da/doc.xml': 1234})
+        index.finish(path).close()
+        index = LanguageIdIndex.resume(path, 'raw')
+        self.assertEqual(index.get_members(), {'Corp/raw/da/doc.xml': 1234})
+        index.close()
+        for preprocess, restart in [('xml', False), ('raw', True)]:
+            index = LanguageIdIndex.resume(path, preprocess, restart)
+            self.assertEqual(index.get_members(), {})
+            index.discard()
+        self.assertIsNotNone(LanguageIdIndex.load(path))
+
+    def test_language_id_reader(self):
+        reader = LanguageIdReader({'s1': {'langid': 'en'}})
+        self.assertEqual(reader.read_sentence(['s1', 's2']),
+                (['', ''], [{'langid': 'en'}, {}]))
+        self.assertEqual(reader.read_sentence(['']), ('', []))
+
+    def test_sentence_parser_language_ids(self):
+        sp = SentenceParser(io.StringIO(self.en_xml), preprocessing='raw',
+                language_ids={'s1': {'langid': 'en'}})
+        sp.store_sentences({'s1', 's2'}, -1)
+        self.assertEqual(sp.read_sentence(['s1', 's2']),
+                (['Good morning', 'Guten Tag'],
+                    [{'id': 's1', 'langid': 'en'}, {'id': 's2'}]))
+
+    def test_language_ids_keep_other_attributes(self):
+        xml = ('<?xml version="1.0" encoding="utf-8"?>\n<text>\n'
+            '<s id="s1" cld2="de" cld2conf="0.5" type="title">Good morning'
+            '</s>\n</text>\n')
+        sp = SentenceParser(io.StringIO(xml), preprocessing='raw',
+                language_ids={'s1': {'cld2': 'en', 'cld2conf': '0.99'}})
+        sp.store_sentences({'s1'}, -1)
+        self.assertEqual(sp.read_sentence(['s1'])[1],
+                [{'id': 's1', 'cld2': 'en', 'cld2conf': '0.99',
+                    'type': 'title'}])
+
+    def test_filter_with_index(self):
+        self.assertEqual(self.read(write_mode='moses', src_cld2=['en', '0.9']),
+                'Good morning\tHyvää huomenta\n')
+        self.assertEqual(self.read(write_mode='moses',
+            src_langid=['en', '0.1'], trg_langid=['fi', '0.9']),
+            'Good morning\tHyvää huomenta\n')
+        self.assertEqual(self.read(write_mode='moses', workers=2,
+            src_langid=['en', '0.1']),
+            'Good morning\tHyvää huomenta\nYes.\tKyllä.\n')
+
+    def test_filter_links_with_index(self):
+        with mock.patch('opustools.opus_read.OpusFileHandler.'
+                'open_sentence_file') as open_sentence_file:
+            links = self.read(write_mode='links', src_langid=['de', '0.5'])
+            open_sentence_file.assert_not_called()
+        self.assertIn('<link xtargets="s2;s2" id="SL2" />', links)
+        self.assertNotIn('SL1', links)
+        self.assertNotIn('SL3', links)
+
+if __name__ == '__main__':
+    unittest.main()
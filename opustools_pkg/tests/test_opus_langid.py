@@ -3,8 +3,11 @@ import unittest
 import zipfile
 import shutil
 import tempfile
+from unittest import mock
 
-from opustools.opus_langid import OpusLangid
+from opustools.opus_langid import (OpusLangid, BatchLanguageIdentifier,
+        LanguageIdCache, identifier)
+from opustools.parse.langid_index import LanguageIdIndex
 
 class TestOpusLangid(unittest.TestCase):
 
@@ -182,5 +185,194 @@ class TestOpusLangid(unittest.TestCase):
                 b'<s id="3" cld2="fi" cld2conf="0.96" langid="fi" '
                     b'langidconf="0.99">Haavasta valuu aivokudosta.\n')
 
+    def test_workers(self):
+        for source, preprocess in [('xml_fi.zip', 'xml'), ('raw_fi.zip', 'raw'),
+                ('raw_fi.xml', 'raw')]:
+            results = []
+            for workers in [1, 2]:
+                target = os.path.join(self.tempdir,
+                        'workers{}_{}'.format(workers, source))
+                langids = OpusLangid(
+                        file_path=os.path.join(self.tempdir, source),
+                        target_file_path=target, preprocess=preprocess,
+                        workers=workers)
+                langids.processFiles()
+                self.assertEqual(langids.sentence_count,
+                        3 if preprocess == 'xml' else 11)
+                if source.endswith('.zip'):
+                    with zipfile.ZipFile(target, 'r') as zip_arc:
+                        results.append([zip_arc.read(name)
+                            for name in zip_arc.namelist()])
+                else:
+                    with open(target) as result:
+                        results.append(result.read())
+            self.assertEqual(results[0], results[1])
+
+    def test_batch_language_identifier(self):
+        sentences = ['Source: Project Gutenberg', 'BASKERVILLEN KOIRA',
+                '', 'Herra Sherlock Holmes.', 'Быстрая лиса', '1884.',
+                'Voi itku.', 'a'*1000]
+        batch_identifier = BatchLanguageIdentifier(identifier)
+        batch_identifier.window = 3
+        self.assertEqual(batch_identifier.classify(sentences),
+                [identifier.classify(sentence) for sentence in sentences])
+        results = batch_identifier.classify(['Voi itku.', None])
+        self.assertEqual(results[0], identifier.classify('Voi itku.'))
+        self.assertIsInstance(results[1], Exception)
+
+    def test_cache(self):
+        source = os.path.join(self.tempdir, 'repeated_fi.zip')
+        with zipfile.ZipFile(source, 'w') as zip_arc:
+            for name in ['a.xml', 'b.xml']:
+                zip_arc.writestr(name, '<?xml version="1.0" '
+                    'encoding="utf-8"?>\n<text>\n' + ''.join(
+                    '<s id="s{}">{}</s>\n'.format(i, sentence)
+                    for i, sentence in enumerate(['Kyllä.', 'Voi itku.',
+                        'Kyllä.', 'Yes.']*2)) + '</text>\n')
+        cache_file = os.path.join(self.tempdir, 'cache.json')
+        results = []
+        for cache_size, workers in [(0, 1), (64, 1), (64, 1), (64, 2)]:
+            target = os.path.join(self.tempdir, 'cached_fi.zip')
+            langids = OpusLangid(file_path=source, target_file_path=target,
+                    preprocess='raw', cache_size=cache_size,
+                    cache_file=cache_file, workers=workers)
+            langids.processFiles()
+            with zipfile.ZipFile(target, 'r') as zip_arc:
+                results.append([zip_arc.read(name)
+                    for name in zip_arc.namelist()])
+            if cache_size:
+                self.assertEqual(len(langids.cache.entries), 3)
+            if len(results) == 2:
+                self.assertEqual((langids.cache.hits, langids.cache.misses),
+                        (13, 3))
+            elif len(results) == 3:
+                self.assertEqual((langids.cache.hits, langids.cache.misses),
+                        (16, 0))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[0], results[3])
+
+    def test_cache_size(self):
+        ids = ('fi', '0.99', 'fi', '1.0')
+        cache = LanguageIdCache(0)
+        cache.max_size = 2*cache.entry_size('aaa', ids)
+        cache.put('aaa', ids)
+        cache.put('bbb', ids)
+        self.assertEqual(cache.get('aaa'), ids)
+        cache.put('ccc', ids)
+        self.assertEqual(list(cache.entries), ['aaa', 'ccc'])
+        self.assertIsNone(cache.get('bbb'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.put('d'*1000, ids)
+        self.assertEqual(list(cache.entries), ['aaa', 'ccc'])
+
+    def test_sidecar(self):
+        source = os.path.join(self.tempdir, 'sidecar_fi.zip')
+        target = os.path.join(self.tempdir, 'sidecar_target_fi.zip')
+        shutil.copy(os.path.join(self.tempdir, 'raw_fi.zip'), source)
+        with open(source, 'rb') as f:
+            data = f.read()
+        with zipfile.ZipFile(source, 'r') as zip_arc:
+            member = zip_arc.namelist()[0]
+        for workers in [1, 2]:
+            OpusLangid(file_path=source, preprocess='raw', sidecar=True,
+                    workers=workers).processFiles()
+            with open(source, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            index = LanguageIdIndex.load(source)
+            language_ids = index.get_language_ids(member)
+            index.close()
+            self.assertEqual(len(language_ids), 11)
+            self.assertEqual(language_ids['s5.0'], {'cld2': 'fi',
+                'cld2conf': '0.99', 'langid': 'fi', 'langidconf': '1.0'})
+
+        OpusLangid(file_path=source, target_file_path=target,
+                preprocess='raw').processFiles()
+        with zipfile.ZipFile(target, 'r') as zip_arc:
+            self.assertIn('<s id="s5.0" cld2="fi" cld2conf="0.99" '
+                'langid="fi" langidconf="1.0">',
+                zip_arc.read(member).decode('utf-8'))
+
+    def write_documents(self, path, names):
+        with zipfile.ZipFile(path, 'w') as zip_arc:
+            for name in names:
+                zip_arc.writestr(name, '<?xml version="1.0" '
+                    'encoding="utf-8"?>\n<text>\n<s id="s1">Voi itku.</s>\n'
+                    '<s id="s2" cld2="en" cld2conf="0.5" langid="en" '
+                    'langidconf="0.5">Kyllä.</s>\n</text>\n')
+
+    def test_resume(self):
+        source = os.path.join(self.tempdir, 'resume_fi.zip')
+        target = os.path.join(self.tempdir, 'resume_target_fi.zip')
+        self.write_documents(source, ['a.xml', 'b.xml'])
+        OpusLangid(file_path=source, target_file_path=target,
+                preprocess='raw').processFiles()
+        with zipfile.ZipFile(target, 'r') as zip_arc:
+            expected = [zip_arc.read(name) for name in zip_arc.namelist()]
+        self.assertFalse(os.path.exists(source + '.langid.tmp'))
+
+        for workers in [1, 2]:
+            with mock.patch('opustools.opus_langid.LanguageIdAdder.'
+                    'write_to_out', side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    OpusLangid(file_path=source, target_file_path=target,
+                            preprocess='raw').processFiles()
+            index = LanguageIdIndex.resume(source, 'raw')
+            self.assertEqual(list(index.get_members()), [])
+            index.add_member('a.xml', [('s1', 'un', '0.0', 'xx', '0.1')],
+                    zipfile.ZipFile(source).getinfo('a.xml').CRC)
+            index.commit()
+            index.close()
+            OpusLangid(file_path=source, target_file_path=target,
+                    preprocess='raw', workers=workers).processFiles()
+            with zipfile.ZipFile(target, 'r') as zip_arc:
+                a, b = [zip_arc.read(name) for name in zip_arc.namelist()]
+            self.assertIn(b'<s id="s1" cld2="un" cld2conf="0.0" '
+                    b'langid="xx" langidconf="0.1">', a)
+            self.assertEqual(b, expected[1])
+            self.assertFalse(os.path.exists(source + '.langid.tmp'))
+
+    def test_sidecar_only_new_files(self):
+        source = os.path.join(self.tempdir, 'incremental_fi.zip')
+        self.write_documents(source, ['a.xml'])
+        OpusLangid(file_path=source, preprocess='raw',
+                sidecar=True).processFiles()
+        self.write_documents(source, ['a.xml', 'b.xml'])
+        with mock.patch('opustools.opus_langid.OpusLangid.'
+                'process_member', autospec=True,
+                side_effect=OpusLangid.process_member) as process_member:
+            OpusLangid(file_path=source, preprocess='raw',
+                    sidecar=True).processFiles()
+        self.assertEqual(process_member.call_count, 2)
+        index = LanguageIdIndex.load(source)
+        self.assertEqual(sorted(index.get_members()), ['a.xml', 'b.xml'])
+        self.assertEqual(index.get_rows('a.xml'), index.get_rows('b.xml'))
+        index.close()
+
+        with mock.patch('opustools.opus_langid.detect_languages') as detect:
+            OpusLangid(file_path=source, preprocess='raw',
+                    sidecar=True).processFiles()
+            detect.assert_not_called()
+
+    def test_keep_existing_ids(self):
+        source = os.path.join(self.tempdir, 'existing_fi.zip')
+        target = os.path.join(self.tempdir, 'existing_target_fi.zip')
+        self.write_documents(source, ['a.xml'])
+        OpusLangid(file_path=source, target_file_path=target,
+                preprocess='raw').processFiles()
+        with zipfile.ZipFile(target, 'r') as zip_arc:
+            first = zip_arc.read('a.xml')
+        self.assertIn(b'<s id="s2" cld2="en" cld2conf="0.5" langid="en" '
+                b'langidconf="0.5">', first)
+        OpusLangid(file_path=target, preprocess='raw').processFiles()
+        with zipfile.ZipFile(target, 'r') as zip_arc:
+            self.assertEqual(zip_arc.read('a.xml'), first)
+
+        OpusLangid(file_path=source, target_file_path=target,
+                preprocess='raw', redetect=True).processFiles()
+        with zipfile.ZipFile(target, 'r') as zip_arc:
+            self.assertIn(b'langid="fi" langidconf="1.0">Kyll',
+                    zip_arc.read('a.xml'))
+
 if __name__ == '__main__':
     unittest.main()
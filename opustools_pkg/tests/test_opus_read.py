@@ -2250,5 +2250,91 @@ class TestOpusRead(unittest.TestCase):
         with open(os.path.join(self.tempdir1, 'doc_level.en-fr.txt')) as doc_out:
             self.assertEqual(doc_out.readlines(), result)
 
+    def test_workers(self):
+        kwargs = dict(directory='RF', source='en', target='sv',
+                write_mode='moses', root_directory=self.root_directory)
+        serial = pairPrinterToVariable(**kwargs)
+        parallel = pairPrinterToVariable(workers=2, chunk_size=10, **kwargs)
+        self.assertEqual(parallel, serial)
+
+    def test_workers_maximum_and_id_file(self):
+        id_file = os.path.join(self.tempdir1, 'test_files', 'test.id')
+        kwargs = dict(directory='RF', source='sv', target='en',
+                maximum=15, attribute='certainty', write_ids=id_file,
+                root_directory=self.root_directory)
+        serial = pairPrinterToVariable(**kwargs)
+        with open(id_file) as f:
+            serial_ids = f.read()
+        parallel = pairPrinterToVariable(workers=2, chunk_size=4, **kwargs)
+        with open(id_file) as f:
+            parallel_ids = f.read()
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel_ids, serial_ids)
+        self.assertEqual(len(parallel_ids.splitlines()), 15)
+
+    def test_workers_doc_level(self):
+        kwargs = dict(directory='TEST', source='en', target='fr',
+                suppress_prompts=True, root_directory=self.root_directory,
+                write_mode='moses', doc_level=True)
+        self.assertEqual(pairPrinterToVariable(workers=2, **kwargs),
+                pairPrinterToVariable(**kwargs))
+
+    def test_iter_pairs(self):
+        kwargs = dict(directory='RF', source='en', target='sv',
+                maximum=8, root_directory=self.root_directory)
+        moses = pairPrinterToVariable(write_mode='moses', **kwargs)
+        pairs = list(OpusRead(**kwargs).iter_pairs())
+        self.assertEqual(len(pairs), 8)
+        self.assertEqual(
+            ''.join(pair.src+'\t'+pair.trg+'\n' for pair in pairs), moses)
+        self.assertEqual(pairs[0].src_ids, ['s1.1'])
+        self.assertEqual(pairs[0].trg_ids, ['s1.1'])
+        self.assertEqual(pairs[0].link_attrs['xtargets'], 's1.1;s1.1')
+        self.assertEqual(pairs[0].src_doc, 'en/1988.xml.gz')
+        self.assertEqual(pairs[0].trg_doc, 'sv/1988.xml.gz')
+
+    def test_iter_pairs_switch_langs_and_workers(self):
+        kwargs = dict(directory='RF', source='sv', target='en',
+                root_directory=self.root_directory)
+        pairs = list(OpusRead(**kwargs).iter_pairs())
+        self.assertEqual(list(OpusRead(workers=2, chunk_size=10,
+            **kwargs).iter_pairs()), pairs)
+        self.assertEqual(pairs[0].src_doc, 'sv/1988.xml.gz')
+        self.assertEqual(pairs[0].trg_doc, 'en/1988.xml.gz')
+        self.assertEqual(
+            ''.join(pair.src+'\t'+pair.trg+'\n' for pair in pairs),
+            pairPrinterToVariable(write_mode='moses', **kwargs))
+
+    def test_pipeline(self):
+        kwargs = dict(directory='RF', source='en', target='sv',
+                write_mode='moses', root_directory=self.root_directory)
+        serial = pairPrinterToVariable(**kwargs)
+        self.assertEqual(pairPrinterToVariable(pipeline=True, chunk_size=10,
+            **kwargs), serial)
+        self.assertEqual(pairPrinterToVariable(pipeline=True, workers=2,
+            chunk_size=10, **kwargs), serial)
+
+    def test_pipeline_maximum_and_id_file(self):
+        id_file = os.path.join(self.tempdir1, 'test_files', 'test.id')
+        kwargs = dict(directory='RF', source='sv', target='en',
+                maximum=15, attribute='certainty', write_ids=id_file,
+                root_directory=self.root_directory)
+        serial = pairPrinterToVariable(**kwargs)
+        with open(id_file) as f:
+            serial_ids = f.read()
+        pipelined = pairPrinterToVariable(pipeline=True, chunk_size=4,
+                **kwargs)
+        with open(id_file) as f:
+            pipelined_ids = f.read()
+        self.assertEqual(pipelined, serial)
+        self.assertEqual(pipelined_ids, serial_ids)
+        self.assertEqual(len(pipelined_ids.splitlines()), 15)
+
+    def test_pipeline_iter_pairs(self):
+        kwargs = dict(directory='RF', source='sv', target='en',
+                root_directory=self.root_directory)
+        self.assertEqual(list(OpusRead(pipeline=True, chunk_size=10,
+            **kwargs).iter_pairs()), list(OpusRead(**kwargs).iter_pairs()))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,219 @@
+import gzip
+import http.server
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from opustools import readopusdata
+from opustools.readopusdata import update_db, create_table
+
+
+def corpus_files(corpus, versions, latest, languages):
+    """Return the info.yaml and statistics.yaml files of a corpus in a fake
+    OPUS repository"""
+    url = f'https://object.pouta.csc.fi/OPUS-{corpus}'
+    files = {f'/{corpus}/info.yaml':
+            f'name: {corpus}\nlatest_release: {latest}\n'}
+    for version in versions:
+        lines = ['bitexts:']
+        for i, source in enumerate(languages):
+            for target in languages[i+1:]:
+                pair = f'{source}-{target}'
+                lines += [f'  {pair}:', '    alignments: 10', '    files: 2',
+                    '    source language tokens: 50',
+                    '    target language tokens: 60', '    downloads:',
+                    '      xml:', '        size: 2048',
+                    f'        url: {url}/{version}/xml/{pair}.xml.gz',
+                    f'      {source} language:', '        size: 4096',
+                    f'        url: {url}/{version}/xml/{source}.zip']
+        lines.append('monolingual:')
+        for language in languages:
+            lines += [f'  {language}:', '    files: 2', '    sentences: 12',
+                '    tokens: 70', '    downloads:']
+            for preprocessing in ['raw', 'xml']:
+                lines += [f'      {preprocessing}:', '        size: 3072',
+                    f'        url: {url}/{version}/{preprocessing}/'
+                    f'{language}.zip']
+        lines.append('moses:')
+        pair = '-'.join(languages[:2])
+        lines += [f'  {pair}:', '    alignments: 10',
+            '    download size: 1024',
+            f'    download url: {url}/{version}/moses/{pair}.txt.zip',
+            '    source language tokens: 50', '    target language tokens: 60']
+        files[f'/{corpus}/{version}/statistics.yaml'] = '\n'.join(lines)+'\n'
+        files[f'/{corpus}/{version}/info.yaml'] = ''
+    return files
+
+class OpusHandler(http.server.BaseHTTPRequestHandler):
+    """Serve a fake OPUS repository from memory, with ETags if etags is
+    True"""
+
+    files = {}
+    etags = True
+
+    def do_GET(self):
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        data = data if isinstance(data, bytes) else data.encode('utf-8')
+        etag = '"{}"'.format(hash(data))
+        if self.etags and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.etags:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class TestUpdateDb(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                OpusHandler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever,
+                daemon=True).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        # update_db sets up the root logger to write
+        # opusdb_update_error.log in the current directory
+        basic_config = mock.patch('logging.basicConfig')
+        basic_config.start()
+        self.addCleanup(basic_config.stop)
+        self.db_file = os.path.join(self.tempdir, 'opusdata.db')
+        OpusHandler.etags = True
+        OpusHandler.files = {}
+        self.add_corpus('RF', ['v1'], 'v1', ['en', 'fi', 'sv'])
+        self.add_corpus('Books', ['v1', 'v2'], 'v2', ['de', 'en'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def add_corpus(self, corpus, versions, latest, languages):
+        OpusHandler.files.update(corpus_files(corpus, versions, latest,
+            languages))
+        OpusHandler.files['/index-info.txt'] = '\n'.join(
+            path[1:] for path in OpusHandler.files
+            if path.endswith('info.yaml'))+'\n'
+
+    def update(self):
+        with mock.patch('sys.stdout', new=io.StringIO()):
+            update_db(self.db_file, url_base=self.url, workers=4)
+
+    def rows(self, columns='corpus, version, preprocessing, source, '
+            'target, latest'):
+        conn = sqlite3.connect(self.db_file)
+        rows = conn.execute(f'SELECT {columns} FROM opusfile').fetchall()
+        conn.close()
+        return sorted(rows)
+
+    def test_update(self):
+        self.update()
+        rows = self.rows()
+        # RF: 3 pairs, 3 languages with 2 files, 1 moses file;
+        # Books: 1 pair, 2 languages with 2 files, 1 moses file per version
+        self.assertEqual(len(rows), 10+2*6)
+        self.assertIn(('RF', 'v1', 'xml', 'en', 'fi', 'True'), rows)
+        self.assertIn(('RF', 'v1', 'raw', 'sv', '', 'True'), rows)
+        self.assertIn(('Books', 'v1', 'moses', 'de', 'en', 'False'), rows)
+        self.assertIn(('Books', 'v2', 'moses', 'de', 'en', 'True'), rows)
+        self.assertIn((2, 10, 50, 60), self.rows('size, alignment_pairs, '
+            'source_tokens, target_tokens'))
+        self.assertEqual(set(self.rows('updated')), {(0,)})
+
+    def test_unchanged_files_are_not_parsed(self):
+        self.update()
+        before = self.rows('*')
+        with mock.patch('opustools.readopusdata.load_yaml',
+                wraps=readopusdata.load_yaml) as load_yaml:
+            self.update()
+        # Only the info.yaml files of the corpora are parsed
+        self.assertEqual(load_yaml.call_count, 2)
+        self.assertEqual(self.rows('*'), before)
+
+    def test_unchanged_content_without_etags(self):
+        OpusHandler.etags = False
+        self.update()
+        before = self.rows('*')
+        with mock.patch('opustools.readopusdata.load_yaml',
+                wraps=readopusdata.load_yaml) as load_yaml:
+            self.update()
+        self.assertEqual(load_yaml.call_count, 2)
+        self.assertEqual(self.rows('*'), before)
+
+    def test_changes_and_removals(self):
+        self.update()
+        OpusHandler.files.update(corpus_files('RF', ['v1'], 'v1',
+            ['en', 'fi']))
+        # A new release changes the latest rows of unchanged files
+        self.add_corpus('Books', ['v1', 'v2', 'v3'], 'v3', ['de', 'en'])
+        self.update()
+        rows = self.rows()
+        self.assertEqual(len(rows), 6+3*6)
+        self.assertNotIn(('RF', 'v1', 'raw', 'sv', '', 'True'), rows)
+        self.assertIn(('Books', 'v2', 'moses', 'de', 'en', 'False'), rows)
+        self.assertIn(('Books', 'v3', 'moses', 'de', 'en', 'True'), rows)
+
+    def test_missing_statistics_file(self):
+        self.update()
+        del OpusHandler.files['/Books/v1/statistics.yaml']
+        self.update()
+        self.assertNotIn(('Books', 'v1'), self.rows('corpus, version'))
+        self.assertIn(('Books', 'v2'), self.rows('corpus, version'))
+
+    def test_gzipped_statistics_file(self):
+        path = '/Books/v1/statistics.yaml'
+        OpusHandler.files[path+'.gz'] = gzip.compress(
+            OpusHandler.files.pop(path).encode('utf-8'))
+        self.update()
+        self.assertIn(('Books', 'v1'), self.rows('corpus, version'))
+
+    def test_failed_update_keeps_rows(self):
+        self.update()
+        before = self.rows('*')
+        OpusHandler.files['/RF/v1/statistics.yaml'] = OpusHandler.files[
+            '/RF/v1/statistics.yaml'].replace('files: 2', 'files: 3')
+        with mock.patch('opustools.readopusdata.remove_missing_items',
+                side_effect=sqlite3.OperationalError('disk I/O error')):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.update()
+        self.assertEqual(self.rows('*'), before)
+
+    def test_unique_url_index_migration(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('CREATE TABLE opusfile (id integer PRIMARY KEY, '
+            'source text, target text, corpus text, preprocessing text, '
+            'version text, url text, size integer, documents integer, '
+            'alignment_pairs integer, source_tokens integer, '
+            'target_tokens integer, latest text, updated integer)')
+        conn.execute('CREATE INDEX idx_url ON opusfile(url)')
+        conn.executemany('INSERT INTO opusfile (corpus, url) VALUES (?, ?)',
+            [('A', 'a.zip'), ('B', 'a.zip'), ('C', 'c.zip')])
+        create_table(conn.cursor())
+        self.assertEqual(conn.execute('SELECT corpus FROM opusfile '
+            'ORDER BY id').fetchall(), [('A',), ('C',)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO opusfile (url) VALUES ('c.zip')")
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
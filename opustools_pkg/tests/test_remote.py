@@ -0,0 +1,216 @@
+import gzip
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+from opustools import OpusRead, OpusCat
+from opustools.remote import (RemoteFile, RemoteFileError, open_remote_file,
+        open_remote_zip, is_url)
+from opustools.util import open_zip_member
+
+from .test_util import write_zstd_zip, zstandard
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serve files from memory, with or without range support"""
+
+    files = {}
+    ranges = True
+    requests = []
+
+    def do_GET(self):
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get('Range')
+        type(self).requests.append((self.path, requested))
+        if requested and self.ranges:
+            start, end = requested[len('bytes='):].split('-')
+            start, end = int(start), min(int(end), len(data)-1)
+            body = data[start:end+1]
+            self.send_response(206)
+            self.send_header('Content-Range',
+                    'bytes {}-{}/{}'.format(start, end, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"{}"'.format(hash(data)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def write_zip(language, sentences):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for d in range(3):
+            zf.writestr('Corp/raw/{}/doc{}.xml'.format(language, d),
+                '<?xml version="1.0" encoding="utf-8"?>\n<text>\n' +
+                ''.join('<s id="s{}">{} {}</s>\n'.format(i+1, sentence, d)
+                    for i, sentence in enumerate(sentences)) + '</text>\n')
+    return output.getvalue()
+
+class TestRemote(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.data = bytes(range(256))*100
+        alignment = ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<!DOCTYPE cesAlign PUBLIC "-//CES//DTD XML cesAlign//EN" "">\n'
+            '<cesAlign version="1.0">\n' +
+            ''.join('<linkGrp targType="s" fromDoc="en/doc{0}.xml.gz" '
+                'toDoc="fi/doc{0}.xml.gz" >\n'
+                '<link xtargets="s1;s1" id="SL1" />\n'
+                '<link xtargets="s2;s2" id="SL2" />\n'
+                '</linkGrp>\n'.format(d) for d in range(3)) +
+            '</cesAlign>\n')
+        RangeHandler.files = {'/data.bin': self.data,
+            '/en-fi.xml.gz': gzip.compress(alignment.encode('utf-8')),
+            '/en.zip': write_zip('en', ['Yes', 'No']),
+            '/fi.zip': write_zip('fi', ['Kyllä', 'Ei'])}
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                RangeHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def setUp(self):
+        RangeHandler.ranges = True
+        RangeHandler.requests = []
+        self.cache_dir = tempfile.mkdtemp(dir=self.tempdir)
+
+    def test_is_url(self):
+        self.assertTrue(is_url('https://object.pouta.csc.fi/OPUS-RF/en.zip'))
+        self.assertFalse(is_url('RF_latest_xml_en.zip'))
+        self.assertFalse(is_url(None))
+
+    def test_read_and_seek(self):
+        with mock.patch.object(RemoteFile, 'block_size', 1000):
+            remote = RemoteFile(self.url+'/data.bin')
+            self.assertEqual(remote.size, len(self.data))
+            self.assertEqual(remote.read(10), self.data[:10])
+            remote.seek(-1500, os.SEEK_END)
+            self.assertEqual(remote.read(), self.data[-1500:])
+            remote.seek(2500)
+            self.assertEqual(remote.read(3000), self.data[2500:5500])
+            self.assertEqual(remote.tell(), 5500)
+            remote.seek(len(self.data))
+            self.assertEqual(remote.read(10), b'')
+            # The probe and one request for each run of missing blocks
+            self.assertEqual(remote.requests, 4)
+
+    def test_block_cache(self):
+        with mock.patch.object(RemoteFile, 'block_size', 1000):
+            remote = RemoteFile(self.url+'/data.bin', self.cache_dir)
+            self.assertEqual(remote.read(2500), self.data[:2500])
+            remote = RemoteFile(self.url+'/data.bin', self.cache_dir)
+            remote.seek(500)
+            self.assertEqual(remote.read(3000), self.data[500:3500])
+            self.assertEqual(remote.requests, 2)
+            self.assertEqual(RangeHandler.requests[-1],
+                    ('/data.bin', 'bytes=3000-3999'))
+
+    def test_changed_file_empties_cache(self):
+        with mock.patch.object(RemoteFile, 'block_size', 1000):
+            remote = RemoteFile(self.url+'/data.bin', self.cache_dir)
+            remote.read(1000)
+            RangeHandler.files['/data.bin'] = self.data[::-1]
+            try:
+                remote = RemoteFile(self.url+'/data.bin', self.cache_dir)
+                self.assertEqual(remote.read(1000), self.data[::-1][:1000])
+            finally:
+                RangeHandler.files['/data.bin'] = self.data
+
+    def test_no_range_support(self):
+        RangeHandler.ranges = False
+        with self.assertRaises(RemoteFileError) as error:
+            RemoteFile(self.url+'/data.bin')
+        self.assertIn('does not support range requests',
+                error.exception.message)
+
+    def test_remote_zip(self):
+        zip_arc = open_remote_zip(self.url+'/en.zip', self.cache_dir)
+        self.assertEqual(len(zip_arc.namelist()), 3)
+        with zip_arc.open('Corp/raw/en/doc1.xml') as f:
+            self.assertIn(b'<s id="s2">No 1</s>', f.read())
+        zip_arc.close()
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_remote_zstd_zip_member(self):
+        path = os.path.join(self.tempdir, 'zstd.zip')
+        write_zstd_zip(path, 'Corp/raw/en/doc.xml', b'<s id="s1">Yes</s>\n')
+        with open(path, 'rb') as f:
+            RangeHandler.files['/zstd.zip'] = f.read()
+        zip_arc = open_remote_zip(self.url+'/zstd.zip', self.cache_dir)
+        with open_zip_member(zip_arc, 'Corp/raw/en/doc.xml') as f:
+            self.assertEqual(f.read(), b'<s id="s1">Yes</s>\n')
+        zip_arc.close()
+
+    def test_remote_alignment_file(self):
+        with open_remote_file(self.url+'/en-fi.xml.gz') as f:
+            self.assertIn('fromDoc="en/doc2.xml.gz"', f.read())
+
+    def test_opus_read_from_urls(self):
+        for workers in [1, 2]:
+            with mock.patch('sys.stdout', new=io.StringIO()) as output:
+                OpusRead(directory='Corp', source='en', target='fi',
+                    preprocess='raw', write_mode='moses',
+                    alignment_file=self.url+'/en-fi.xml.gz',
+                    source_zip=self.url+'/en.zip',
+                    target_zip=self.url+'/fi.zip',
+                    download_dir=self.tempdir, cache_dir=self.cache_dir,
+                    workers=workers).printPairs()
+            self.assertEqual(output.getvalue(), ''.join(
+                'Yes {0}\tKyllä {0}\nNo {0}\tEi {0}\n'.format(d)
+                for d in range(3)))
+
+    def test_opus_read_remote(self):
+        files = {os.path.join(self.tempdir, 'Corp_latest_'+name):
+                self.url+'/'+name for name in
+                ['xml_en-fi.xml.gz', 'raw_en.zip', 'raw_fi.zip']}
+        with mock.patch('opustools.opus_get.OpusGet.get_remote_files',
+                return_value=files), \
+                mock.patch('sys.stdout', new=io.StringIO()) as output:
+            RangeHandler.files['/xml_en-fi.xml.gz'] = \
+                RangeHandler.files['/en-fi.xml.gz']
+            RangeHandler.files['/raw_en.zip'] = RangeHandler.files['/en.zip']
+            RangeHandler.files['/raw_fi.zip'] = RangeHandler.files['/fi.zip']
+            OpusRead(directory='Corp', source='en', target='fi',
+                preprocess='raw', write_mode='moses', maximum=1,
+                download_dir=self.tempdir, remote=True,
+                cache_dir=self.cache_dir).printPairs()
+        self.assertEqual(output.getvalue(), 'Yes 0\tKyllä 0\n')
+        self.assertFalse(os.path.isfile(os.path.join(self.tempdir,
+            'Corp_latest_raw_en.zip')))
+
+    def test_opus_cat_remote(self):
+        files = {os.path.join(self.tempdir, 'Corp_latest_raw_en.zip'):
+                self.url+'/en.zip'}
+        with mock.patch('opustools.opus_get.OpusGet.get_remote_files',
+                return_value=files), \
+                mock.patch('sys.stdout', new=io.StringIO()) as output:
+            OpusCat(directory='Corp', language='en', preprocess='raw',
+                file_name='Corp/raw/en/doc2.xml', plain=True,
+                download_dir=self.tempdir, remote=True,
+                cache_dir=self.cache_dir).printSentences()
+        self.assertIn('("s1")>Yes 2', output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
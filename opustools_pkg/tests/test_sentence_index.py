@@ -0,0 +1,136 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from opustools.parse.sentence_index import SentenceIndex, scan_sentences
+from opustools.parse.sentence_parser import IndexedSentenceParser
+
+
+class TestSentenceIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+
+        self.os_xml = ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<document id="4296906">\n'
+            '  <s id="1">\n'
+            '    <time id="T1S" value="00:00:05,897" />\n'
+            '    <w id="1.1">-</w>\n'
+            '    <w id="1.2">How</w>\n'
+            '    <w id="1.3">\'d</w>\n'
+            '    <w id="1.4">you</w>\n'
+            '    <w id="1.5">score</w>\n'
+            '    <w id="1.6">that</w>\n'
+            '    <w id="1.7">?</w>\n'
+            '  </s>\n'
+            '  <s id="2">\n'
+            '    <w id="2.1">-</w>\n'
+            '    <w id="2.2">Mike</w>\n'
+            '    <w id="2.3">the</w>\n'
+            '    <w id="2.4">groundskeeper</w>\n'
+            '    <w id="2.5">.</w>\n'
+            '    <time id="T1E" value="00:00:08,654" />\n'
+            '  </s>\n'
+            '  <s id="3"/>\n'
+            '  <s id="4">\n'
+            '    <w id="4.1">Hää</w>\n'
+            '  </s>\n'
+            '</document>\n')
+
+        self.zip_path = os.path.join(self.tempdir, 'en.zip')
+        with zipfile.ZipFile(self.zip_path, 'w',
+                compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('OpenSubtitles/xml/en/1.xml', self.os_xml)
+            zf.writestr('OpenSubtitles/xml/en/README', 'not indexed')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_scan_sentences(self):
+        data = self.os_xml.encode('utf-8')
+        spans = scan_sentences(io.BytesIO(data), read_size=10)
+        self.assertEqual([s[0] for s in spans], ['1', '2', '3', '4'])
+        fragments = [data[offset:offset+length]
+                for sid, offset, length in spans]
+        self.assertTrue(fragments[0].startswith(b'<s id="1">'))
+        self.assertTrue(fragments[0].endswith(b'</s>'))
+        self.assertEqual(fragments[2], b'<s id="3"/>')
+        self.assertEqual(fragments[3],
+                '<s id="4">\n    <w id="4.1">Hää</w>\n  </s>'.encode('utf-8'))
+
+    def test_build_and_load(self):
+        index = SentenceIndex.build(self.zip_path)
+        offsets = index.get_offsets('OpenSubtitles/xml/en/1.xml')
+        self.assertEqual(sorted(offsets.keys()), ['1', '2', '3', '4'])
+        self.assertEqual(index.get_offsets('OpenSubtitles/xml/en/README'),
+                None)
+        index.close()
+        index = SentenceIndex.load(self.zip_path)
+        self.assertEqual(index.get_offsets('OpenSubtitles/xml/en/1.xml'),
+                offsets)
+        index.close()
+
+    def test_changed_zip_is_not_loaded(self):
+        SentenceIndex.build(self.zip_path).close()
+        stat = os.stat(self.zip_path)
+        os.utime(self.zip_path, ns=(stat.st_atime_ns, stat.st_mtime_ns+1))
+        self.assertEqual(SentenceIndex.load(self.zip_path), None)
+        self.assertEqual(SentenceIndex.load(
+            os.path.join(self.tempdir, 'missing.zip')), None)
+
+    def test_indexed_sentence_parser(self):
+        index = SentenceIndex.build(self.zip_path)
+        offsets = index.get_offsets('OpenSubtitles/xml/en/1.xml')
+        index.close()
+        with zipfile.ZipFile(self.zip_path) as zf:
+            doc = zf.open('OpenSubtitles/xml/en/1.xml')
+            sp = IndexedSentenceParser(doc, offsets, preprocessing='xml')
+            sp.store_next_sentences({'2', '4', '5'})
+            self.assertEqual(sp.get_sentence('2')[0],
+                    '- Mike the groundskeeper .')
+            self.assertEqual(sp.get_sentence('4')[0], 'Hää')
+            self.assertEqual(sp.get_sentence('1'), ('', {}))
+            sp.store_next_sentences({'1', '4'})
+            self.assertEqual(sorted(sp.sentences.keys()), ['1', '4'])
+            self.assertEqual(sp.get_sentence('1')[0],
+                    "- How 'd you score that ?")
+            sp.close_document()
+            self.assertTrue(doc.closed)
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            doc = zf.open('OpenSubtitles/xml/en/1.xml')
+            sp = IndexedSentenceParser(doc, offsets, preprocessing='xml',
+                    preserve=True)
+            sp.store_next_sentences({'1'})
+            self.assertEqual(sp.get_sentence('1')[0],
+                    '<time id="T1S" value="00:00:05,897" /> - How \'d you '
+                    'score that ?')
+            sp.close_document()
+
+    def test_indexed_sentences_read_in_offset_order(self):
+        index = SentenceIndex.build(self.zip_path)
+        offsets = index.get_offsets('OpenSubtitles/xml/en/1.xml')
+        index.close()
+        seeks = []
+
+        class Document(io.BytesIO):
+            def seek(self, offset, whence=0):
+                seeks.append(offset)
+                return super().seek(offset, whence)
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            doc = Document(zf.read('OpenSubtitles/xml/en/1.xml'))
+        doc.name = 'OpenSubtitles/xml/en/1.xml'
+        sp = IndexedSentenceParser(doc, offsets, preprocessing='xml')
+        sp.store_next_sentences(['4', '1', '3', '2'])
+        self.assertEqual(seeks, sorted(seeks))
+        self.assertEqual(len(seeks), 4)
+        sp.close_document()
+
+if __name__ == '__main__':
+    unittest.main()
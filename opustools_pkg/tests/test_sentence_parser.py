@@ -128,18 +128,14 @@ class TestSentenceParser(unittest.TestCase):
     def test_get_annotations(self):
         bp = BlockParser(file_open(self.books_path))
         sp = SentenceParser(file_open(self.books_path))
-        curpos = 0
-        for i in range(19):
-            blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(sp.get_annotations(blocks[0]), '|NN|w1.1|source|NN|NN')
+        blocks, curpos = bp.get_complete_blocks(0)
+        self.assertEqual(sp.get_annotations(blocks[19]), '|NN|w1.1|source|NN|NN')
         bp.close_document()
         sp.document.close()
         bp = BlockParser(file_open(self.books_path))
         sp = SentenceParser(file_open(self.books_path), anno_attrs=['pos'])
-        curpos = 0
-        for i in range(19):
-            blocks, curpos = bp.get_complete_blocks(curpos)
-        self.assertEqual(sp.get_annotations(blocks[0]), '|NN')
+        blocks, curpos = bp.get_complete_blocks(0)
+        self.assertEqual(sp.get_annotations(blocks[19]), '|NN')
         bp.close_document()
         sp.document.close()
 
@@ -169,3 +165,39 @@ class TestSentenceParser(unittest.TestCase):
                 ['Source: Project GutenbergTranslation: Isabel F. HapgoodAudiobook '
                     'available here', 'Hunchback of Notre-Dame'])
 
+    def test_store_next_sentences(self):
+        sp = SentenceParser(file_open(self.books_raw_path),
+                preprocessing='raw')
+        sp.store_next_sentences({'s1'})
+        self.assertEqual(sp.sentences['s1'][0],
+                'Source: Project GutenbergTranslation: Isabel F. '
+                'HapgoodAudiobook available here')
+        self.assertEqual(sp.passed_ids, {'s1'})
+        sp.store_next_sentences({'s2', 's3'})
+        self.assertEqual(sorted(sp.sentences.keys()), ['s2', 's3'])
+        self.assertEqual(sp.get_sentence('s3')[0], 'Victor Hugo')
+        self.assertEqual(sp.passed_ids, {'s1', 's2', 's3'})
+        sp.close_document()
+
+    def test_store_next_sentences_rewind(self):
+        sp = SentenceParser(file_open(self.os_path), preprocessing='xml')
+        sp.store_next_sentences({'2'})
+        self.assertEqual(sp.get_sentence('2')[0],
+                '- Mike the groundskeeper .')
+        sp.store_next_sentences({'1', '2'})
+        self.assertEqual(sp.get_sentence('1')[0], "- How 'd you score that ?")
+        self.assertEqual(sp.get_sentence('2')[0],
+                '- Mike the groundskeeper .')
+        sp.close_document()
+
+    def test_document_size(self):
+        sp = SentenceParser(file_open(self.os_path), preprocessing='xml',
+                doc_size=1000)
+        self.assertEqual(sp.store_next_sentences({'2'}), 1000)
+        sp.store_next_sentences({'1'})
+        self.assertEqual(sp.bp.doc_size, 1000)
+        sp.close_document()
+        sp = SentenceParser(file_open(self.os_path), preprocessing='xml')
+        self.assertEqual(sp.store_next_sentences({'1'}),
+                os.path.getsize(self.os_path))
+        sp.close_document()
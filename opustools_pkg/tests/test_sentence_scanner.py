@@ -0,0 +1,104 @@
+import io
+import unittest
+
+from opustools.parse.sentence_parser import SentenceParser
+from opustools.parse.sentence_scanner import SentenceScanner
+
+XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<text><head><meta id="1"><w id="w0.1">Head</w></meta></head><body>
+ <s id="s1" overlap="0.5">
+  <chunk type="NP" id="c1-1">
+   <w id="w1.1">Source</w>
+  </chunk>
+  <w id="w1.2"> &amp; </w>
+  <w id="w1.3">caf&#233;</w>
+  <w id="w1.4"/>
+ </s>
+ <s id="s2" note="a&lt;b&#10;c	d"/>
+ <s id='s3'>
+  <time id="T1S" value="00:00:01,000"/>
+  <w id="w3.1">- Mike</w>
+  <w id="w3.2">&quot;x&quot;</w>
+ </s>
+</body></text>
+"""
+
+RAW = b"""<?xml version="1.0" encoding="utf-8"?>
+<text>
+ <s id="s1"> Source &amp; caf\xc3\xa9 </s>
+ <s id="s2"/>
+ <s id="s3"><time id="T1S" value="00:00:01,000"/>- Mike <time id="T1E" value="00:00:02,000"/>here </s>
+</text>
+"""
+
+def read_sentences(parser_class, data, id_sets, preprocessing='xml'):
+    parser = parser_class(io.BytesIO(data), preprocessing=preprocessing)
+    sentences = []
+    for id_set in id_sets:
+        parser.store_next_sentences(id_set)
+        sentences.append(dict(parser.sentences))
+    return parser, sentences
+
+class TestSentenceScanner(unittest.TestCase):
+
+    def assert_same_sentences(self, data, id_sets, preprocessing='xml'):
+        scanner, scanned = read_sentences(SentenceScanner, data, id_sets,
+                preprocessing)
+        parser, parsed = read_sentences(SentenceParser, data, id_sets,
+                preprocessing)
+        self.assertEqual(scanned, parsed)
+        return scanner, scanned
+
+    def test_xml(self):
+        scanner, sentences = self.assert_same_sentences(XML,
+                [{'s1', 's2', 's3'}])
+        self.assertTrue(scanner.scanning)
+        self.assertEqual(sentences[0]['s1'],
+                ('Source & café ', {'id': 's1', 'overlap': '0.5'}))
+        self.assertEqual(sentences[0]['s2'],
+                ('', {'id': 's2', 'note': 'a<b\nc d'}))
+        self.assertEqual(sentences[0]['s3'][0], '- Mike "x"')
+
+    def test_raw(self):
+        scanner, sentences = self.assert_same_sentences(RAW,
+                [{'s1', 's2', 's3'}], 'raw')
+        self.assertTrue(scanner.scanning)
+        self.assertEqual(sentences[0]['s1'][0], 'Source & café')
+        self.assertEqual(sentences[0]['s2'][0], '')
+        self.assertEqual(sentences[0]['s3'][0], '- Mike here')
+
+    def test_store_next_sentences(self):
+        scanner, sentences = self.assert_same_sentences(XML,
+                [{'s1'}, {'s3'}, {'s2', 's3'}, {'s9'}])
+        self.assertEqual(list(sentences[1]), ['s3'])
+        self.assertEqual(sorted(sentences[2]), ['s2', 's3'])
+        self.assertEqual(sentences[3], {})
+        self.assertTrue(scanner.exhausted)
+
+    def test_small_reads(self):
+        scanner = SentenceScanner(io.BytesIO(XML), preprocessing='xml')
+        scanner.read_size = 5
+        scanner.store_next_sentences({'s1', 's2', 's3'})
+        self.assertTrue(scanner.scanning)
+        parser, sentences = read_sentences(SentenceParser, XML,
+                [{'s1', 's2', 's3'}])
+        self.assertEqual(scanner.sentences, sentences[0])
+
+    def test_fall_back_to_sentence_parser(self):
+        documents = [
+            XML.replace(b'<body>', b'<body><!-- comment -->'),
+            XML.replace(b'>Source<', b'>Sou<b>r</b>ce<'),
+            XML.replace(b'utf-8', b'iso-8859-1').replace(
+                b'caf&#233;', b'caf\xe9'),
+            XML.replace(b'\n', b'\r\n')
+            ]
+        for document in documents:
+            scanner, sentences = self.assert_same_sentences(document,
+                    [{'s1', 's3'}, {'s2'}])
+            self.assertFalse(scanner.scanning)
+        scanner, sentences = self.assert_same_sentences(XML, [{'s1', 's3'}],
+                'raw')
+        self.assertFalse(scanner.scanning)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from opustools.util import (file_open, BlockCompressedWriter, MappedFile,
+        open_zip_member, compressed_file, file_size, ZIP_ZSTANDARD)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LINES = ''.join('Rivi {} äöå\n'.format(i) for i in range(20000))
+
+def write_zstd_zip(path, name, data):
+    """Write a zip file with one member compressed with zstd"""
+    compressed = zstandard.ZstdCompressor().compress(data)
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(name, compressed)
+        offset = zf.getinfo(name).header_offset
+    with open(path, 'r+b') as f:
+        raw = bytearray(f.read())
+        # Method, CRC-32 and uncompressed size of the local header and the
+        # central directory entry
+        struct.pack_into('<H', raw, offset+8, ZIP_ZSTANDARD)
+        struct.pack_into('<I', raw, offset+14, zlib.crc32(data))
+        struct.pack_into('<I', raw, offset+22, len(data))
+        central = raw.index(b'PK\x01\x02')
+        struct.pack_into('<H', raw, central+10, ZIP_ZSTANDARD)
+        struct.pack_into('<I', raw, central+16, zlib.crc32(data))
+        struct.pack_into('<I', raw, central+24, len(data))
+        f.seek(0)
+        f.write(raw)
+
+class TestUtil(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, **kwargs):
+        path = os.path.join(self.tempdir, name)
+        with file_open(path, 'w', **kwargs) as f:
+            for line in LINES.splitlines(True):
+                f.write(line)
+        return path
+
+    def test_gzip_blocks(self):
+        for threads in [1, 3]:
+            path = self.write('blocks.gz', block_size=1000, threads=threads)
+            with gzip.open(path, 'rt', encoding='utf8') as f:
+                self.assertEqual(f.read(), LINES)
+            with open(path, 'rb') as f:
+                # Every block is a gzip member of its own
+                self.assertGreater(f.read().count(b'\x1f\x8b\x08'), 10)
+
+    def test_gzip_single_stream(self):
+        path = self.write('single.gz', compresslevel=1)
+        with gzip.open(path, 'rt', encoding='utf8') as f:
+            self.assertEqual(f.read(), LINES)
+
+    def test_xz(self):
+        for block_size in [None, 1000]:
+            path = self.write('blocks.xz', block_size=block_size, threads=2,
+                    compresslevel=1)
+            with lzma.open(path, 'rt', encoding='utf8') as f:
+                self.assertEqual(f.read(), LINES)
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        path = self.write('blocks.zst', block_size=1000, threads=2)
+        with open(path, 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f,
+                    read_across_frames=True)
+            self.assertEqual(reader.read().decode('utf8'), LINES)
+
+    def test_binary_writer(self):
+        path = os.path.join(self.tempdir, 'binary.gz')
+        writer = file_open(path, 'wb', block_size=10)
+        self.assertIsInstance(writer, BlockCompressedWriter)
+        writer.write(b'abc')
+        writer.flush()
+        writer.write(b'def'*10)
+        writer.close()
+        writer.close()
+        self.assertRaises(ValueError, writer.write, b'x')
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'abc'+b'def'*10)
+
+    def test_read_compressed(self):
+        names = ['read.xz', 'read.gz', 'read.bz2']
+        if zstandard is not None:
+            names.append('read.zst')
+        for name in names:
+            path = self.write(name, block_size=1000)
+            with file_open(path) as f:
+                self.assertEqual(f.read(), LINES)
+            with file_open(path, 'rb') as f:
+                self.assertEqual(f.name, path)
+                f.seek(100)
+                line = f.readline()
+                f.seek(100)
+                self.assertEqual(f.readline(), line)
+                if name.endswith(('.xz', '.zst')):
+                    self.assertIsNotNone(compressed_file(f))
+
+    def test_memory_map(self):
+        path = self.write('mapped.txt')
+        with file_open(path, memory_map=True) as f:
+            self.assertIsInstance(f.buffer, MappedFile)
+            self.assertEqual(f.read(), LINES)
+        with file_open(path, 'rb', memory_map=True) as f:
+            view = f.read_view(5)
+            self.assertIsInstance(view, memoryview)
+            self.assertEqual(view, b'Rivi ')
+            self.assertEqual(f.readline(), '0 äöå\n'.encode())
+            self.assertEqual(f.tell(), len('Rivi 0 äöå\n'.encode()))
+            f.seek(-5, os.SEEK_END)
+            self.assertEqual(f.read(), 'äöå\n'.encode()[-5:])
+            self.assertEqual(f.read(), b'')
+        empty = os.path.join(self.tempdir, 'empty.txt')
+        open(empty, 'w').close()
+        with file_open(empty, memory_map=True) as f:
+            self.assertEqual(f.read(), '')
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_zip_member(self):
+        path = os.path.join(self.tempdir, 'zstd.zip')
+        write_zstd_zip(path, 'Corp/xml/fi/doc.xml', LINES.encode())
+        with zipfile.ZipFile(path) as zf:
+            with open_zip_member(zf, 'Corp/xml/fi/doc.xml') as f:
+                self.assertEqual(f.read(), LINES.encode())
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_zip_member_is_streamed(self):
+        path = os.path.join(self.tempdir, 'zstd_stream.zip')
+        text = os.urandom(1000000).hex().encode()
+        write_zstd_zip(path, 'Corp/xml/fi/doc.xml', text)
+        with open(path, 'rb') as f:
+            data = f.read()
+        reads = []
+
+        class File(io.BytesIO):
+            def read(self, size=-1):
+                result = super().read(size)
+                reads.append(len(result))
+                return result
+
+        # A zip file read from a file object has no file name
+        with zipfile.ZipFile(File(data)) as zf:
+            info = zf.getinfo('Corp/xml/fi/doc.xml')
+            with open_zip_member(zf, info.filename) as f:
+                self.assertEqual(file_size(f), info.compress_size)
+                start = f.read(1000)
+                self.assertLess(sum(reads), info.compress_size)
+                self.assertEqual(start+f.read(), text)
+        self.assertLess(max(reads), info.compress_size)
+
+if __name__ == '__main__':
+    unittest.main()
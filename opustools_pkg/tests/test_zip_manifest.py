@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+from opustools.parse.zip_manifest import (ZipManifest, ManifestZipFile,
+        open_zip)
+
+
+class TestZipManifest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.members = [('Corp/xml/en/doc{}.xml'.format(i),
+            '<text><s id="s1">Sentence {} äö</s></text>\n'.format(i)
+            .encode('utf-8')) for i in range(5)]
+        self.zip_name = os.path.join(self.tempdir, 'en.zip')
+        with zipfile.ZipFile(self.zip_name, 'w') as zf:
+            for i, (name, data) in enumerate(self.members):
+                zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED
+                        if i % 2 else zipfile.ZIP_STORED)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tempdir)
+
+    def setUp(self):
+        manifest = ZipManifest.index_name(self.zip_name)
+        if os.path.isfile(manifest):
+            os.remove(manifest)
+
+    def test_open_zip_writes_manifest(self):
+        zip_arc = open_zip(self.zip_name)
+        self.assertNotIsInstance(zip_arc, ManifestZipFile)
+        zip_arc.close()
+        self.assertTrue(os.path.isfile(self.zip_name+'.manifest'))
+        zip_arc = open_zip(self.zip_name)
+        self.assertIsInstance(zip_arc, ManifestZipFile)
+        with mock.patch('zipfile.ZipFile._RealGetContents') as contents:
+            ManifestZipFile(self.zip_name,
+                    ZipManifest.load(self.zip_name)).close()
+            contents.assert_not_called()
+        zip_arc.close()
+
+    def test_read_members(self):
+        open_zip(self.zip_name).close()
+        with open_zip(self.zip_name) as zip_arc:
+            self.assertEqual(zip_arc.namelist(),
+                    [name for name, data in self.members])
+            for name, data in reversed(self.members):
+                with zip_arc.open(name) as member:
+                    self.assertEqual(member.read(), data)
+                self.assertEqual(zip_arc.getinfo(name).file_size,
+                        len(data))
+            with self.assertRaises(KeyError) as error:
+                zip_arc.open('Corp/xml/en/missing.xml')
+            self.assertEqual(error.exception.args[0], "There is no item "
+                    "named 'Corp/xml/en/missing.xml' in the archive")
+
+    def test_read_members_in_threads(self):
+        open_zip(self.zip_name).close()
+        zip_arc = open_zip(self.zip_name)
+        results = []
+        def read(name):
+            with zip_arc.open(name) as member:
+                results.append(member.read())
+        threads = [threading.Thread(target=read, args=(name,))
+                for name, data in self.members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        zip_arc.close()
+        self.assertEqual(sorted(results),
+                sorted(data for name, data in self.members))
+
+    def test_changed_zip(self):
+        open_zip(self.zip_name).close()
+        stat = os.stat(self.zip_name)
+        os.utime(self.zip_name, ns=(stat.st_atime_ns, stat.st_mtime_ns+1))
+        self.assertIsNone(ZipManifest.load(self.zip_name))
+        zip_arc = open_zip(self.zip_name)
+        self.assertNotIsInstance(zip_arc, ManifestZipFile)
+        zip_arc.close()
+        manifest = ZipManifest.load(self.zip_name)
+        self.assertIsNotNone(manifest)
+        manifest.close()
+
+    def test_unwritable_directory(self):
+        with mock.patch.object(ZipManifest, 'create',
+                side_effect=PermissionError):
+            with open_zip(self.zip_name) as zip_arc:
+                self.assertEqual(zip_arc.read(self.members[0][0]),
+                        self.members[0][1])
+        self.assertFalse(os.path.isfile(self.zip_name+'.manifest'))
+
+if __name__ == '__main__':
+    unittest.main()